@@ -0,0 +1,357 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import scanner
+import pipeline
+from extractors import build_extractor
+from db_writer import upsert_records
+from schema import schema_version, SCHEMA_VERSION
+from catalog_query import CatalogQuery, ensure_search_index, ensure_stats_summary, summary_stats
+from columnar import ColumnarCatalog, ColumnarQuery
+
+MB = 1024 ** 2
+EXTENSIONS = ['.mp4', '.mkv', '.avi', '.mov']
+WORDS = ['holiday', 'beach', 'family', 'concert', 'trip', 'movie', 'episode', 'clip', 'party', 'wedding']
+CODECS = ['h264', 'hevc', 'vp9', 'av1', 'mpeg4']
+RESOLUTIONS = ['1920x1080', '1280x720', '3840x2160', '640x480']
+
+# Resposta fixa do ffprobe falso, no formato que parse_ffprobe_output espera
+STUB_OUTPUT = {
+    "streams": [{"codec_type": "video", "width": 1920, "height": 1080, "r_frame_rate": "30000/1001", "codec_name": "h264"}],
+    "format": {"duration": "12.5", "bit_rate": "4000000"}
+}
+
+STUB_SCRIPT = '''import json
+import time
+time.sleep({latency!r})
+print(json.dumps({output!r}))
+'''
+
+def log(message):
+    scanner.log_to_stdout(message)
+
+def quiet(message):
+    pass
+
+def generate_corpus(root, count, min_size, max_size, dirs, depth, seed=1):
+    # Árvore de arquivos com extensão de vídeo e conteúdo aleatório; reaproveitada se os parâmetros não mudaram
+    params = {'count': count, 'min_size': min_size, 'max_size': max_size, 'dirs': dirs, 'depth': depth, 'seed': seed}
+    manifest = os.path.join(root, 'corpus.json')
+    if os.path.exists(manifest):
+        with open(manifest, encoding='utf-8') as f:
+            if json.load(f) == params:
+                return sum(os.path.getsize(path) for path in corpus_files(root))
+    rng = random.Random(seed)
+    total = 0
+    for i in range(count):
+        directory = os.path.join(root, f"d{i % dirs:04d}", *[f"n{level}" for level in range(1, depth)])
+        os.makedirs(directory, exist_ok=True)
+        size = rng.randint(min_size, max_size)
+        name = f"{rng.choice(WORDS)}_{i:06d}{EXTENSIONS[i % len(EXTENSIONS)]}"
+        with open(os.path.join(directory, name), 'wb') as f:
+            remaining = size
+            while remaining:
+                chunk = min(remaining, MB)
+                f.write(rng.randbytes(chunk))
+                remaining -= chunk
+        total += size
+    with open(manifest, 'w', encoding='utf-8') as f:
+        json.dump(params, f)
+    return total
+
+def corpus_files(root):
+    return [path for path, _ in pipeline.scan_video_files(root, scanner.is_video_file, quiet)]
+
+def write_stub_ffprobe(directory, latency=0.0):
+    # ffprobe falso: dorme latency segundos e imprime o JSON fixo, ignorando os argumentos
+    os.makedirs(directory, exist_ok=True)
+    script = os.path.join(directory, 'ffprobe_stub.py')
+    with open(script, 'w', encoding='utf-8') as f:
+        f.write(STUB_SCRIPT.format(latency=latency, output=STUB_OUTPUT))
+    if os.name == 'nt':
+        launcher = os.path.join(directory, 'ffprobe.cmd')
+        with open(launcher, 'w', encoding='utf-8') as f:
+            f.write(f'@"{sys.executable}" "{script}" %*\n')
+    else:
+        launcher = os.path.join(directory, 'ffprobe')
+        with open(launcher, 'w', encoding='utf-8') as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n')
+        os.chmod(launcher, 0o755)
+    return launcher
+
+def drop_caches():
+    # Só no Linux e como root; nos outros casos a medição "fria" usa o cache que houver
+    try:
+        os.sync()
+        with open('/proc/sys/vm/drop_caches', 'w') as f:
+            f.write('3\n')
+        return True
+    except (OSError, AttributeError):
+        return False
+
+def measure(results, name, func, items=None, size=None, repeat=1, setup=None):
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        value = func()
+        timings.append(time.perf_counter() - start)
+    seconds = min(timings)
+    result = {'name': name, 'seconds': round(seconds, 6), 'median_seconds': round(statistics.median(timings), 6),
+              'repeat': repeat, 'items': items}
+    if isinstance(value, int):
+        result['result'] = value
+    if items:
+        result['items_per_sec'] = round(items / seconds, 2) if seconds else None
+    if size:
+        result['mb_per_sec'] = round(size / MB / seconds, 2) if seconds else None
+    results.append(result)
+    rate = f", {result['items_per_sec']} itens/s" if items and seconds else ""
+    log(f"{name}: {seconds:.4f} s{rate}\n")
+    return value
+
+def bench_record(i, path):
+    # Mesmo formato de registro que o process_file entrega ao DB
+    stats = os.stat(path)
+    return {'extension': os.path.splitext(path)[1], 'file_path': path, 'size_bytes': stats.st_size,
+            'mtime_ns': stats.st_mtime_ns, 'inode': stats.st_ino, 'device': stats.st_dev, 'hash': f"{i:064x}", 'hash_algo': 'sha256',
+            'hash_layout': 'bench', 'metadata': {'duration_seconds': 12.5, 'resolution': '1920x1080', 'fps': 29.97,
+                                                 'video_codec': 'h264', 'bitrate_total_kbps': 4000}}
+
+def bench_scan(args, results):
+    corpus = os.path.join(args.workdir, 'corpus')
+    log(f"Gerando corpus em {corpus}...\n")
+    total_size = generate_corpus(corpus, args.files, args.min_size, args.max_size, args.dirs, args.depth, args.seed)
+    ffprobe = write_stub_ffprobe(os.path.join(args.workdir, 'stub'), args.probe_latency)
+    files = corpus_files(corpus)
+    sampled = files[:args.sample]
+
+    measure(results, 'scan.discovery', lambda: len(corpus_files(corpus)), items=len(files), repeat=args.repeat)
+
+    def hash_all():
+        for path in files:
+            scanner.calculate_hash(path)
+        return len(files)
+    # O hash amostrado lê no máximo duas amostras por arquivo; mb_per_sec usa o tamanho total do corpus
+    if args.drop_caches:
+        if drop_caches():
+            measure(results, 'scan.hash_cold', hash_all, items=len(files), size=total_size)
+        else:
+            log("Não foi possível limpar o cache de páginas; scan.hash_cold não medido.\n")
+    measure(results, 'scan.hash_warm', hash_all, items=len(files), size=total_size, repeat=args.repeat)
+
+    previous_ffprobe = scanner.ffprobe_path
+    scanner.ffprobe_path = ffprobe
+    try:
+        def probe_all():
+            for path in sampled:
+                scanner.get_video_metadata(path)
+            return len(sampled)
+        measure(results, 'scan.metadata', probe_all, items=len(sampled), repeat=args.repeat)
+    finally:
+        scanner.ffprobe_path = previous_ffprobe
+
+    db_path = os.path.join(args.workdir, 'save.db')
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    scanner.init_database(db_path)
+    records = [bench_record(i, path) for i, path in enumerate(sampled)]
+
+    def save_all():
+        for data in records:
+            scanner.save_to_db(data, db_path)
+        return len(records)
+    measure(results, 'scan.save_to_db', save_all, items=len(records), repeat=args.repeat)
+
+    db_path = os.path.join(args.workdir, 'scan.db')
+
+    def fresh_db():
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        scanner.init_database(db_path)
+        if args.drop_caches:
+            drop_caches()
+
+    def full_scan(prune=True):
+        extractor = build_extractor('ffprobe', ffprobe, args.probe_workers, log=quiet)
+        result = scanner.process_folder(corpus, quiet, workers=args.workers, db_path=db_path, extractor=extractor,
+                                        prune=prune)
+        return len(files) if result else 0
+    measure(results, 'scan.process_folder_cold', full_scan, items=len(files), size=total_size,
+            repeat=args.repeat, setup=fresh_db)
+    # Reescaneamento: diretórios inalterados são podados pelo snapshot; sem a poda, todo arquivo
+    # passa pelo stat, mas nenhum hash ou ffprobe deve rodar
+    measure(results, 'scan.process_folder_warm', full_scan, items=len(files), repeat=args.repeat)
+    measure(results, 'scan.process_folder_warm_full', lambda: full_scan(prune=False), items=len(files),
+            repeat=args.repeat)
+
+def generate_catalog(db_path, rows, seed=1):
+    # Banco sintético com a forma do catálogo real; reaproveitado se já tiver o número de linhas pedido
+    if os.path.exists(db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            if (schema_version(conn) == SCHEMA_VERSION
+                    and conn.execute('SELECT COUNT(*) FROM files').fetchone()[0] == rows):
+                return False
+        except sqlite3.Error:
+            pass
+        finally:
+            conn.close()
+        os.remove(db_path)
+    scanner.init_database(db_path)
+    rng = random.Random(seed)
+
+    start = datetime(2024, 1, 1).timestamp()
+
+    def record(i):
+        name = f"{rng.choice(WORDS)}_{rng.choice(WORDS)}_{i}{rng.choice(EXTENSIONS)}"
+        directory = f"/media/disk{i % 4}/{rng.choice(WORDS)}/{rng.choice(WORDS)}"
+        return {'file_path': f"{directory}/{name}", 'extension': name[-4:], 'size_bytes': rng.randint(1, 5000) * MB,
+                'mtime_ns': int((start + rng.uniform(0, 270 * 86400)) * 1e9), 'inode': i, 'device': 1,
+                'hash': f"{rng.getrandbits(256):064x}", 'hash_algo': 'sha256', 'hash_layout': 'bench',
+                'metadata': {'duration_seconds': rng.uniform(10, 7200), 'resolution': rng.choice(RESOLUTIONS),
+                             'fps': rng.choice([23.976, 25.0, 29.97, 60.0]), 'video_codec': rng.choice(CODECS),
+                             'bitrate_total_kbps': rng.randint(500, 20000)}}
+    # Grava pelo mesmo caminho do scanner, em lotes grandes
+    conn = sqlite3.connect(db_path)
+    for batch_start in range(0, rows, 50000):
+        with conn:
+            upsert_records(conn, [record(i) for i in range(batch_start, min(rows, batch_start + 50000))])
+    conn.close()
+    return True
+
+def bench_viewer(args, results):
+    filters = [('name', {'name': 'beach'}), ('path', {'file_path': 'disk2/party'}),
+               ('size', {'size_mb': '>4000'}), ('combined', {'name': 'trip', 'video_codec': 'hevc', 'fps': '>=29'})]
+    sorts = [('size', [('size_mb', True)]), ('multi', [('video_codec', False), ('duration_seconds', True)])]
+    for rows in args.rows:
+        db_path = os.path.join(args.workdir, f"catalog_{rows}.db")
+        log(f"Gerando catálogo com {rows} linhas...\n")
+        created = generate_catalog(db_path, rows, args.seed)
+        prefix = f"viewer.{rows}"
+
+        conn = sqlite3.connect(db_path)
+        try:
+            def build_indexes():
+                fts = ensure_search_index(conn)
+                ensure_stats_summary(conn)
+                return fts
+            # Índices e resumo só são construídos na primeira vez; num banco reaproveitado não há o que medir
+            if created:
+                fts = measure(results, f"{prefix}.sql.index_build", build_indexes, items=rows)
+            else:
+                fts = build_indexes()
+            measure(results, f"{prefix}.sql.stats",
+                    lambda: summary_stats(conn)['count'], items=rows, repeat=args.repeat)
+            for label, spec in filters:
+                query = CatalogQuery(spec, fts=fts)
+                measure(results, f"{prefix}.sql.filter_{label}",
+                        lambda: query.stats(conn)['count'], items=rows, repeat=args.repeat)
+                measure(results, f"{prefix}.sql.breakdown_{label}",
+                        lambda: len(query.breakdown(conn)), items=rows, repeat=args.repeat)
+            for label, keys in sorts:
+                query = CatalogQuery({}, keys, fts)
+                measure(results, f"{prefix}.sql.sort_{label}_first_page",
+                        lambda: len(query.rows(conn, 0, 100)), items=rows, repeat=args.repeat)
+                measure(results, f"{prefix}.sql.sort_{label}_full",
+                        lambda: len(query.rowids(conn)), items=rows, repeat=args.repeat)
+        finally:
+            conn.close()
+
+        catalog = measure(results, f"{prefix}.memory.load", lambda: ColumnarCatalog.load(db_path), items=rows)
+        measure(results, f"{prefix}.memory.stats",
+                    lambda: ColumnarQuery(catalog).stats(None)['count'], items=rows, repeat=args.repeat)
+        for label, spec in filters:
+            measure(results, f"{prefix}.memory.filter_{label}",
+                    lambda: ColumnarQuery(catalog, spec).stats(None)['count'], items=rows, repeat=args.repeat)
+            measure(results, f"{prefix}.memory.breakdown_{label}",
+                    lambda: len(ColumnarQuery(catalog, spec).breakdown(None)), items=rows, repeat=args.repeat)
+        for label, keys in sorts:
+            measure(results, f"{prefix}.memory.sort_{label}",
+                    lambda: len(ColumnarQuery(catalog, {}, keys).rowids(None)), items=rows, repeat=args.repeat)
+        del catalog
+
+def code_version():
+    try:
+        result = subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+        return result.stdout.strip() or None
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+
+def compare(results, baseline_path, threshold):
+    # Regressão: mais lento que a referência além do limite relativo; medições curtas demais são ignoradas
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {item['name']: item for item in json.load(f)['results']}
+    regressions = 0
+    for item in results:
+        previous = baseline.get(item['name'])
+        if not previous or previous['seconds'] < 0.001:
+            continue
+        change = item['seconds'] / previous['seconds'] - 1
+        if change > threshold:
+            regressions += 1
+            log(f"REGRESSÃO {item['name']}: {previous['seconds']:.4f} s -> {item['seconds']:.4f} s (+{change:.0%})\n")
+    log(f"{regressions} regressões acima de {threshold:.0%} em relação a {baseline_path}\n")
+    return regressions
+
+def parse_rows(text):
+    return [int(value.lower().replace('k', '000').replace('m', '000000')) for value in text.split(',')]
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="benchmark", description="Mede a vazão do scan e do viewer sobre dados sintéticos")
+    parser.add_argument("suite", nargs="?", choices=["all", "scan", "viewer"], default="all")
+    parser.add_argument("--workdir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_data'),
+                        help="Pasta para o corpus, o ffprobe falso e os bancos sintéticos (reaproveitados entre execuções)")
+    parser.add_argument("--output", default="benchmark.json", help="Arquivo JSON com os resultados")
+    parser.add_argument("--compare", help="Resultados anteriores para apontar regressões")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Aumento relativo de tempo considerado regressão")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetições de cada medição (vale a menor)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--files", type=int, default=1000, help="Arquivos no corpus sintético")
+    parser.add_argument("--min-size", type=int, default=256 * 1024, help="Tamanho mínimo dos arquivos em bytes")
+    parser.add_argument("--max-size", type=int, default=8 * MB, help="Tamanho máximo dos arquivos em bytes")
+    parser.add_argument("--dirs", type=int, default=20, help="Diretórios folha do corpus")
+    parser.add_argument("--depth", type=int, default=3, help="Profundidade dos diretórios folha")
+    parser.add_argument("--sample", type=int, default=200, help="Arquivos usados nas medições de metadados e save_to_db")
+    parser.add_argument("--probe-latency", type=float, default=0.0, help="Atraso em segundos do ffprobe falso")
+    parser.add_argument("--probe-workers", type=int, default=4, help="Processos ffprobe simultâneos no process_folder")
+    parser.add_argument("--workers", type=int, default=6, help="Threads do process_folder")
+    parser.add_argument("--drop-caches", action="store_true",
+                        help="Limpa o cache de páginas antes das medições frias (Linux, requer root)")
+    parser.add_argument("--rows", type=parse_rows, default=[10000, 100000, 1000000],
+                        help="Tamanhos do catálogo sintético do viewer, separados por vírgula (ex.: 10k,100k,1m)")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    os.makedirs(args.workdir, exist_ok=True)
+    results = []
+    if args.suite in ("all", "scan"):
+        bench_scan(args, results)
+    if args.suite in ("all", "viewer"):
+        bench_viewer(args, results)
+
+    params = {key: value for key, value in vars(args).items() if key not in ('output', 'compare')}
+    report = {'version': code_version(), 'python': platform.python_version(), 'platform': platform.platform(),
+              'timestamp': datetime.now().isoformat(timespec='seconds'), 'params': params, 'results': results}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    log(f"Resultados gravados em {args.output}\n")
+    if args.compare:
+        return 1 if compare(results, args.compare, args.threshold) else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
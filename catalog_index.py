@@ -0,0 +1,49 @@
+import os
+import sqlite3
+from collections import namedtuple
+
+IndexEntry = namedtuple('IndexEntry', ['size_bytes', 'hash', 'metadata_complete',
+                                       'mtime_ns', 'inode', 'device', 'hash_algo', 'hash_layout'])
+
+def path_range(root):
+    # Intervalo [root/, root/ + maior code point) para que o filtro use o índice único de directories.path.
+    # O separador final faz parte do prefixo: sem ele /data/vid também pegaria /data/videos
+    if not root.endswith(('/', '\\')):
+        root += os.sep
+    return root, root + chr(0x10FFFF)
+
+def under_root(root, column='dir_id'):
+    # Condição SQL (e parâmetros) para arquivos sob root: filtra os diretórios, não cada caminho
+    return f'{column} IN (SELECT id FROM directories WHERE path >= ? AND path < ?)', path_range(root)
+
+def load_catalog_index(db_path, root):
+    index = {}
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    try:
+        c = conn.cursor()
+        where, params = under_root(root, 'f.dir_id')
+        c.execute(f'''
+            SELECT d.path || f.name, f.size_bytes, f.hash, f.duration_seconds, f.resolution, f.video_codec,
+                   f.mtime_ns, f.inode, f.device, f.hash_algo, f.hash_layout
+            FROM files f JOIN directories d ON d.id = f.dir_id WHERE {where}
+        ''', params)
+        for (file_path, size_bytes, file_hash, duration, resolution, video_codec,
+             mtime_ns, inode, device, hash_algo, hash_layout) in c:
+            # O hash é gravado em bytes; o scanner compara com o hexdigest do Hasher
+            index[file_path] = IndexEntry(size_bytes, file_hash.hex() if file_hash else None,
+                                          bool(duration and resolution and video_codec),
+                                          mtime_ns, inode, device, hash_algo, hash_layout)
+    finally:
+        conn.close()
+    return index
+
+def has_stat(entry):
+    # Registros gravados antes da detecção por stat não têm inode (o mtime_ns deles vem do modified_at antigo)
+    return entry.inode is not None
+
+def is_unchanged(entry, stats):
+    return (has_stat(entry)
+            and entry.size_bytes == stats.st_size
+            and entry.mtime_ns == stats.st_mtime_ns
+            and entry.inode == stats.st_ino
+            and entry.device == stats.st_dev)
@@ -0,0 +1,439 @@
+import re
+import sqlite3
+import threading
+from array import array
+
+from schema import iso_to_ns, hash_to_blob
+
+MB = 1024 ** 2
+
+# Colunas exibidas no viewer -> expressão SQL e tipo usado no filtro
+COLUMN_SQL = {
+    'name': ('name', 'fts'),
+    'extension': ('extension', 'text'),
+    'file_path': ('file_path', 'fts'),
+    'size_mb': ('size_bytes', 'number'),
+    'duration_seconds': ('duration_seconds', 'number'),
+    'resolution': ('resolution', 'text'),
+    'fps': ('fps', 'number'),
+    'video_codec': ('video_codec', 'text'),
+    'bitrate_total_kbps': ('bitrate_total_kbps', 'number'),
+    'modified_at': ('modified_at', 'ordered'),
+    'hash': ('lower(hex(hash))', 'text'),
+}
+
+# Comparações (>, <, faixas) usam a coluna gravada, não a exibida: modified_at vem de mtime_ns
+COMPARE_SQL = {'modified_at': 'mtime_ns'}
+
+# Multiplicador entre o valor digitado e o gravado, e a tolerância do "igual" na precisão exibida
+SCALE = {'size_mb': MB}
+TOLERANCE = {'size_mb': 0.005, 'duration_seconds': 0.005, 'fps': 0.005, 'bitrate_total_kbps': 0.5}
+
+NUMERIC_INDEXES = ['size_bytes', 'duration_seconds', 'fps', 'bitrate_total_kbps']
+
+# Chave de ordenação por coluna: texto sem diferenciar maiúsculas (como o viewer sempre ordenou),
+# números pelo valor gravado. Cada chave tem um índice com a mesma collation para o ORDER BY usá-lo;
+# o caminho ordena por diretório e nome, que os índices únicos de directories e files já cobrem
+SORT_SQL = {
+    'name': 'name COLLATE NOCASE',
+    'extension': 'extension COLLATE NOCASE',
+    'file_path': 'dir_path, name',
+    'size_mb': 'size_bytes',
+    'duration_seconds': 'duration_seconds',
+    'resolution': 'resolution COLLATE NOCASE',
+    'fps': 'fps',
+    'video_codec': 'video_codec COLLATE NOCASE',
+    'bitrate_total_kbps': 'bitrate_total_kbps',
+    'modified_at': 'mtime_ns',
+    'hash': 'hash',
+}
+SORT_INDEXES = [('idx_name_nocase', 'name COLLATE NOCASE'), ('idx_extension_nocase', 'extension COLLATE NOCASE'),
+                ('idx_resolution_nocase', 'resolution COLLATE NOCASE'), ('idx_mtime_ns', 'mtime_ns')]
+
+_COMPARISON = re.compile(r'^(>=|<=|!=|>|<|=)?\s*(.+?)$')
+_RANGE = re.compile(r'^(-?\d+(?:[.,]\d+)?)\s*\.\.\s*(-?\d+(?:[.,]\d+)?)$')
+
+SELECT_COLUMNS = ('name, extension, file_path, size_bytes, duration_seconds, resolution, fps, '
+                  'video_codec, bitrate_total_kbps, modified_at, lower(hex(hash))')
+
+# Tamanhos (em hex) dos digests de md5, sha1, sha256 e blake2b: um hash completo digitado vai direto ao idx_hash
+HASH_HEX_LENGTHS = (32, 40, 64, 128)
+
+def has_search_index(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='files_fts'").fetchone() is not None
+
+def _fts_path(row):
+    # Caminho completo de new/old dentro de um trigger de files
+    return f'(SELECT path FROM directories WHERE id = {row}.dir_id) || {row}.name'
+
+def ensure_search_index(conn):
+    # FTS5 com tokenizer trigram sobre name e file_path, sincronizado por triggers;
+    # sem suporte a trigram (SQLite < 3.34) a busca cai para LIKE. O conteúdo vem da visão catalog,
+    # onde file_path é remontado a partir de directories
+    c = conn.cursor()
+    for column in NUMERIC_INDEXES:
+        c.execute(f'CREATE INDEX IF NOT EXISTS idx_{column} ON files({column})')
+    for index_name, expr in SORT_INDEXES:
+        c.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON files({expr})')
+    if not has_search_index(conn):
+        try:
+            c.execute('''
+                CREATE VIRTUAL TABLE files_fts USING fts5(
+                    name, file_path, content='catalog', content_rowid='file_id', tokenize='trigram')
+            ''')
+        except sqlite3.OperationalError:
+            conn.commit()
+            return False
+        c.execute("INSERT INTO files_fts(files_fts) VALUES ('rebuild')")
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS files_fts_insert AFTER INSERT ON files BEGIN
+            INSERT INTO files_fts(rowid, name, file_path) VALUES (new.file_id, new.name, {_fts_path('new')});
+        END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS files_fts_delete AFTER DELETE ON files BEGIN
+            INSERT INTO files_fts(files_fts, rowid, name, file_path)
+            VALUES ('delete', old.file_id, old.name, {_fts_path('old')});
+        END
+    ''')
+    # O upsert do scanner reescreve as colunas mesmo sem mudança; só reindexa quando nome ou diretório mudam de fato
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS files_fts_update AFTER UPDATE OF name, dir_id ON files
+        WHEN old.name IS NOT new.name OR old.dir_id IS NOT new.dir_id BEGIN
+            INSERT INTO files_fts(files_fts, rowid, name, file_path)
+            VALUES ('delete', old.file_id, old.name, {_fts_path('old')});
+            INSERT INTO files_fts(rowid, name, file_path) VALUES (new.file_id, new.name, {_fts_path('new')});
+        END
+    ''')
+    conn.commit()
+    return True
+
+# Dimensões do resumo mantido por triggers; 'total' tem uma única linha com valor ''
+BREAKDOWN_COLUMNS = ['video_codec', 'resolution', 'extension']
+BREAKDOWN_LIMIT = 15
+
+def _stats_values(row, sign):
+    # Linhas (dimensão, valor, contagens e somas) que um registro soma (+1) ou subtrai (-1) do resumo
+    amounts = (f"{sign}, {sign} * COALESCE({row}.size_bytes, 0), "
+               f"CASE WHEN {row}.size_bytes > 0 THEN {sign} ELSE 0 END, "
+               f"{sign} * COALESCE({row}.duration_seconds, 0), "
+               f"CASE WHEN {row}.duration_seconds > 0 THEN {sign} ELSE 0 END")
+    values = [f"('total', '', {amounts})"]
+    values += [f"('{column}', COALESCE({row}.{column}, ''), {amounts})" for column in BREAKDOWN_COLUMNS]
+    return f'''
+        INSERT INTO catalog_stats (dimension, value, file_count, total_size, sized_count, total_duration, timed_count)
+        VALUES {', '.join(values)}
+        ON CONFLICT(dimension, value) DO UPDATE SET
+            file_count = file_count + excluded.file_count,
+            total_size = total_size + excluded.total_size,
+            sized_count = sized_count + excluded.sized_count,
+            total_duration = total_duration + excluded.total_duration,
+            timed_count = timed_count + excluded.timed_count;
+    '''
+
+def ensure_stats_summary(conn):
+    # Totais gerais e por codec/resolução/extensão mantidos por triggers: o painel geral lê
+    # algumas dezenas de linhas em vez de agregar o catálogo inteiro
+    c = conn.cursor()
+    exists = c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='catalog_stats'").fetchone()
+    if not exists:
+        c.execute('''
+            CREATE TABLE catalog_stats (
+                dimension TEXT NOT NULL,
+                value TEXT NOT NULL,
+                file_count INTEGER NOT NULL,
+                total_size REAL NOT NULL,
+                sized_count INTEGER NOT NULL,
+                total_duration REAL NOT NULL,
+                timed_count INTEGER NOT NULL,
+                PRIMARY KEY (dimension, value)
+            )
+        ''')
+        for dimension, expr in [('total', "''")] + [(column, f"COALESCE({column}, '')") for column in BREAKDOWN_COLUMNS]:
+            c.execute(f'''
+                INSERT INTO catalog_stats
+                SELECT '{dimension}', {expr}, COUNT(*), COALESCE(SUM(size_bytes), 0),
+                       COUNT(NULLIF(size_bytes > 0, 0)), COALESCE(SUM(duration_seconds), 0),
+                       COUNT(NULLIF(duration_seconds > 0, 0))
+                FROM files GROUP BY 2
+            ''')
+    c.execute(f'CREATE TRIGGER IF NOT EXISTS catalog_stats_insert AFTER INSERT ON files BEGIN {_stats_values("new", 1)} END')
+    c.execute(f'CREATE TRIGGER IF NOT EXISTS catalog_stats_delete AFTER DELETE ON files BEGIN {_stats_values("old", -1)} END')
+    changed = ' OR '.join(f'old.{column} IS NOT new.{column}' for column in ['size_bytes', 'duration_seconds'] + BREAKDOWN_COLUMNS)
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS catalog_stats_update
+        AFTER UPDATE OF size_bytes, duration_seconds, {', '.join(BREAKDOWN_COLUMNS)} ON files
+        WHEN {changed} BEGIN {_stats_values("old", -1)} {_stats_values("new", 1)} END
+    ''')
+    conn.commit()
+
+def _summary_dict(row):
+    count, total_size, sized_count, total_duration, timed_count = row
+    return {'count': count, 'total_size': total_size, 'avg_size': total_size / sized_count if sized_count else 0,
+            'avg_duration': total_duration / timed_count if timed_count else 0, 'total_duration': total_duration}
+
+def summary_stats(conn):
+    row = conn.execute('''
+        SELECT file_count, total_size, sized_count, total_duration, timed_count
+        FROM catalog_stats WHERE dimension = 'total'
+    ''').fetchone()
+    return _summary_dict(row or (0, 0, 0, 0, 0))
+
+def summary_breakdown(conn):
+    breakdown = {}
+    for column in BREAKDOWN_COLUMNS:
+        breakdown[column] = conn.execute('''
+            SELECT value, file_count, total_size, total_duration FROM catalog_stats
+            WHERE dimension = ? AND file_count > 0 ORDER BY file_count DESC, value LIMIT ?
+        ''', (column, BREAKDOWN_LIMIT)).fetchall()
+    return breakdown
+
+def _number(text):
+    return float(text.replace(',', '.'))
+
+def _like(text):
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+def time_bound_ns(text):
+    # Prefixo de data digitado no filtro (ex.: 2024-09) completado com o início do período, em horário local
+    text = text.strip()
+    template = '0000-01-01T00:00:00'
+    return iso_to_ns(text + template[len(text):] if len(text) < len(template) else text)
+
+def parse_typed(col, text):
+    # Texto digitado -> ('compare', [(operador, valor), ...]) ou ('contains', trecho). Colunas numéricas
+    # aceitam >, <, >=, <=, =, != e a..b; um número sozinho compara com a precisão exibida.
+    # Texto é busca por trecho, sem diferenciar maiúsculas
+    text = text.strip()
+    if not text:
+        return None
+    kind = COLUMN_SQL[col][1]
+
+    if kind == 'number':
+        scale = SCALE.get(col, 1)
+        tolerance = TOLERANCE.get(col, 0)
+        match = _RANGE.match(text)
+        if match:
+            low, high = sorted((_number(match.group(1)), _number(match.group(2))))
+            return 'compare', [('>=', low * scale), ('<=', high * scale)]
+        op, value = _COMPARISON.match(text).groups()
+        try:
+            value = _number(value)
+        except ValueError:
+            return 'contains', text
+        if op in (None, '='):
+            return 'compare', [('>=', (value - tolerance) * scale), ('<', (value + tolerance) * scale)]
+        return 'compare', [(op, value * scale)]
+
+    if kind == 'ordered':
+        op, value = _COMPARISON.match(text).groups()
+        bound = time_bound_ns(value) if op else None
+        if bound is not None:
+            return 'compare', [(op, bound)]
+    return 'contains', text
+
+def parse_filter(col, text, fts=True):
+    # Texto digitado -> (condição SQL, parâmetros)
+    parsed = parse_typed(col, text)
+    if not parsed:
+        return None
+    expr, kind = COLUMN_SQL[col]
+    if parsed[0] == 'compare':
+        expr = COMPARE_SQL.get(col, expr)
+        return ' AND '.join(f'{expr} {op} ?' for op, _ in parsed[1]), [value for _, value in parsed[1]]
+
+    text = parsed[1]
+    if kind == 'number':
+        return f'CAST({expr} AS TEXT) LIKE ? ESCAPE \'\\\'', [_like(text)]
+    if kind == 'fts' and fts and len(text) >= 3:
+        # Trigram precisa de pelo menos 3 caracteres; abaixo disso vai de LIKE mesmo
+        phrase = '"' + text.replace('"', '""') + '"'
+        return 'file_id IN (SELECT rowid FROM files_fts WHERE files_fts MATCH ?)', [f'{expr} : {phrase}']
+    if col == 'hash' and len(text) in HASH_HEX_LENGTHS and hash_to_blob(text):
+        return 'hash = ?', [hash_to_blob(text)]
+    return f'{expr} LIKE ? ESCAPE \'\\\'', [_like(text)]
+
+def build_where(filters, fts=True):
+    clauses, params = [], []
+    for col, text in filters.items():
+        parsed = parse_filter(col, text, fts)
+        if parsed:
+            clauses.append(f'({parsed[0]})')
+            params.extend(parsed[1])
+    return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+def format_row(row):
+    # Mesma apresentação que o viewer sempre usou: MB com 2 casas, floats arredondados, None -> vazio/0
+    (name, extension, file_path, size_bytes, duration, resolution, fps,
+     video_codec, bitrate, modified_at, file_hash) = row
+    return (name, extension or '', file_path,
+            round(size_bytes / MB, 2) if size_bytes else 0,
+            round(duration, 2) if duration else 0,
+            resolution or '',
+            round(fps, 2) if fps else 0,
+            video_codec or '',
+            bitrate if bitrate else 0,
+            modified_at[:19] if modified_at else '',
+            file_hash or '')
+
+def order_clause(sort_keys):
+    # sort_keys: [(coluna, decrescente)], da chave principal para as secundárias; file_id desempata
+    # para que LIMIT/OFFSET pagine de forma estável
+    if not sort_keys:
+        return ''
+    parts = [f"{expr} {'DESC' if reverse else 'ASC'}" for col, reverse in sort_keys for expr in SORT_SQL[col].split(', ')]
+    parts.append(f"file_id {'DESC' if sort_keys[0][1] else 'ASC'}")
+    return ' ORDER BY ' + ', '.join(parts)
+
+class CatalogQuery:
+    def __init__(self, filters=None, sort_keys=None, fts=True):
+        self.where, self.params = build_where(filters or {}, fts)
+        self.order = order_clause(sort_keys)
+
+    def sorted(self, sort_keys):
+        # Mesmo filtro com outra ordem: contagem e estatísticas não mudam, não precisa refazê-las
+        query = CatalogQuery.__new__(CatalogQuery)
+        query.where, query.params = self.where, self.params
+        query.order = order_clause(sort_keys)
+        return query
+
+    def source(self, conn, total):
+        return SqlSource(conn, self, total)
+
+    def stats(self, conn):
+        if not self.where:
+            return summary_stats(conn)
+        count, total_size, avg_size, avg_duration, total_duration = conn.execute(f'''
+            SELECT COUNT(*), SUM(size_bytes), AVG(NULLIF(size_bytes, 0)),
+                   AVG(NULLIF(duration_seconds, 0)), SUM(duration_seconds)
+            FROM catalog{self.where}
+        ''', self.params).fetchone()
+        return {'count': count, 'total_size': total_size or 0, 'avg_size': avg_size or 0,
+                'avg_duration': avg_duration or 0, 'total_duration': total_duration or 0}
+
+    def breakdown(self, conn):
+        if not self.where:
+            return summary_breakdown(conn)
+        breakdown = {}
+        for column in BREAKDOWN_COLUMNS:
+            breakdown[column] = conn.execute(f'''
+                SELECT COALESCE({column}, '') AS value, COUNT(*), COALESCE(SUM(size_bytes), 0),
+                       COALESCE(SUM(duration_seconds), 0)
+                FROM catalog{self.where} GROUP BY value ORDER BY 2 DESC, value LIMIT ?
+            ''', self.params + [BREAKDOWN_LIMIT]).fetchall()
+        return breakdown
+
+    def rows(self, conn, start, stop):
+        c = conn.execute(f'SELECT {SELECT_COLUMNS} FROM catalog{self.where}{self.order} LIMIT ? OFFSET ?',
+                         self.params + [stop - start, start])
+        return [format_row(row) for row in c]
+
+    def rowids(self, conn):
+        # Resultado inteiro já ordenado, só os rowids: com ele qualquer página sai por chave primária,
+        # sem o OFFSET reordenar tudo até a posição pedida
+        return array('q', (row[0] for row in conn.execute(f'SELECT file_id FROM catalog{self.where}{self.order}', self.params)))
+
+def rows_by_id(conn, rowids):
+    placeholders = ', '.join(['?'] * len(rowids))
+    c = conn.execute(f'SELECT file_id, {SELECT_COLUMNS} FROM catalog WHERE file_id IN ({placeholders})', rowids)
+    by_id = {row[0]: format_row(row[1:]) for row in c}
+    return [by_id[rowid] for rowid in rowids if rowid in by_id]
+
+class SqlSource:
+    # Fonte do VirtualTable: páginas lidas sob demanda. Enquanto a ordem completa não está pronta,
+    # usa LIMIT/OFFSET (rápido no começo da lista); depois, lê pelos rowids já ordenados
+    def __init__(self, conn, query, total):
+        self.conn = conn
+        self.query = query
+        self.total = total
+        self.ordered_ids = None
+
+    def count(self):
+        return self.total
+
+    def rows(self, start, stop):
+        if self.ordered_ids is not None:
+            return rows_by_id(self.conn, self.ordered_ids[start:stop].tolist())
+        return self.query.rows(self.conn, start, stop)
+
+STEPS = {'stats': 'stats', 'breakdown': 'breakdown', 'order': 'rowids'}
+
+class QueryCancelled(Exception):
+    # Levantada por consultas que rodam em Python (catálogo em memória) quando o runner as cancela
+    pass
+
+class QueryRunner(threading.Thread):
+    # Roda as consultas do viewer fora da thread do Tk; uma consulta nova interrompe a anterior.
+    # Para cada consulta: estatísticas e detalhamento (se pedidos) e, quando há ORDER BY, a lista ordenada
+    # de rowids; cada passo é entregue assim que termina
+    def __init__(self, db_path):
+        super().__init__(daemon=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.cond = threading.Condition()
+        self.pending = None
+        self.query = None
+        self.results = []
+        self.busy = False
+        self.generation = 0
+        self.closed = False
+        self.start()
+
+    def submit(self, query, want_stats=True):
+        steps = (['stats', 'breakdown'] if want_stats else []) + (['order'] if query.order else [])
+        with self.cond:
+            self.generation += 1
+            self.pending = (self.generation, query, steps)
+            if self.query is not None:
+                self.query.cancelled = True
+            self.query = query
+            self.results = []
+            self.busy = True
+            self.conn.interrupt()
+            self.cond.notify()
+        return self.generation
+
+    def poll(self):
+        # Resultados da consulta mais recente desde a última chamada, e se ainda há passos rodando
+        with self.cond:
+            results, self.results = self.results, []
+            return results, self.busy
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.conn.interrupt()
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.pending is None and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    break
+                generation, query, steps = self.pending
+                self.pending = None
+            while steps:
+                step = steps[0]
+                try:
+                    result = getattr(query, STEPS[step])(self.conn)
+                except QueryCancelled:
+                    break
+                except sqlite3.OperationalError as e:
+                    if 'interrupt' in str(e):
+                        with self.cond:
+                            # Interrompida sem consulta nova na fila: o interrupt era para a anterior, tenta de novo
+                            if self.pending is None and generation == self.generation:
+                                continue
+                        break
+                    result = e
+                with self.cond:
+                    if generation != self.generation:
+                        break
+                    self.results.append((step, query, result))
+                steps = [] if isinstance(result, Exception) else steps[1:]
+            with self.cond:
+                if generation == self.generation and self.pending is None:
+                    self.busy = False
+        self.conn.close()
@@ -0,0 +1,316 @@
+import argparse
+import os
+import signal
+import sys
+import tempfile
+from datetime import datetime
+
+import scanner
+import dedup
+import neardup
+from io_scheduler import DeviceScheduler
+from extractors import build_extractor, BACKENDS
+from hashing import Hasher, ALGORITHMS, MODES, DEFAULT_SAMPLE_BYTES
+from metrics import ScanMetrics
+from profiling import build_profiler, profiled, MODES as PROFILE_MODES
+from jobs import ScanJob, list_jobs, failed_files
+from watch import build_watcher, MODES as WATCH_MODES
+from snapshot import scan_profile
+from shards import default_node, shard_path, tag_shard, merge_shards
+from scrub import Scrubber, list_mismatches, verification_status
+
+# Opções do scan gravadas no job; ao retomar, valem as da execução original
+JOB_OPTIONS = ['workers', 'hdd_workers', 'device_limit', 'adaptive', 'single_pool', 'step', 'batch_size',
+               'flush_interval', 'paranoid', 'hash_algo', 'hash_mode', 'sample_bytes', 'mmap', 'probe_workers',
+               'probe_timeout', 'metadata_backend', 'stub_metadata', 'ffprobe', 'prune']
+
+def open_job(args):
+    scanner.init_database(args.db)
+    job_id = args.resume or args.retry_failed
+    if job_id is None:
+        if not args.folder:
+            scanner.log_to_stdout("Informe a pasta ou um job para --resume/--retry-failed\n")
+            return None
+        # Sem pasta válida o process_folder nem começa e o job ficaria como running para sempre
+        if not os.path.isdir(args.folder):
+            scanner.log_to_stdout(f"Caminho inválido: {args.folder}\n")
+            return None
+        return ScanJob.create(args.db, args.folder, {name: getattr(args, name) for name in JOB_OPTIONS})
+    job = ScanJob.load(args.db, job_id)
+    if job is None:
+        scanner.log_to_stdout(f"Job {job_id} não encontrado em {args.db}\n")
+        return None
+    for name, value in job.options.items():
+        setattr(args, name, value)
+    args.folder = job.root
+    if args.retry_failed:
+        scanner.log_to_stdout(f"Job {job_id}: {job.retry_failed(args.db)} arquivos com falha voltam a pendentes\n")
+    return job
+
+def cmd_scan(args):
+    if args.db is None:
+        # Shard sem --db: arquivo local com nó e volume no nome, para depois ir ao 'merge'
+        args.db = shard_path(os.getcwd(), args.node, args.shard) if args.shard else scanner.default_db_path
+    if args.shard:
+        try:
+            tag_shard(args.db, args.node, args.shard, args.folder)
+        except ValueError as e:
+            scanner.log_to_stdout(f"{e}\n")
+            return 2
+    job = open_job(args)
+    if job is None:
+        return 2
+    if args.ffprobe:
+        scanner.ffprobe_path = args.ffprobe
+    limits = {}
+    for spec in args.device_limit:
+        path, _, limit = spec.rpartition("=")
+        limits[os.stat(path).st_dev] = int(limit)
+    scheduler = DeviceScheduler(args.workers, limits, adaptive=args.adaptive,
+                                per_device=not args.single_pool, hdd_limit=args.hdd_workers)
+    hasher = Hasher(args.hash_algo, args.hash_mode, args.sample_bytes, use_mmap=args.mmap)
+    # O process_folder fecha o extrator ao terminar; o modo watch abre outro
+    extractor = lambda: build_extractor(args.metadata_backend, scanner.ffprobe_path, args.probe_workers,
+                                        args.probe_timeout, args.stub_metadata, log=scanner.log_to_stdout)
+    metrics = None
+    if args.metrics_json or args.metrics_textfile:
+        metrics = ScanMetrics(args.metrics_textfile, args.metrics_interval)
+    step = args.step if args.step == scanner.FUSED else int(args.step)
+    options = dict(step=step, workers=args.workers, db_path=args.db, batch_size=args.batch_size,
+                   flush_interval=args.flush_interval, paranoid=args.paranoid, hasher=hasher,
+                   scheduler=scheduler, extractor=extractor(), metrics=metrics, job=job, prune=args.prune)
+    watcher = None
+    if args.watch:
+        # Os watches são criados antes do scan inicial para não perder o que mudar durante ele
+        watcher = build_watcher(args.watch, args.folder, scanner.is_video_file, scanner.log_to_stdout,
+                                args.db, scan_profile(hasher, step != 2), args.poll_interval, args.prune)
+    if args.profile:
+        result = profiled(build_profiler(args.profile_mode), args.profile, scanner.log_to_stdout,
+                          scanner.process_folder, args.folder, **options)
+    else:
+        result = scanner.process_folder(args.folder, **options)
+    if metrics and args.metrics_json:
+        metrics.write_json(args.metrics_json)
+        scanner.log_to_stdout(f"Métricas gravadas em {args.metrics_json}\n")
+    if result is None:
+        return 2
+    processed, failed, skipped = result
+    if watcher:
+        scanner.log_to_stdout(f"Observando {args.folder} (Ctrl+C para encerrar)\n")
+        options.update(extractor=extractor(), metrics=None, job=None)
+        try:
+            scanner.process_folder(args.folder, changes=watcher.changes(), on_processed=watcher.processed, **options)
+        except KeyboardInterrupt:
+            scanner.log_to_stdout("Observação encerrada.\n")
+        finally:
+            watcher.close()
+    return 1 if failed else 0
+
+def cmd_jobs(args):
+    if args.failed:
+        for path, reason in failed_files(args.db, args.failed):
+            print(f"{path}\t{reason}")
+        return 0
+    for job_id, root, status, created_at, updated_at, done, pending, failed in list_jobs(args.db):
+        print(f"{job_id:>5}  {status:<11}  {datetime.fromtimestamp(created_at):%Y-%m-%d %H:%M}  "
+              f"concluídos {done}, pendentes {pending}, falhas {failed}  {root}")
+    return 0
+
+def cmd_dedup(args):
+    scanner.init_database(args.db)
+    dedup.find_duplicates(args.db, scanner.log_to_stdout, root=args.root, workers=args.workers,
+                          algorithm=args.hash_algo, sample_bytes=args.sample_bytes)
+    return 0
+
+def cmd_neardup(args):
+    scanner.init_database(args.db)
+    if args.action == "index":
+        neardup.build_index(args.db, scanner.log_to_stdout, root=args.root, workers=args.workers)
+    else:
+        neardup.report(args.db, scanner.log_to_stdout, threshold=args.threshold)
+    return 0
+
+def cmd_merge(args):
+    scanner.init_database(args.db)
+    merge_shards(args.db, args.shards, scanner.log_to_stdout)
+    return 0
+
+def parse_size(text):
+    # 50M, 1.5G, 800k (base 1024) ou bytes
+    units = {'k': 2**10, 'm': 2**20, 'g': 2**30}
+    text = text.strip().lower().rstrip('b')
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def cmd_scrub(args):
+    scanner.init_database(args.db)
+    if args.report:
+        for found_at, kind, path, expected, actual, detail in list_mismatches(args.db, args.kind, args.limit):
+            print(f"{datetime.fromtimestamp(found_at):%Y-%m-%d %H:%M}  {kind:<13}  {path}"
+                  f"{f'  esperado {expected}, lido {actual}' if actual else ''}{f'  ({detail})' if detail else ''}")
+        return 0
+    total, never, oldest = verification_status(args.db)
+    scanner.log_to_stdout(f"{total} arquivos com hash, {never} nunca verificados"
+                          f"{f', verificação mais antiga em {datetime.fromtimestamp(oldest):%Y-%m-%d %H:%M}' if oldest else ''}\n")
+    scrubber = Scrubber(args.db, scanner.log_to_stdout, bytes_per_sec=args.rate, iops=args.iops, root=args.root,
+                        older_than=args.older_than * 86400)
+
+    # Ctrl+C/SIGTERM param ao fim da leitura em curso, gravando o que já foi verificado; SIGUSR1 pausa e retoma
+    def stop(signum, frame):
+        scanner.log_to_stdout("Encerrando o scrub...\n")
+        scrubber.stop()
+
+    def toggle(signum, frame):
+        if scrubber.paused():
+            scrubber.resume()
+            scanner.log_to_stdout("Scrub retomado.\n")
+        else:
+            scrubber.pause()
+            scanner.log_to_stdout("Scrub pausado (SIGUSR1 de novo para retomar).\n")
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, toggle)
+    verified, problems = scrubber.run(max_seconds=args.max_hours * 3600 if args.max_hours else None)
+    return 1 if problems.get('hash_mismatch') else 0
+
+def cmd_view(args):
+    # Importado aqui para que os outros comandos rodem sem Tk
+    import viewer
+    paths = args.db or [scanner.default_db_path]
+    if len(paths) > 1:
+        # Vários shards: mesclados num catálogo temporário, com as mesmas regras do 'merge'
+        db_path = os.path.join(tempfile.mkdtemp(prefix="hashculator_"), "merged.db")
+        merge_shards(db_path, paths, scanner.log_to_stdout)
+    else:
+        db_path = paths[0]
+    scanner.init_database(db_path)
+    viewer.db_path = db_path
+    viewer.run_visualization(memory=args.memory)
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="hashculator", description="Hash e metadados de vídeos sem interface gráfica")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scan = subparsers.add_parser("scan", help="Processa uma pasta e grava os dados no banco")
+    scan.add_argument("folder", nargs="?", help="Pasta a ser processada (omitida com --resume/--retry-failed)")
+    scan.add_argument("--db", help="Caminho do banco de dados SQLite (padrão: video_data.db ao lado do script, "
+                                   "ou shard_NÓ_VOLUME.db na pasta atual com --shard)")
+    scan.add_argument("--shard", metavar="VOLUME",
+                      help="Grava um shard independente marcado com o nó e este ID de volume, para o comando merge")
+    scan.add_argument("--node", default=default_node(), help="ID do nó gravado no shard (padrão: nome da máquina)")
+    scan.add_argument("--workers", type=int, default=os.cpu_count() or 6,
+                      help="Threads de processamento por dispositivo (SSD, NAS ou pool único)")
+    scan.add_argument("--hdd-workers", type=int, default=2, help="Threads por disco giratório detectado (Linux)")
+    scan.add_argument("--device-limit", action="append", default=[], metavar="CAMINHO=N",
+                      help="Concorrência fixa para o dispositivo que contém CAMINHO (pode repetir)")
+    scan.add_argument("--adaptive", action="store_true",
+                      help="Ajusta a concorrência de cada dispositivo pela vazão observada")
+    scan.add_argument("--single-pool", action="store_true",
+                      help="Usa um único pool de threads para todos os dispositivos")
+    scan.add_argument("--step", choices=[scanner.FUSED, "1", "2"], default=scanner.FUSED,
+                      help="fused = hash e metadados na mesma visita ao arquivo, "
+                           "1 = metadados seguidos de hash em duas passagens, 2 = apenas hash")
+    scan.add_argument("--batch-size", type=int, default=500, help="Registros por transação de gravação no DB")
+    scan.add_argument("--flush-interval", type=float, default=1.0,
+                      help="Intervalo máximo em segundos entre gravações no DB")
+    scan.add_argument("--paranoid", action="store_true",
+                      help="Relê e recalcula o hash mesmo quando tamanho, mtime, inode e dispositivo não mudaram")
+    scan.add_argument("--hash-algo", choices=ALGORITHMS, default="sha256", help="Algoritmo de hash")
+    scan.add_argument("--hash-mode", choices=MODES, default="sampled",
+                      help="sampled = início e meio do arquivo, full = arquivo inteiro")
+    scan.add_argument("--sample-bytes", type=int, default=DEFAULT_SAMPLE_BYTES,
+                      help="Bytes lidos em cada amostra no modo sampled")
+    scan.add_argument("--mmap", action="store_true", help="Lê arquivos locais via mmap em vez de readinto")
+    scan.add_argument("--probe-workers", type=int, default=4, help="Processos ffprobe simultâneos")
+    scan.add_argument("--probe-timeout", type=float, default=60,
+                      help="Prazo em segundos da primeira tentativa do ffprobe; o processo é encerrado ao estourar")
+    scan.add_argument("--metadata-backend", choices=BACKENDS, default="auto",
+                      help="auto = MediaInfo em processo com ffprobe de reserva")
+    scan.add_argument("--stub-metadata", help="JSON com metadados fixos por nome de arquivo (backend stub)")
+    scan.add_argument("--ffprobe", help="Caminho do executável ffprobe")
+    scan.add_argument("--metrics-json", metavar="ARQUIVO",
+                      help="Grava ao final latências, bytes, vazão, filas e erros de cada estágio em JSON")
+    scan.add_argument("--metrics-textfile", metavar="ARQUIVO",
+                      help="Arquivo .prom atualizado periodicamente para o textfile collector do node_exporter")
+    scan.add_argument("--metrics-interval", type=float, default=5.0,
+                      help="Segundos entre atualizações do arquivo .prom")
+    scan.add_argument("--profile", metavar="ARQUIVO",
+                      help="Perfila a execução inteira (todas as threads) e grava o resultado em ARQUIVO")
+    scan.add_argument("--profile-mode", choices=PROFILE_MODES, default="cprofile",
+                      help="cprofile = estatísticas do pstats, sample = amostragem de pilhas no formato do flamegraph")
+    scan.add_argument("--prune", action="store_true",
+                      help="Pula diretórios com o mesmo mtime do scan anterior e já processados com o mesmo hash "
+                           "(e metadados, se pedidos), sem dar stat nos arquivos deles. Mais rápido em bibliotecas "
+                           "grandes, mas arquivos reescritos ou aumentados no lugar não mudam o mtime do diretório "
+                           "e não são vistos; sem --prune todo arquivo é comparado por tamanho, mtime e inode")
+    scan.add_argument("--watch", nargs="?", const="auto", choices=WATCH_MODES,
+                      help="Depois do scan, continua observando a pasta e processa o que mudar "
+                           "(auto = inotify no Linux, senão polling)")
+    scan.add_argument("--poll-interval", type=float, default=30.0,
+                      help="Segundos entre verificações no modo watch por polling")
+    scan.add_argument("--resume", type=int, metavar="JOB",
+                      help="Retoma um job interrompido com as opções originais, do ponto do último checkpoint")
+    scan.add_argument("--retry-failed", type=int, metavar="JOB",
+                      help="Reprocessa apenas os arquivos que falharam no job (e o que restar dele)")
+    scan.set_defaults(func=cmd_scan)
+
+    jobs = subparsers.add_parser("jobs", help="Lista os jobs de scan e o estado dos arquivos")
+    jobs.add_argument("--db", default=scanner.default_db_path, help="Caminho do banco de dados SQLite")
+    jobs.add_argument("--failed", type=int, metavar="JOB", help="Lista os arquivos com falha do job e o motivo")
+    jobs.set_defaults(func=cmd_jobs)
+
+    dup = subparsers.add_parser("dedup", help="Procura duplicados: tamanho, depois hash amostrado, depois hash completo")
+    dup.add_argument("--db", default=scanner.default_db_path, help="Caminho do banco de dados SQLite")
+    dup.add_argument("--root", help="Limita a busca a arquivos sob esta pasta")
+    dup.add_argument("--workers", type=int, default=4, help="Threads de leitura para os hashes")
+    dup.add_argument("--hash-algo", choices=ALGORITHMS, default="sha256", help="Algoritmo de hash")
+    dup.add_argument("--sample-bytes", type=int, default=DEFAULT_SAMPLE_BYTES,
+                     help="Bytes lidos em cada amostra do hash amostrado")
+    dup.set_defaults(func=cmd_dedup)
+
+    near = subparsers.add_parser("neardup", help="Índice de quase-duplicados por blocos amostrados e LSH")
+    near.add_argument("action", choices=["index", "report"],
+                      help="index = calcula assinaturas novas, report = lista grupos com similaridade")
+    near.add_argument("--db", default=scanner.default_db_path, help="Caminho do banco de dados SQLite")
+    near.add_argument("--root", help="Limita a indexação a arquivos sob esta pasta")
+    near.add_argument("--workers", type=int, default=4, help="Threads de leitura dos blocos")
+    near.add_argument("--threshold", type=float, default=0.8, help="Similaridade mínima para agrupar")
+    near.set_defaults(func=cmd_neardup)
+
+    merge = subparsers.add_parser("merge", help="Importa shards no catálogo central")
+    merge.add_argument("shards", nargs="+", help="Bancos de shard gravados com 'scan --shard'")
+    merge.add_argument("--db", default=scanner.default_db_path, help="Catálogo central")
+    merge.set_defaults(func=cmd_merge)
+
+    scrub = subparsers.add_parser("scrub", help="Relê os arquivos em segundo plano e confere os hashes gravados")
+    scrub.add_argument("--db", default=scanner.default_db_path, help="Caminho do banco de dados SQLite")
+    scrub.add_argument("--root", help="Limita a verificação a arquivos sob esta pasta")
+    scrub.add_argument("--rate", type=parse_size, help="Limite de leitura em bytes/s (aceita k, M, G: 20M)")
+    scrub.add_argument("--iops", type=float, help="Limite de leituras por segundo (cada bloco lido ou stat conta uma)")
+    scrub.add_argument("--older-than", type=float, default=0,
+                       help="Só verifica arquivos cuja última verificação tem mais de N dias")
+    scrub.add_argument("--max-hours", type=float, help="Para depois de N horas; a próxima execução continua de onde parou")
+    scrub.add_argument("--report", action="store_true", help="Lista as divergências encontradas em vez de verificar")
+    scrub.add_argument("--kind", choices=["hash_mismatch", "modified", "missing", "read_error"],
+                       help="Com --report, só divergências deste tipo")
+    scrub.add_argument("--limit", type=int, help="Com --report, número máximo de linhas")
+    scrub.set_defaults(func=cmd_scrub)
+
+    view = subparsers.add_parser("view", help="Abre o visualizador do catálogo")
+    view.add_argument("--db", action="append", help="Caminho do banco SQLite; repetido, abre vários shards juntos")
+    view.add_argument("--memory", action="store_true",
+                      help="Carrega o catálogo em memória (colunar) e filtra/ordena sem consultar o SQLite")
+    view.set_defaults(func=cmd_view)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
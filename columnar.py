@@ -0,0 +1,473 @@
+import sqlite3
+import bisect
+from array import array
+from collections import Counter, defaultdict
+from itertools import accumulate, islice
+from datetime import datetime
+
+from catalog_query import parse_typed, QueryCancelled, BREAKDOWN_COLUMNS, BREAKDOWN_LIMIT, MB
+
+# Linhas processadas entre duas verificações de cancelamento
+CHUNK = 65536
+NAN = float('nan')
+
+_OPERATORS = {
+    '>': lambda a, b: a > b, '<': lambda a, b: a < b, '>=': lambda a, b: a >= b,
+    '<=': lambda a, b: a <= b, '=': lambda a, b: a == b, '!=': lambda a, b: a != b,
+}
+
+def _present(value):
+    # NaN marca NULL nas colunas numéricas; como no SQL, NULL não passa em nenhuma comparação
+    return value == value and value
+
+class PackedStrings:
+    # Todas as strings de uma coluna num único buffer UTF-8 com offsets, em vez de um objeto str por linha.
+    # A cópia em minúsculas serve à busca por trecho
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array('Q', [0])
+        self.lower = bytearray()
+        self.lower_offsets = array('Q', [0])
+
+    def extend(self, texts):
+        for data, offsets, values in ((self.data, self.offsets, texts),
+                                      (self.lower, self.lower_offsets, [text.lower() for text in texts])):
+            encoded = [text.encode('utf-8', 'surrogatepass') for text in values]
+            offsets.extend(islice(accumulate(map(len, encoded), initial=offsets[-1]), 1, None))
+            data += b''.join(encoded)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].decode('utf-8', 'surrogatepass')
+
+    def lower_at(self, i):
+        return self.lower[self.lower_offsets[i]:self.lower_offsets[i + 1]].decode('utf-8', 'surrogatepass')
+
+    def find(self, term):
+        # Linhas que contêm o trecho: busca direto no buffer e converte a posição em linha pelos offsets
+        needle = term.lower().encode('utf-8', 'surrogatepass')
+        rows = []
+        start = self.lower.find(needle)
+        while start != -1:
+            row = bisect.bisect_right(self.lower_offsets, start) - 1
+            end = self.lower_offsets[row + 1]
+            if start + len(needle) <= end:
+                rows.append(row)
+                start = self.lower.find(needle, end)
+            else:
+                start = self.lower.find(needle, start + 1)
+        return rows
+
+class PackedHashes:
+    # Digests crus, como vêm do banco, concatenados com offsets; o hex só é gerado para exibir
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array('Q', [0])
+
+    def extend(self, blobs):
+        for blob in blobs:
+            if blob:
+                self.data += blob
+            self.offsets.append(len(self.data))
+
+    def raw(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]])
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].hex()
+
+class StringPool:
+    # Valores repetidos (codec, resolução, extensão, diretório) guardados uma vez; por linha só o código
+    def __init__(self, typecode='H'):
+        self.values = []
+        self.lookup = {}
+        self.codes = array(typecode)
+
+    def extend(self, values):
+        lookup = self.lookup
+        for value in values:
+            if value not in lookup:
+                lookup[value] = len(self.values)
+                self.values.append(value)
+        if len(self.values) > 65536 and self.codes.typecode == 'H':
+            self.codes = array('I', self.codes)
+        self.codes.extend(map(lookup.__getitem__, values))
+
+    def __getitem__(self, i):
+        return self.values[self.codes[i]]
+
+    def matching_codes(self, predicate):
+        return {code for code, value in enumerate(self.values) if predicate(value)}
+
+class CatalogRow:
+    # Visão de uma linha do catálogo: não copia nada, lê das colunas sob demanda
+    __slots__ = ('catalog', 'index')
+
+    def __init__(self, catalog, index):
+        self.catalog = catalog
+        self.index = index
+
+    @property
+    def name(self):
+        return self.catalog.names[self.index]
+
+    @property
+    def extension(self):
+        return self.catalog.extensions[self.index]
+
+    @property
+    def file_path(self):
+        return self.catalog.dirs[self.index] + self.name
+
+    @property
+    def size_mb(self):
+        size = self.catalog.sizes[self.index]
+        return round(size / MB, 2) if _present(size) else 0
+
+    @property
+    def duration_seconds(self):
+        duration = self.catalog.durations[self.index]
+        return round(duration, 2) if _present(duration) else 0
+
+    @property
+    def resolution(self):
+        return self.catalog.resolutions[self.index]
+
+    @property
+    def fps(self):
+        fps = self.catalog.fps[self.index]
+        return round(fps, 2) if _present(fps) else 0
+
+    @property
+    def video_codec(self):
+        return self.catalog.codecs[self.index]
+
+    @property
+    def bitrate_total_kbps(self):
+        bitrate = self.catalog.bitrates[self.index]
+        return int(bitrate) if _present(bitrate) else 0
+
+    @property
+    def modified_at(self):
+        mtime_ns = self.catalog.modified[self.index]
+        return datetime.fromtimestamp(mtime_ns / 1e9).isoformat()[:19] if mtime_ns == mtime_ns else ''
+
+    @property
+    def hash(self):
+        return self.catalog.hashes[self.index]
+
+    def values(self, columns):
+        return tuple(getattr(self, col) for col in columns)
+
+class ColumnarCatalog:
+    def __init__(self):
+        self.names = PackedStrings()
+        self.dirs = StringPool('I')
+        self.extensions = StringPool()
+        self.resolutions = StringPool()
+        self.codecs = StringPool()
+        self.hashes = PackedHashes()
+        self.sizes = array('d')
+        self.durations = array('d')
+        self.fps = array('f')
+        self.bitrates = array('d')
+        # mtime_ns em float: a precisão que sobra (centenas de ns) basta para filtrar e ordenar
+        self.modified = array('d')
+        self.ranks = {}
+        self.sums = {}
+        self.sorted_columns = {}
+        self.totals = None
+        self.full_breakdown = None
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def row(self, index):
+        return CatalogRow(self, index)
+
+    @classmethod
+    def load(cls, db_path):
+        catalog = cls()
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        try:
+            c = conn.execute('''
+                SELECT f.name, f.extension, d.path, f.size_bytes, f.duration_seconds, f.resolution, f.fps,
+                       f.video_codec, f.bitrate_total_kbps, f.mtime_ns, f.hash
+                FROM files f JOIN directories d ON d.id = f.dir_id ORDER BY f.file_id
+            ''')
+            while True:
+                batch = c.fetchmany(10000)
+                if not batch:
+                    break
+                catalog.extend(batch)
+        finally:
+            conn.close()
+        catalog.totals = catalog.aggregate(range(len(catalog)))
+        return catalog
+
+    def extend(self, rows):
+        # Carrega coluna a coluna: cada lista do lote vira array/pool de uma vez, sem objeto por linha
+        (names, extensions, dirs, sizes, durations, resolutions, fps,
+         codecs, bitrates, modified, hashes) = [list(column) for column in zip(*rows)]
+        # Diretório (com o separador final, como em directories) vai para o pool; o caminho é diretório + nome
+        self.names.extend(names)
+        self.dirs.extend(dirs)
+        self.extensions.extend([value or '' for value in extensions])
+        self.resolutions.extend([value or '' for value in resolutions])
+        self.codecs.extend([value or '' for value in codecs])
+        self.hashes.extend(hashes)
+        for column, values in ((self.sizes, sizes), (self.durations, durations),
+                               (self.fps, fps), (self.bitrates, bitrates), (self.modified, modified)):
+            column.extend([NAN if value is None else value for value in values])
+
+    def numeric(self, col):
+        return {'size_mb': self.sizes, 'duration_seconds': self.durations, 'fps': self.fps,
+                'bitrate_total_kbps': self.bitrates, 'modified_at': self.modified}[col]
+
+    def pool(self, col):
+        return {'extension': self.extensions, 'resolution': self.resolutions, 'video_codec': self.codecs}[col]
+
+    def sorted_column(self, col):
+        # Valores não nulos em ordem crescente e as linhas correspondentes; calculado uma vez por coluna
+        if col not in self.sorted_columns:
+            values = self.numeric(col)
+            order = sorted((i for i in range(len(values)) if values[i] == values[i]), key=values.__getitem__)
+            self.sorted_columns[col] = (array('d', map(values.__getitem__, order)), array('I', order))
+        return self.sorted_columns[col]
+
+    def summable(self, col):
+        # Cópia com NULL (NaN) trocado por 0, para somar sem testar linha a linha
+        if col not in self.sums:
+            self.sums[col] = array('d', (value if value == value else 0.0 for value in self.numeric(col)))
+        return self.sums[col]
+
+    def aggregate(self, indices, check=None):
+        count = sized = timed = 0
+        total_size = total_duration = 0.0
+        sizes, durations = self.sizes, self.durations
+        for n, i in enumerate(indices):
+            if check and not n % CHUNK:
+                check()
+            count += 1
+            size = sizes[i]
+            if size == size and size > 0:
+                total_size += size
+                sized += 1
+            duration = durations[i]
+            if duration == duration and duration > 0:
+                total_duration += duration
+                timed += 1
+        return {'count': count, 'total_size': total_size, 'avg_size': total_size / sized if sized else 0,
+                'avg_duration': total_duration / timed if timed else 0, 'total_duration': total_duration}
+
+    def rank(self, col):
+        # Posição de cada linha na ordem da coluna, calculada uma vez e reaproveitada em toda ordenação
+        if col not in self.ranks:
+            n = len(self)
+            if col == 'name':
+                key = self.names.lower_at
+            elif col == 'file_path':
+                dir_rank = _pool_rank(self.dirs, str)
+                codes, name_rank = self.dirs.codes, self.rank('name')
+                key = lambda i: (dir_rank[codes[i]], name_rank[i])
+            elif col == 'hash':
+                key = self.hashes.raw
+            elif col in ('size_mb', 'duration_seconds', 'fps', 'bitrate_total_kbps', 'modified_at'):
+                values = self.numeric(col)
+                # NULL primeiro, como no ORDER BY do SQLite
+                key = lambda i: values[i] if values[i] == values[i] else float('-inf')
+            else:
+                pool = self.pool(col)
+                code_rank = _pool_rank(pool, str.lower)
+                codes = pool.codes
+                key = lambda i: code_rank[codes[i]]
+            order = sorted(range(n), key=key)
+            ranks = array('I', bytes(4 * n))
+            previous, position = None, 0
+            for i in order:
+                k = key(i)
+                if k != previous:
+                    position += 1
+                    previous = k
+                ranks[i] = position
+            self.ranks[col] = ranks
+        return self.ranks[col]
+
+def _pool_rank(pool, transform):
+    ranks = [0] * len(pool.values)
+    for position, code in enumerate(sorted(range(len(pool.values)), key=lambda code: transform(pool.values[code]))):
+        ranks[code] = position
+    return ranks
+
+class ColumnarQuery:
+    # Mesma interface do CatalogQuery (stats, breakdown, rowids, source), resolvida sobre as colunas em memória
+    def __init__(self, catalog, filters=None, sort_keys=None):
+        self.catalog = catalog
+        self.filters = {col: text for col, text in (filters or {}).items() if text.strip()}
+        self.sort_keys = list(sort_keys or [])
+        self.order = 'memory' if self.sort_keys else ''
+        self.indices = None
+        self.ordered = None
+        self.cancelled = False
+
+    def sorted(self, sort_keys):
+        query = ColumnarQuery(self.catalog, self.filters, sort_keys)
+        query.indices = self.indices
+        return query
+
+    def source(self, conn, total):
+        return ColumnarSource(self)
+
+    def check(self):
+        if self.cancelled:
+            raise QueryCancelled()
+
+    def matches(self):
+        if self.indices is None:
+            indices = None
+            for col, text in self.filters.items():
+                indices = self._filter(col, text, indices)
+                if not indices:
+                    break
+            self.indices = array('I', range(len(self.catalog)) if indices is None else indices)
+        return self.indices
+
+    def _scan(self, indices, predicate):
+        # Percorre em blocos para poder parar no meio quando chega uma consulta nova
+        if indices is None:
+            indices = range(len(self.catalog))
+        result = []
+        for start in range(0, len(indices), CHUNK):
+            self.check()
+            result.extend(i for i in indices[start:start + CHUNK] if predicate(i))
+        return result
+
+    def _filter(self, col, text, indices):
+        catalog = self.catalog
+        kind, spec = parse_typed(col, text)
+
+        if kind == 'compare':
+            if any(op == '!=' for op, _ in spec):
+                values = catalog.numeric(col)
+                tests = [(_OPERATORS[op], bound) for op, bound in spec]
+                return self._scan(indices, lambda i: values[i] == values[i] and all(test(values[i], bound) for test, bound in tests))
+            # Faixa contínua: busca binária na coluna ordenada, como um índice
+            values, order = catalog.sorted_column(col)
+            low, high = 0, len(values)
+            for op, bound in spec:
+                if op in ('>', '>='):
+                    low = max(low, (bisect.bisect_right if op == '>' else bisect.bisect_left)(values, bound))
+                if op in ('<', '<='):
+                    high = min(high, (bisect.bisect_left if op == '<' else bisect.bisect_right)(values, bound))
+                if op == '=':
+                    low = max(low, bisect.bisect_left(values, bound))
+                    high = min(high, bisect.bisect_right(values, bound))
+            found = order[low:high] if low < high else []
+            return sorted(found if indices is None else set(found).intersection(indices))
+
+        term = spec.lower()
+        if col == 'name':
+            found = catalog.names.find(term)
+            return found if indices is None else sorted(set(found).intersection(indices))
+        if col == 'file_path':
+            return self._filter_path(term, indices)
+        if col in ('extension', 'resolution', 'video_codec'):
+            pool = catalog.pool(col)
+            codes = pool.matching_codes(lambda value: term in value.lower())
+            return self._scan(indices, lambda i: pool.codes[i] in codes)
+        if col == 'hash':
+            hashes = catalog.hashes
+            return self._scan(indices, lambda i: term in hashes[i])
+        row = catalog.row
+        return self._scan(indices, lambda i: term in str(getattr(row(i), col)).lower())
+
+    def _filter_path(self, term, indices):
+        # Trecho dentro do diretório, dentro do nome, ou atravessando a fronteira entre os dois
+        catalog = self.catalog
+        dirs = catalog.dirs
+        in_dir = dirs.matching_codes(lambda value: term in value.lower())
+        spanning = {}
+        for code, value in enumerate(dirs.values):
+            lowered = value.lower()
+            for cut in range(1, len(term)):
+                if lowered.endswith(term[:cut]):
+                    spanning.setdefault(code, []).append(term[cut:])
+        in_name = set(catalog.names.find(term))
+        lower_at = catalog.names.lower_at
+        codes = dirs.codes
+
+        def predicate(i):
+            code = codes[i]
+            if code in in_dir or i in in_name:
+                return True
+            rests = spanning.get(code)
+            return bool(rests) and any(lower_at(i).startswith(rest) for rest in rests)
+        return self._scan(indices, predicate)
+
+    def stats(self, conn):
+        # A ordem já sai junto com a contagem, para a primeira página aparecer ordenada
+        indices = self.matches()
+        if self.sort_keys:
+            self.rowids(conn)
+        if not self.filters:
+            return self.catalog.totals
+        return self.catalog.aggregate(indices, self.check)
+
+    def breakdown(self, conn):
+        catalog = self.catalog
+        if not self.filters and catalog.full_breakdown is not None:
+            return catalog.full_breakdown
+        indices = self.matches()
+        sizes = list(map(catalog.summable('size_mb').__getitem__, indices))
+        durations = list(map(catalog.summable('duration_seconds').__getitem__, indices))
+        breakdown = {}
+        for col in BREAKDOWN_COLUMNS:
+            self.check()
+            pool = catalog.pool(col)
+            keys = list(map(pool.codes.__getitem__, indices))
+            counts = Counter(keys)
+            size_totals, duration_totals = defaultdict(float), defaultdict(float)
+            for key, size, duration in zip(keys, sizes, durations):
+                size_totals[key] += size
+                duration_totals[key] += duration
+            top = sorted(counts.items(), key=lambda item: (-item[1], pool.values[item[0]]))[:BREAKDOWN_LIMIT]
+            breakdown[col] = [(pool.values[code], count, size_totals[code], duration_totals[code]) for code, count in top]
+        if not self.filters:
+            catalog.full_breakdown = breakdown
+        return breakdown
+
+    def rowids(self, conn):
+        # Ordenação estável em várias passadas, da chave menos para a mais significativa. Empates ficam
+        # na ordem de file_id, decrescente se a chave principal for, como no order_clause do SQL
+        if self.ordered is None:
+            ordered = list(self.matches())
+            if self.sort_keys and self.sort_keys[0][1]:
+                ordered.reverse()
+            for col, reverse in reversed(self.sort_keys):
+                self.check()
+                rank = self.catalog.rank(col)
+                ordered.sort(key=rank.__getitem__, reverse=reverse)
+            self.ordered = array('I', ordered)
+        return self.ordered
+
+class ColumnarSource:
+    # Fonte do VirtualTable sobre o catálogo em memória; usa a ordem completa assim que o runner a entrega
+    def __init__(self, query):
+        self.query = query
+        self.ordered_ids = query.ordered
+
+    def count(self):
+        return len(self.query.matches())
+
+    def rows(self, start, stop):
+        indices = self.ordered_ids if self.ordered_ids is not None else self.query.matches()
+        catalog = self.query.catalog
+        return [format_row(catalog.row(i)) for i in indices[start:stop]]
+
+COLUMNS = ['name', 'extension', 'file_path', 'size_mb', 'duration_seconds', 'resolution', 'fps',
+           'video_codec', 'bitrate_total_kbps', 'modified_at', 'hash']
+
+def format_row(row):
+    return row.values(COLUMNS)
@@ -0,0 +1,175 @@
+import sqlite3
+import threading
+import queue
+import time
+
+from schema import split_path, hash_to_blob
+
+METADATA_COLUMNS = ['duration_seconds', 'resolution', 'fps', 'video_codec', 'bitrate_total_kbps']
+
+def record_to_row(data, dir_id, name):
+    row = {
+        'dir_id': dir_id,
+        'name': name,
+        'extension': data['extension'],
+        'size_bytes': data['size_bytes'],
+        'mtime_ns': data['mtime_ns'],
+        'inode': data['inode'],
+        'device': data['device']
+    }
+    if 'hash' in data:
+        row['hash'] = hash_to_blob(data['hash'])
+        row['hash_algo'] = data['hash_algo']
+        row['hash_layout'] = data['hash_layout']
+    if 'metadata' in data:
+        for col in METADATA_COLUMNS:
+            row[col] = data['metadata'].get(col)
+    return row
+
+def upsert_sql(columns):
+    placeholders = ', '.join(['?'] * len(columns))
+    updates = [f'{col} = excluded.{col}' for col in columns if col not in ('dir_id', 'name')]
+    if 'hash' in columns:
+        # Hash novo (conteúdo mudou ou outro algoritmo): a verificação do scrub era do conteúdo antigo,
+        # o arquivo volta para o início da fila
+        updates.append('last_verified = CASE WHEN files.hash IS excluded.hash THEN files.last_verified END')
+    updates = ', '.join(updates)
+    return (f'INSERT INTO files ({", ".join(columns)}) VALUES ({placeholders}) '
+            f'ON CONFLICT(dir_id, name) DO UPDATE SET {updates}')
+
+def directory_ids(conn, paths):
+    # Diretórios do lote -> id, criando os que ainda não existem
+    paths = sorted(set(paths))
+    conn.executemany('INSERT OR IGNORE INTO directories (path) VALUES (?)', [(path,) for path in paths])
+    return {path: conn.execute('SELECT id FROM directories WHERE path = ?', (path,)).fetchone()[0] for path in paths}
+
+def upsert_records(conn, records):
+    # Agrupa por conjunto de colunas: etapa 1 grava metadados, etapa 2 grava hash
+    parts = [split_path(data['file_path']) for data in records]
+    dir_ids = directory_ids(conn, [directory for directory, _ in parts])
+    groups = {}
+    for data, (directory, name) in zip(records, parts):
+        row = record_to_row(data, dir_ids[directory], name)
+        groups.setdefault(tuple(row.keys()), []).append(tuple(row.values()))
+    for columns, rows in groups.items():
+        conn.executemany(upsert_sql(columns), rows)
+
+def connect_writer(db_path):
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+class DBWriter(threading.Thread):
+    def __init__(self, db_path, log, batch_size=500, flush_interval=1.0, max_queue=10000, metrics=None, job=None,
+                 on_commit=None):
+        super().__init__(daemon=True)
+        self.metrics = metrics
+        # Com um job, a fila também leva os eventos de checkpoint (tuplas), gravados no lote dos registros
+        self.job = job
+        # on_commit recebe os eventos ('processed', caminho, falhou) do lote depois que ele foi gravado
+        self.on_commit = on_commit
+        self.db_path = db_path
+        self.log = log
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.rows_written = 0
+        self.batches = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+        self.commit_time_total = 0.0
+        self.commit_time_max = 0.0
+
+    def put(self, data):
+        self.queue.put(data)
+        depth = self.queue.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+
+    def close(self):
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        conn = connect_writer(self.db_path)
+        pending = []
+        last_flush = time.monotonic()
+        try:
+            while True:
+                timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+                try:
+                    data = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    data = False
+                if data is None:
+                    break
+                if data:
+                    pending.append(data)
+                if len(pending) >= self.batch_size or time.monotonic() - last_flush >= self.flush_interval:
+                    self.flush(conn, pending)
+                    pending = []
+                    last_flush = time.monotonic()
+            self.flush(conn, pending)
+        finally:
+            conn.close()
+
+    def flush(self, conn, pending):
+        if not pending:
+            return
+        start = time.perf_counter()
+        errors = self.errors
+        unsaved = set()
+        events = [item for item in pending if not isinstance(item, dict)]
+        pending = [item for item in pending if isinstance(item, dict)]
+        processed = [event for event in events if event[0] == 'processed']
+        events = [event for event in events if event[0] != 'processed']
+        try:
+            with conn:
+                upsert_records(conn, pending)
+                if events:
+                    self.job.save(conn, events)
+            self.rows_written += len(pending)
+        except sqlite3.Error as e:
+            self.log(f"Erro ao salvar lote de {len(pending)} registros no DB: {e}\n")
+            # Regrava um a um para não perder o lote inteiro por causa de um registro
+            for data in pending:
+                try:
+                    with conn:
+                        upsert_records(conn, [data])
+                    self.rows_written += 1
+                except sqlite3.Error as e:
+                    self.errors += 1
+                    unsaved.add(data.get('file_path'))
+                    self.log(f"Erro ao salvar {data.get('file_path')} no DB: {e}\n")
+            if events:
+                try:
+                    with conn:
+                        self.job.save(conn, events)
+                except sqlite3.Error as e:
+                    self.errors += 1
+                    self.log(f"Erro ao gravar o checkpoint do job: {e}\n")
+        if processed and self.on_commit:
+            self.on_commit([(kind, path, failed or path in unsaved) for kind, path, failed in processed])
+        elapsed = time.perf_counter() - start
+        self.batches += 1
+        self.commit_time_total += elapsed
+        self.commit_time_max = max(self.commit_time_max, elapsed)
+        if self.metrics:
+            self.metrics.observe('db_commit', elapsed, items=len(pending), error=self.errors > errors)
+
+    def stats(self):
+        return {
+            'rows_written': self.rows_written,
+            'batches': self.batches,
+            'errors': self.errors,
+            'max_queue_depth': self.max_queue_depth,
+            'commit_time_avg_ms': round(self.commit_time_total / self.batches * 1000, 2) if self.batches else 0,
+            'commit_time_max_ms': round(self.commit_time_max * 1000, 2)
+        }
+
+    def report(self):
+        s = self.stats()
+        self.log(f"Gravação no DB: {s['rows_written']} registros em {s['batches']} lotes, "
+                 f"fila máxima {s['max_queue_depth']}, commit médio {s['commit_time_avg_ms']} ms, "
+                 f"commit máximo {s['commit_time_max_ms']} ms, erros {s['errors']}\n")
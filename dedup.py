@@ -0,0 +1,132 @@
+import os
+import sqlite3
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from catalog_index import path_range, under_root
+from hashing import Hasher, DEFAULT_SAMPLE_BYTES
+
+def ensure_dedup_tables(conn):
+    # Os índices de files por tamanho e hash fazem parte do esquema (schema.INDEXES)
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS duplicate_groups (
+            group_id INTEGER PRIMARY KEY,
+            size_bytes INTEGER NOT NULL,
+            full_hash TEXT NOT NULL,
+            hash_algo TEXT NOT NULL,
+            file_count INTEGER NOT NULL,
+            wasted_bytes INTEGER NOT NULL,
+            found_at TIMESTAMP
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS duplicate_members (
+            group_id INTEGER NOT NULL REFERENCES duplicate_groups(group_id) ON DELETE CASCADE,
+            file_id INTEGER NOT NULL,
+            file_path TEXT NOT NULL,
+            PRIMARY KEY (group_id, file_id)
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_duplicate_members_file ON duplicate_members(file_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_duplicate_groups_wasted ON duplicate_groups(wasted_bytes)')
+    conn.commit()
+
+def _hash_all(hasher, rows, workers, log):
+    # rows: [(file_id, file_path, size_bytes)] -> {file_id: hash}; arquivos alterados desde o scan são ignorados
+    def work(row):
+        file_id, file_path, size_bytes = row
+        try:
+            if os.stat(file_path).st_size != size_bytes:
+                log(f"Ignorando {file_path} (tamanho mudou desde o último scan)\n")
+                return file_id, None
+            return file_id, hasher.hash_file(file_path)
+        except OSError as e:
+            log(f"Erro ao ler {file_path}: {e}\n")
+            return file_id, None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return {file_id: file_hash for file_id, file_hash in executor.map(work, rows) if file_hash}
+
+def _collisions(rows, key):
+    groups = {}
+    for row in rows:
+        k = key(row)
+        if k is not None:
+            groups.setdefault(k, []).append(row)
+    return [group for group in groups.values() if len(group) > 1]
+
+def find_duplicates(db_path, log, root=None, workers=4, algorithm='sha256', sample_bytes=DEFAULT_SAMPLE_BYTES):
+    sampled = Hasher(algorithm, 'sampled', sample_bytes)
+    full = Hasher(algorithm, 'full')
+
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_dedup_tables(conn)
+        where, params = under_root(root) if root else ('1', ())
+
+        # Camada 1: só arquivos cujo tamanho se repete seguem adiante, sem ler nada do disco
+        c = conn.cursor()
+        c.execute(f'''
+            SELECT file_id, file_path, size_bytes, hash, hash_algo, hash_layout FROM catalog
+            WHERE size_bytes > 0 AND {where} AND size_bytes IN (
+                SELECT size_bytes FROM files WHERE size_bytes > 0 AND {where}
+                GROUP BY size_bytes HAVING COUNT(*) > 1)
+        ''', params * 2)
+        # O catálogo guarda o hash em bytes; aqui ele é comparado com o hexdigest do Hasher
+        candidates = [(file_id, file_path, size_bytes, file_hash.hex() if file_hash else None, hash_algo, hash_layout)
+                      for file_id, file_path, size_bytes, file_hash, hash_algo, hash_layout in c.fetchall()]
+        log(f"Camada 1 (tamanho): {len(candidates)} arquivos com tamanho repetido\n")
+
+        # Camada 2: hash amostrado, reaproveitando o do catálogo quando o algoritmo e o layout batem
+        sampled_hashes = {}
+        to_sample = []
+        for file_id, file_path, size_bytes, file_hash, hash_algo, hash_layout in candidates:
+            if file_hash and hash_algo == algorithm and hash_layout == sampled.layout:
+                sampled_hashes[file_id] = file_hash
+            else:
+                to_sample.append((file_id, file_path, size_bytes))
+        sampled_hashes.update(_hash_all(sampled, to_sample, workers, log))
+        sample_groups = _collisions(candidates, lambda row: (row[2], sampled_hashes[row[0]]) if row[0] in sampled_hashes else None)
+        sample_rows = [row for group in sample_groups for row in group]
+        log(f"Camada 2 (amostra): {len(to_sample)} arquivos lidos, {len(sample_rows)} com amostra repetida\n")
+
+        # Camada 3: hash completo só quando a amostra não cobre o arquivo inteiro
+        full_hashes = {}
+        to_read = []
+        for file_id, file_path, size_bytes, file_hash, hash_algo, hash_layout in sample_rows:
+            if size_bytes <= sample_bytes:
+                full_hashes[file_id] = sampled_hashes[file_id]
+            elif file_hash and hash_algo == algorithm and hash_layout == full.layout:
+                full_hashes[file_id] = file_hash
+            else:
+                to_read.append((file_id, file_path, size_bytes))
+        full_hashes.update(_hash_all(full, to_read, workers, log))
+        confirmed = _collisions(sample_rows, lambda row: (row[2], full_hashes[row[0]]) if row[0] in full_hashes else None)
+        log(f"Camada 3 (completo): {len(to_read)} arquivos lidos por inteiro, {len(confirmed)} grupos confirmados\n")
+
+        found_at = datetime.now().isoformat()
+        with conn:
+            if root:
+                conn.execute('''
+                    DELETE FROM duplicate_groups WHERE group_id IN (
+                        SELECT group_id FROM duplicate_members WHERE file_path >= ? AND file_path < ?)
+                ''', path_range(root))
+                conn.execute('DELETE FROM duplicate_members WHERE group_id NOT IN (SELECT group_id FROM duplicate_groups)')
+            else:
+                conn.execute('DELETE FROM duplicate_members')
+                conn.execute('DELETE FROM duplicate_groups')
+            for group in confirmed:
+                size_bytes = group[0][2]
+                c.execute('''
+                    INSERT INTO duplicate_groups (size_bytes, full_hash, hash_algo, file_count, wasted_bytes, found_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (size_bytes, full_hashes[group[0][0]], algorithm, len(group), size_bytes * (len(group) - 1), found_at))
+                group_id = c.lastrowid
+                c.executemany('INSERT INTO duplicate_members (group_id, file_id, file_path) VALUES (?, ?, ?)',
+                              [(group_id, row[0], row[1]) for row in group])
+        wasted = sum(group[0][2] * (len(group) - 1) for group in confirmed)
+        log(f"Duplicados: {len(confirmed)} grupos, {round(wasted / (1024 ** 2), 2)} MB redundantes\n")
+        return len(confirmed)
+    finally:
+        conn.close()
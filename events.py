@@ -0,0 +1,41 @@
+import threading
+from collections import deque
+
+class EventChannel:
+    # Canal entre os workers do scan e a GUI: as linhas de log vão para um buffer circular que a GUI
+    # esvazia em lotes; o progresso guarda só o estado mais recente. O log completo pode ir para um arquivo
+    def __init__(self, max_pending=20000, log_path=None):
+        self.lines = deque(maxlen=max_pending)
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.latest = None
+        self.finished = False
+        self.log_file = open(log_path, 'a', encoding='utf-8') if log_path else None
+
+    def log(self, message):
+        with self.lock:
+            if len(self.lines) == self.lines.maxlen:
+                self.dropped += 1
+            self.lines.append(message)
+            if self.log_file:
+                self.log_file.write(message)
+
+    def progress(self, stage, done, found, processed, failed, skipped):
+        self.latest = (stage, done, found, processed, failed, skipped)
+
+    def drain(self, limit=1000):
+        # Até limit linhas pendentes, e quantas se perderam desde a última chamada porque a GUI ficou para trás
+        with self.lock:
+            batch = [self.lines.popleft() for _ in range(min(limit, len(self.lines)))]
+            dropped, self.dropped = self.dropped, 0
+        return batch, dropped
+
+    def pending(self):
+        return bool(self.lines)
+
+    def finish(self):
+        with self.lock:
+            self.finished = True
+            if self.log_file:
+                self.log_file.close()
+                self.log_file = None
@@ -0,0 +1,178 @@
+import json
+import os
+import time
+
+from probe import ProbeExecutor
+
+try:
+    from pymediainfo import MediaInfo
+except ImportError:
+    MediaInfo = None
+
+BACKENDS = ['auto', 'mediainfo', 'ffprobe', 'stub']
+
+# Nomes de formato do MediaInfo convertidos para o codec_name do ffprobe,
+# para que o catálogo fique igual seja qual for o backend
+MEDIAINFO_CODECS = {
+    'avc': 'h264',
+    'hevc': 'hevc',
+    'mpeg-4 visual': 'mpeg4',
+    'mpeg video': 'mpeg2video',
+    'vp8': 'vp8',
+    'vp9': 'vp9',
+    'av1': 'av1',
+    'vc-1': 'vc1',
+    'prores': 'prores',
+    'theora': 'theora',
+    'wmv3': 'wmv3',
+    'h.263': 'h263'
+}
+
+def is_complete(metadata):
+    return bool(metadata.get('duration_seconds') and metadata.get('resolution') and metadata.get('video_codec'))
+
+def filled(metadata):
+    return sum(1 for value in metadata.values() if value)
+
+class FFprobeExtractor:
+    name = 'ffprobe'
+
+    def __init__(self, ffprobe_path, concurrency=4, timeout=60):
+        self.executor = ProbeExecutor(ffprobe_path, concurrency, timeout)
+
+    def extract(self, file_path):
+        return self.executor.probe(file_path)
+
+    def close(self):
+        self.executor.close()
+
+    def report(self, log):
+        if self.executor.killed:
+            log(f"ffprobe: {self.executor.killed} processos encerrados por timeout, {self.executor.retried} novas tentativas\n")
+
+class MediaInfoExtractor:
+    name = 'mediainfo'
+
+    def __init__(self, parse_speed=0.5):
+        if MediaInfo is None or not MediaInfo.can_parse():
+            raise RuntimeError("pymediainfo/libmediainfo não disponível")
+        self.parse_speed = parse_speed
+
+    def extract(self, file_path):
+        try:
+            info = MediaInfo.parse(file_path, parse_speed=self.parse_speed)
+        except Exception as e:
+            return {"error": f"Erro no MediaInfo: {e}"}
+
+        extracted = {}
+        general = next((track for track in info.tracks if track.track_type == 'General'), None)
+        video = next((track for track in info.tracks if track.track_type == 'Video'), None)
+        if video:
+            if video.width and video.height:
+                extracted['resolution'] = f"{video.width}x{video.height}"
+            if video.frame_rate:
+                try:
+                    extracted['fps'] = float(video.frame_rate)
+                except ValueError:
+                    extracted['fps'] = 0
+            if video.format:
+                extracted['video_codec'] = MEDIAINFO_CODECS.get(video.format.lower(), video.format.lower())
+        if general:
+            if general.duration:
+                try:
+                    extracted['duration_seconds'] = float(general.duration) / 1000
+                except ValueError:
+                    extracted['duration_seconds'] = 0
+            if general.overall_bit_rate:
+                try:
+                    extracted['bitrate_total_kbps'] = int(float(general.overall_bit_rate)) // 1000
+                except ValueError:
+                    extracted['bitrate_total_kbps'] = 0
+
+        return extracted if extracted else {"error": "Nenhum metadado relevante encontrado"}
+
+    def close(self):
+        pass
+
+    def report(self, log):
+        pass
+
+class StubExtractor:
+    name = 'stub'
+
+    DEFAULT = {
+        'duration_seconds': 60.0,
+        'resolution': '1920x1080',
+        'fps': 30.0,
+        'video_codec': 'h264',
+        'bitrate_total_kbps': 5000
+    }
+
+    def __init__(self, mapping_path=None, latency=0.0):
+        # mapping_path: JSON {nome do arquivo: metadados}; arquivos ausentes recebem DEFAULT
+        self.mapping = {}
+        if mapping_path:
+            with open(mapping_path, encoding='utf-8') as f:
+                self.mapping = json.load(f)
+        self.latency = latency
+
+    def extract(self, file_path):
+        if self.latency:
+            time.sleep(self.latency)
+        return dict(self.mapping.get(os.path.basename(file_path), self.DEFAULT))
+
+    def close(self):
+        pass
+
+    def report(self, log):
+        pass
+
+class ChainExtractor:
+    def __init__(self, extractors):
+        self.extractors = extractors
+        self.name = '+'.join(extractor.name for extractor in extractors)
+        self.fallbacks = 0
+
+    def extract(self, file_path):
+        # Usa o próximo backend quando o anterior falha ou devolve metadados incompletos; se nenhum
+        # completa, fica o resultado parcial com mais campos, e o erro só quando todos falham
+        result = {"error": "Nenhum extrator configurado"}
+        best = None
+        for i, extractor in enumerate(self.extractors):
+            if i:
+                self.fallbacks += 1
+            result = extractor.extract(file_path)
+            if result.get('error'):
+                continue
+            if is_complete(result):
+                return result
+            if best is None or filled(result) > filled(best):
+                best = result
+        return best or result
+
+    def close(self):
+        for extractor in self.extractors:
+            extractor.close()
+
+    def report(self, log):
+        if self.fallbacks:
+            log(f"Metadados: {self.fallbacks} arquivos usaram o extrator de reserva\n")
+        for extractor in self.extractors:
+            extractor.report(log)
+
+def build_extractor(backend, ffprobe_path, probe_workers=4, probe_timeout=60, stub_path=None, log=None):
+    if backend == 'stub':
+        return StubExtractor(stub_path)
+    if backend == 'ffprobe':
+        return FFprobeExtractor(ffprobe_path, probe_workers, probe_timeout)
+    try:
+        mediainfo = MediaInfoExtractor()
+    except RuntimeError as e:
+        if backend == 'mediainfo':
+            raise
+        if log:
+            log(f"{e}; usando apenas ffprobe\n")
+        return FFprobeExtractor(ffprobe_path, probe_workers, probe_timeout)
+    if backend == 'mediainfo':
+        return mediainfo
+    return ChainExtractor([mediainfo, FFprobeExtractor(ffprobe_path, probe_workers, probe_timeout)])
@@ -0,0 +1,101 @@
+import hashlib
+import mmap
+import os
+import threading
+
+ALGORITHMS = ['sha256', 'blake2b', 'sha1', 'md5']
+MODES = ['sampled', 'full']
+DEFAULT_SAMPLE_BYTES = 2 * 1024 * 1024
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+# Layout dos hashes gravados antes da escolha de algoritmo: SHA-256 do início + meio do arquivo
+LEGACY_ALGORITHM = 'sha256'
+LEGACY_LAYOUT = f'head-mid:{DEFAULT_SAMPLE_BYTES}'
+
+_buffers = threading.local()
+
+def thread_buffer(size):
+    # Um buffer por thread, reaproveitado entre arquivos em vez de alocar bytes a cada leitura
+    view = getattr(_buffers, 'view', None)
+    if view is None or len(view) != size:
+        _buffers.view = view = memoryview(bytearray(size))
+    return view
+
+class Hasher:
+    def __init__(self, algorithm='sha256', mode='sampled', sample_bytes=DEFAULT_SAMPLE_BYTES,
+                 buffer_size=DEFAULT_BUFFER_SIZE, use_mmap=False, throttle=None):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Algoritmo de hash não suportado: {algorithm}")
+        if mode not in MODES:
+            raise ValueError(f"Modo de hash não suportado: {mode}")
+        self.algorithm = algorithm
+        self.mode = mode
+        self.sample_bytes = sample_bytes
+        self.buffer_size = buffer_size
+        self.use_mmap = use_mmap
+        # throttle(n): chamado antes de cada leitura de até n bytes (limite de banda do scrub)
+        self.throttle = throttle
+
+    @property
+    def layout(self):
+        return 'full' if self.mode == 'full' else f'head-mid:{self.sample_bytes}'
+
+    def ranges(self, file_size):
+        if self.mode == 'full':
+            return [(0, file_size)]
+        ranges = [(0, min(self.sample_bytes, file_size))]
+        if file_size > self.sample_bytes * 2:
+            ranges.append((file_size // 2, self.sample_bytes))
+        return ranges
+
+    def read_size(self, file_size):
+        # Bytes efetivamente lidos para um arquivo deste tamanho
+        return sum(max(0, min(length, file_size - offset)) for offset, length in self.ranges(file_size))
+
+    def hash_file(self, file_path):
+        digest = hashlib.new(self.algorithm)
+        with open(file_path, "rb") as f:
+            file_size = os.fstat(f.fileno()).st_size
+            ranges = self.ranges(file_size)
+            if self.use_mmap and file_size > 0:
+                self._update_mmap(digest, f, ranges)
+            else:
+                self._update_readinto(digest, f, ranges)
+        return digest.hexdigest()
+
+    def _update_readinto(self, digest, f, ranges):
+        view = thread_buffer(self.buffer_size)
+        for offset, length in ranges:
+            f.seek(offset)
+            remaining = length
+            while remaining > 0:
+                if self.throttle:
+                    self.throttle(min(remaining, len(view)))
+                n = f.readinto(view[:min(remaining, len(view))])
+                if not n:
+                    break
+                digest.update(view[:n])
+                remaining -= n
+
+    def _update_mmap(self, digest, f, ranges):
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                for offset, length in ranges:
+                    end = min(offset + length, len(view))
+                    for start in range(offset, end, self.buffer_size):
+                        if self.throttle:
+                            self.throttle(min(self.buffer_size, end - start))
+                        digest.update(view[start:min(start + self.buffer_size, end)])
+
+def hasher_for(algorithm, layout, throttle=None):
+    # Hasher que reproduz um hash gravado a partir do algoritmo e do layout da linha; None se desconhecidos
+    if algorithm not in ALGORITHMS or not layout:
+        return None
+    if layout == 'full':
+        return Hasher(algorithm, 'full', throttle=throttle)
+    kind, _, sample_bytes = layout.partition(':')
+    if kind != 'head-mid' or not sample_bytes.isdigit():
+        return None
+    return Hasher(algorithm, 'sampled', int(sample_bytes), throttle=throttle)
+
+default_hasher = Hasher()
@@ -0,0 +1,115 @@
+import os
+import sys
+import queue
+import threading
+import time
+
+END = object()
+
+def is_rotational(device):
+    # Só no Linux dá para saber pelo sysfs se o dispositivo é um disco giratório
+    if not sys.platform.startswith('linux'):
+        return None
+    base = f'/sys/dev/block/{os.major(device)}:{os.minor(device)}'
+    for path in (f'{base}/queue/rotational', f'{base}/../queue/rotational'):
+        try:
+            with open(path) as f:
+                return f.read().strip() == '1'
+        except OSError:
+            continue
+    return None
+
+def device_label(device):
+    if device is None:
+        return 'único'
+    if hasattr(os, 'major'):
+        return f'{os.major(device)}:{os.minor(device)}'
+    return str(device)
+
+class Lane:
+    def __init__(self, key, handler, on_exit, limit, max_limit, adaptive, window=2.0):
+        self.key = key
+        self.handler = handler
+        self.on_exit = on_exit
+        self.limit = limit
+        self.max_limit = max(limit, max_limit)
+        self.adaptive = adaptive
+        self.window = window
+        self.threads = self.max_limit if adaptive else limit
+        self.queue = queue.Queue(maxsize=self.threads * 4)
+        self.cond = threading.Condition()
+        self.active = 0
+        self.completed = 0
+        self.direction = 1
+        self.last_rate = None
+        self.window_start = time.monotonic()
+        self.window_completed = 0
+
+    def start(self):
+        for _ in range(self.threads):
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def put(self, item):
+        self.queue.put(item)
+
+    def close(self):
+        for _ in range(self.threads):
+            self.queue.put(END)
+
+    def _run(self):
+        try:
+            while True:
+                item = self.queue.get()
+                if item is END:
+                    break
+                with self.cond:
+                    while self.active >= self.limit:
+                        self.cond.wait()
+                    self.active += 1
+                try:
+                    self.handler(item)
+                finally:
+                    with self.cond:
+                        self.active -= 1
+                        self.completed += 1
+                        self.window_completed += 1
+                        if self.adaptive:
+                            self._adapt()
+                        self.cond.notify_all()
+        finally:
+            self.on_exit()
+
+    def _adapt(self):
+        # Subida de encosta simples: mantém a direção enquanto a vazão não cair mais de 5%
+        elapsed = time.monotonic() - self.window_start
+        if elapsed < self.window:
+            return
+        rate = self.window_completed / elapsed
+        if self.last_rate is not None and rate < self.last_rate * 0.95:
+            self.direction = -self.direction
+        self.limit = max(1, min(self.max_limit, self.limit + self.direction))
+        self.last_rate = rate
+        self.window_start = time.monotonic()
+        self.window_completed = 0
+
+class DeviceScheduler:
+    def __init__(self, workers=6, limits=None, adaptive=False, max_limit=None, per_device=True, hdd_limit=2):
+        self.workers = workers
+        self.limits = limits or {}
+        self.adaptive = adaptive
+        self.max_limit = max_limit or workers * 2
+        self.per_device = per_device
+        self.hdd_limit = hdd_limit
+
+    def lane_key(self, device):
+        return device if self.per_device else None
+
+    def limit_for(self, key):
+        if key in self.limits:
+            return self.limits[key]
+        if key is not None and is_rotational(key):
+            return min(self.hdd_limit, self.workers)
+        return self.workers
+
+    def create_lane(self, key, handler, on_exit):
+        return Lane(key, handler, on_exit, self.limit_for(key), self.max_limit, self.adaptive)
@@ -0,0 +1,210 @@
+import json
+import sqlite3
+import time
+
+# Estados de cada arquivo no job. hashed é o estado final: em todas as etapas o hash é a última coisa feita
+PENDING = 'pending'
+PROBED = 'probed'
+HASHED = 'hashed'
+FAILED = 'failed'
+
+RUNNING = 'running'
+INTERRUPTED = 'interrupted'
+DONE = 'done'
+
+# Um estado de falha não é sobrescrito pela etapa seguinte do mesmo scan (etapa 1: metadados, depois hash)
+STATE_SQL = '''
+    INSERT INTO scan_job_files (job_id, path, state, reason) VALUES (?, ?, ?, ?)
+    ON CONFLICT(job_id, path) DO UPDATE SET state = excluded.state, reason = excluded.reason
+    WHERE scan_job_files.state != 'failed'
+'''
+
+def ensure_job_tables(conn):
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS scan_jobs (
+            job_id INTEGER PRIMARY KEY,
+            root TEXT NOT NULL,
+            options TEXT NOT NULL,
+            status TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            files_done INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    # Cursor da descoberta: diretórios já vistos e se já foram listados. Como cada listagem grava os
+    # subdiretórios e os vídeos encontrados na mesma transação, os não listados são onde o walk recomeça
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS scan_job_dirs (
+            job_id INTEGER NOT NULL REFERENCES scan_jobs(job_id) ON DELETE CASCADE,
+            path TEXT NOT NULL,
+            listed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (job_id, path)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS scan_job_files (
+            job_id INTEGER NOT NULL REFERENCES scan_jobs(job_id) ON DELETE CASCADE,
+            path TEXT NOT NULL,
+            state TEXT NOT NULL,
+            reason TEXT,
+            PRIMARY KEY (job_id, path)
+        ) WITHOUT ROWID
+    ''')
+    conn.commit()
+
+class ScanJob:
+    # Estado persistente de um process_folder. Durante o scan os eventos (diretório listado, estado de
+    # arquivo) passam pela fila do DBWriter e são gravados no mesmo lote e na mesma ordem dos registros
+    # de files: o checkpoint não custa transações extras e nunca marca um arquivo antes do seu registro
+    def __init__(self, job_id, root, options, status):
+        self.job_id = job_id
+        self.root = root
+        self.options = options
+        self.status = status
+        self.sink = None
+
+    @classmethod
+    def create(cls, db_path, root, options):
+        now = time.time()
+        conn = sqlite3.connect(db_path)
+        try:
+            ensure_job_tables(conn)
+            with conn:
+                c = conn.execute('INSERT INTO scan_jobs (root, options, status, created_at, updated_at) '
+                                 'VALUES (?, ?, ?, ?, ?)', (root, json.dumps(options), RUNNING, now, now))
+                job_id = c.lastrowid
+                conn.execute('INSERT INTO scan_job_dirs (job_id, path) VALUES (?, ?)', (job_id, root))
+        finally:
+            conn.close()
+        return cls(job_id, root, options, RUNNING)
+
+    @classmethod
+    def load(cls, db_path, job_id):
+        conn = sqlite3.connect(db_path)
+        try:
+            ensure_job_tables(conn)
+            row = conn.execute('SELECT root, options, status FROM scan_jobs WHERE job_id = ?', (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        root, options, status = row
+        return cls(job_id, root, json.loads(options), status)
+
+    def attach(self, sink):
+        self.sink = sink
+
+    def listed(self, directory, subdirs, videos):
+        self.sink(('listed', directory, subdirs, videos))
+
+    def set_state(self, file_path, state, reason=None):
+        self.sink(('state', file_path, state, reason))
+
+    def save(self, conn, events):
+        # Chamado pelo DBWriter dentro da transação do lote
+        dirs, listed, found, states = [], [], [], []
+        for event in events:
+            if event[0] == 'listed':
+                _, directory, subdirs, videos = event
+                listed.append((self.job_id, directory))
+                dirs.extend((self.job_id, path) for path in subdirs)
+                found.extend((self.job_id, path) for path in videos)
+            else:
+                _, file_path, state, reason = event
+                states.append((self.job_id, file_path, state, reason))
+        conn.executemany('INSERT OR IGNORE INTO scan_job_dirs (job_id, path) VALUES (?, ?)', dirs)
+        # Um ponto de montagem pode ser listado pelo seu walker antes de o pai registrá-lo
+        conn.executemany('INSERT INTO scan_job_dirs (job_id, path, listed) VALUES (?, ?, 1) '
+                         'ON CONFLICT(job_id, path) DO UPDATE SET listed = 1', listed)
+        conn.executemany(f"INSERT OR IGNORE INTO scan_job_files (job_id, path, state) VALUES (?, ?, '{PENDING}')", found)
+        conn.executemany(STATE_SQL, states)
+        conn.execute('UPDATE scan_jobs SET updated_at = ? WHERE job_id = ?', (time.time(), self.job_id))
+
+    def pending(self, db_path):
+        # Onde o scan recomeça: diretórios ainda não listados e arquivos descobertos sem estado final.
+        # Arquivos em probed voltam ao primeiro estágio, que pula os metadados já gravados no catálogo
+        conn = sqlite3.connect(db_path)
+        try:
+            dirs = [row[0] for row in conn.execute(
+                'SELECT path FROM scan_job_dirs WHERE job_id = ? AND listed = 0', (self.job_id,))]
+            files = [row[0] for row in conn.execute(
+                'SELECT path FROM scan_job_files WHERE job_id = ? AND state IN (?, ?)', (self.job_id, PENDING, PROBED))]
+        finally:
+            conn.close()
+        return dirs, files
+
+    def retry_failed(self, db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            with conn:
+                count = conn.execute('UPDATE scan_job_files SET state = ?, reason = NULL WHERE job_id = ? AND state = ?',
+                                     (PENDING, self.job_id, FAILED)).rowcount
+        finally:
+            conn.close()
+        return count
+
+    def begin(self, db_path):
+        self._set_status(db_path, RUNNING)
+
+    def finish(self, db_path, completed):
+        # Job concluído: o cursor e os arquivos terminados são descartados, ficam só as falhas (para --retry-failed)
+        if not completed:
+            self._set_status(db_path, INTERRUPTED)
+            return
+        conn = sqlite3.connect(db_path)
+        try:
+            with conn:
+                done = conn.execute('SELECT COUNT(*) FROM scan_job_files WHERE job_id = ? AND state = ?',
+                                    (self.job_id, HASHED)).fetchone()[0]
+                conn.execute('DELETE FROM scan_job_dirs WHERE job_id = ?', (self.job_id,))
+                conn.execute('DELETE FROM scan_job_files WHERE job_id = ? AND state = ?', (self.job_id, HASHED))
+                conn.execute('UPDATE scan_jobs SET status = ?, updated_at = ?, files_done = files_done + ? '
+                             'WHERE job_id = ?', (DONE, time.time(), done, self.job_id))
+        finally:
+            conn.close()
+        self.status = DONE
+
+    def _set_status(self, db_path, status):
+        conn = sqlite3.connect(db_path)
+        try:
+            with conn:
+                conn.execute('UPDATE scan_jobs SET status = ?, updated_at = ? WHERE job_id = ?',
+                             (status, time.time(), self.job_id))
+        finally:
+            conn.close()
+        self.status = status
+
+def list_jobs(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_job_tables(conn)
+        return conn.execute(f'''
+            SELECT j.job_id, j.root, j.status, j.created_at, j.updated_at,
+                   j.files_done + COUNT(f.path) FILTER (WHERE f.state = '{HASHED}'),
+                   COUNT(f.path) FILTER (WHERE f.state IN ('{PENDING}', '{PROBED}')),
+                   COUNT(f.path) FILTER (WHERE f.state = '{FAILED}')
+            FROM scan_jobs j LEFT JOIN scan_job_files f ON f.job_id = j.job_id
+            GROUP BY j.job_id ORDER BY j.job_id
+        ''').fetchall()
+    finally:
+        conn.close()
+
+def failed_files(db_path, job_id):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT path, reason FROM scan_job_files WHERE job_id = ? AND state = ? ORDER BY path',
+                            (job_id, FAILED)).fetchall()
+    finally:
+        conn.close()
+
+def unfinished_job(db_path, root):
+    # Job mais recente da mesma pasta que não chegou ao fim (queda, reboot ou interrupção)
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_job_tables(conn)
+        row = conn.execute('SELECT job_id FROM scan_jobs WHERE root = ? AND status != ? ORDER BY job_id DESC LIMIT 1',
+                           (root, DONE)).fetchone()
+    finally:
+        conn.close()
+    return ScanJob.load(db_path, row[0]) if row else None
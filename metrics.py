@@ -0,0 +1,214 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+# Limites (em segundos) dos baldes de latência, no estilo dos histogramas do Prometheus
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Estágios instrumentados no scan, na ordem em que aparecem nos relatórios
+STAGES = ['catalog_load', 'walk', 'hash', 'metadata', 'db_enqueue', 'db_commit']
+
+def untimed(stage, func, *args, bytes_read=0, failed=None, **kwargs):
+    # Mesma assinatura de ScanMetrics.timed, para o caminho quente não testar a cada chamada se há métricas
+    return func(*args, **kwargs)
+
+def missing(result):
+    return result is None
+
+def reported_error(result):
+    return bool(result.get('error'))
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        # Estimativa pelo limite superior do balde onde cai o quantil (a precisão é a dos baldes)
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+class StageMetrics:
+    def __init__(self):
+        self.latency = Histogram()
+        self.items = 0
+        self.bytes = 0
+        self.errors = 0
+
+class ScanMetrics:
+    # Coletor compartilhado pelos walkers, workers e pelo DBWriter. Cada observação custa um perf_counter
+    # e um lock curto; a exportação (JSON no fim, textfile do Prometheus periódico) roda fora do caminho quente
+    def __init__(self, textfile_path=None, interval=5.0):
+        self.stages = {name: StageMetrics() for name in STAGES}
+        self.lock = threading.Lock()
+        self.gauges = {}
+        self.queue_max = {}
+        self.queue_last = {}
+        self.started = time.time()
+        self.finished = None
+        self.textfile_path = textfile_path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def observe(self, stage, seconds, items=1, bytes_read=0, error=False):
+        with self.lock:
+            metrics = self.stages.get(stage)
+            if metrics is None:
+                metrics = self.stages[stage] = StageMetrics()
+            metrics.latency.observe(seconds)
+            metrics.items += items
+            metrics.bytes += bytes_read
+            if error:
+                metrics.errors += 1
+
+    def timed(self, stage, func, *args, bytes_read=0, failed=None, **kwargs):
+        # Executa func medindo a latência; exceção ou failed(resultado) verdadeiro contam como erro do estágio
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.observe(stage, time.perf_counter() - start, error=True)
+            raise
+        error = bool(failed and failed(result))
+        self.observe(stage, time.perf_counter() - start, bytes_read=0 if error else bytes_read, error=error)
+        return result
+
+    def watch_queue(self, name, depth):
+        # depth: função sem argumentos que devolve o tamanho atual da fila; amostrada a cada intervalo
+        self.gauges[name] = depth
+
+    def sample_queues(self):
+        for name, depth in list(self.gauges.items()):
+            try:
+                value = depth()
+            except Exception:
+                continue
+            self.queue_last[name] = value
+            self.queue_max[name] = max(self.queue_max.get(name, 0), value)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.finished = time.time()
+        self.sample_queues()
+        if self.textfile_path:
+            self.write_prometheus(self.textfile_path)
+
+    def _run(self):
+        # Amostra as filas com frequência maior que a da escrita do textfile, para não perder picos
+        next_write = time.monotonic() + self.interval
+        while not self._stop.wait(min(0.25, self.interval)):
+            self.sample_queues()
+            if self.textfile_path and time.monotonic() >= next_write:
+                self.write_prometheus(self.textfile_path)
+                next_write = time.monotonic() + self.interval
+
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+    def summary(self):
+        elapsed = self.elapsed()
+        with self.lock:
+            stages = {}
+            for name, metrics in self.stages.items():
+                if not metrics.latency.count:
+                    continue
+                latency = metrics.latency
+                stages[name] = {
+                    'items': metrics.items,
+                    'errors': metrics.errors,
+                    'bytes': metrics.bytes,
+                    'busy_seconds': round(latency.sum, 4),
+                    'items_per_sec': round(metrics.items / elapsed, 2) if elapsed else 0,
+                    'mb_per_sec': round(metrics.bytes / 1024 ** 2 / elapsed, 2) if elapsed else 0,
+                    'latency_ms': {
+                        'avg': round(latency.sum / latency.count * 1000, 3),
+                        'p50': round(latency.quantile(0.5) * 1000, 3),
+                        'p90': round(latency.quantile(0.9) * 1000, 3),
+                        'p99': round(latency.quantile(0.99) * 1000, 3),
+                        'max': round(latency.max * 1000, 3),
+                    },
+                    'histogram': {'buckets': list(latency.buckets), 'counts': list(latency.counts)},
+                }
+        return {'started': self.started, 'elapsed_seconds': round(elapsed, 3), 'stages': stages,
+                'queues': {name: {'last': self.queue_last.get(name, 0), 'max': self.queue_max.get(name, 0)}
+                           for name in self.gauges}}
+
+    def write_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def prometheus_text(self):
+        lines = []
+        def metric(name, kind, help_text):
+            lines.append(f"# HELP hashculator_{name} {help_text}")
+            lines.append(f"# TYPE hashculator_{name} {kind}")
+        with self.lock:
+            stages = [(name, metrics) for name, metrics in self.stages.items() if metrics.latency.count]
+            metric('stage_latency_seconds', 'histogram', 'Latencia por operacao em cada estagio do scan')
+            for name, metrics in stages:
+                cumulative = 0
+                for bound, count in zip(metrics.latency.buckets, metrics.latency.counts):
+                    cumulative += count
+                    lines.append(f'hashculator_stage_latency_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'hashculator_stage_latency_seconds_bucket{{stage="{name}",le="+Inf"}} {metrics.latency.count}')
+                lines.append(f'hashculator_stage_latency_seconds_sum{{stage="{name}"}} {metrics.latency.sum:.6f}')
+                lines.append(f'hashculator_stage_latency_seconds_count{{stage="{name}"}} {metrics.latency.count}')
+            for key, help_text in (('items', 'Itens processados por estagio'), ('bytes', 'Bytes lidos por estagio'),
+                                   ('errors', 'Erros por estagio')):
+                metric(f'stage_{key}_total', 'counter', help_text)
+                for name, metrics in stages:
+                    lines.append(f'hashculator_stage_{key}_total{{stage="{name}"}} {getattr(metrics, key)}')
+        metric('queue_depth', 'gauge', 'Tamanho da fila na ultima amostra')
+        for name in self.gauges:
+            lines.append(f'hashculator_queue_depth{{queue="{name}"}} {self.queue_last.get(name, 0)}')
+        metric('queue_depth_max', 'gauge', 'Maior tamanho de fila observado no scan')
+        for name in self.gauges:
+            lines.append(f'hashculator_queue_depth_max{{queue="{name}"}} {self.queue_max.get(name, 0)}')
+        metric('scan_start_time_seconds', 'gauge', 'Inicio do scan (epoch)')
+        lines.append(f'hashculator_scan_start_time_seconds {self.started:.3f}')
+        metric('scan_elapsed_seconds', 'gauge', 'Duracao do scan ate a ultima escrita')
+        lines.append(f'hashculator_scan_elapsed_seconds {self.elapsed():.3f}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        # Escrita atômica: o node_exporter nunca lê um arquivo pela metade
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(temp_path, path)
+
+    def report(self, log):
+        summary = self.summary()
+        for name, stage in summary['stages'].items():
+            latency = stage['latency_ms']
+            throughput = f", {stage['mb_per_sec']} MB/s" if stage['bytes'] else ""
+            log(f"Métricas {name}: {stage['items']} itens, {stage['errors']} erros{throughput}, "
+                f"latência média {latency['avg']} ms, p99 {latency['p99']} ms, máxima {latency['max']} ms\n")
+        for name, queue in summary['queues'].items():
+            log(f"Fila {name}: máxima {queue['max']}\n")
@@ -0,0 +1,291 @@
+import sqlite3
+import struct
+import hashlib
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from catalog_index import under_root
+from hashing import thread_buffer
+
+BLOCK_SIZE = 64 * 1024
+ANCHOR_STRIDE = 1024 * 1024
+ANCHOR_BLOCKS = 4
+RELATIVE_BLOCKS = 8
+NUM_PERM = 32
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+# Bandas extras: resolução + duração pegam remuxes com bytes diferentes; o primeiro e o
+# último bloco sozinhos pegam cópias cortadas na outra ponta
+METADATA_BAND = BANDS
+HEAD_BAND = BANDS + 1
+TAIL_BAND = BANDS + 2
+MAX_BUCKET = 200
+# Muda quando block_offsets muda: assinaturas de outra versão são recalculadas pelo build_index
+SIGNATURE_VERSION = 2
+# Sem nenhum bloco em comum os metadados sozinhos não provam nada (episódios de mesma duração e
+# encoder): a nota fica abaixo de qualquer limiar razoável e o par sai como candidato só por metadados
+METADATA_ONLY_WEIGHT = 0.5
+MAX_METADATA_ONLY = 50
+
+_MERSENNE = (1 << 61) - 1
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE), _rng.randrange(0, _MERSENNE)) for _ in range(NUM_PERM)]
+
+def ensure_neardup_tables(conn):
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS near_signatures (
+            file_id INTEGER PRIMARY KEY,
+            size_bytes INTEGER,
+            mtime_ns INTEGER,
+            blocks BLOB,
+            duration_seconds REAL,
+            resolution TEXT,
+            bitrate_total_kbps INTEGER,
+            version INTEGER
+        )
+    ''')
+    if 'version' not in {row[1] for row in c.execute('PRAGMA table_info(near_signatures)')}:
+        c.execute('ALTER TABLE near_signatures ADD COLUMN version INTEGER')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS near_buckets (
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            file_id INTEGER NOT NULL
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_near_buckets ON near_buckets(band, bucket)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_near_buckets_file ON near_buckets(file_id)')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS near_clusters (
+            cluster_id INTEGER NOT NULL,
+            file_id INTEGER NOT NULL,
+            file_path TEXT NOT NULL,
+            score REAL,
+            PRIMARY KEY (cluster_id, file_id)
+        )
+    ''')
+    conn.commit()
+
+def block_offsets(size):
+    # Blocos ancorados no início e no fim (sobrevivem a cortes na outra ponta) e em posições relativas.
+    # Só os do início e os relativos são alinhados a 4 KiB; os do fim ficam a distâncias exatas do EOF,
+    # senão um corte no início que não seja múltiplo de 4 KiB desalinha todos eles
+    last = max(0, size - BLOCK_SIZE)
+    offsets = set()
+    for k in range(ANCHOR_BLOCKS):
+        offsets.add(min(k * ANCHOR_STRIDE, last))
+    for i in range(1, RELATIVE_BLOCKS + 1):
+        offset = min(size * i // (RELATIVE_BLOCKS + 1), last)
+        offsets.add(offset - offset % 4096)
+    for k in range(ANCHOR_BLOCKS):
+        offsets.add(max(0, last - k * ANCHOR_STRIDE))
+    return sorted(offsets)
+
+def block_signature(file_path, size):
+    view = thread_buffer(BLOCK_SIZE)
+    hashes = []
+    with open(file_path, 'rb') as f:
+        for offset in block_offsets(size):
+            f.seek(offset)
+            n = f.readinto(view)
+            if not n:
+                continue
+            digest = hashlib.blake2b(view[:n], digest_size=8).digest()
+            hashes.append(struct.unpack('<q', digest)[0])
+    return hashes
+
+def pack_blocks(hashes):
+    return struct.pack(f'<{len(hashes)}q', *hashes)
+
+def unpack_blocks(blob):
+    return list(struct.unpack(f'<{len(blob) // 8}q', blob)) if blob else []
+
+def minhash(hashes):
+    values = set(h & _MERSENNE for h in hashes)
+    if not values:
+        return []
+    return [min((a * v + b) % _MERSENNE for v in values) for a, b in _PERMUTATIONS]
+
+def _bucket(*parts):
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=8).digest()
+    return struct.unpack('<q', digest)[0]
+
+def lsh_buckets(hashes, duration, resolution):
+    signature = minhash(hashes)
+    buckets = []
+    if signature:
+        for band in range(BANDS):
+            buckets.append((band, _bucket(tuple(signature[band * ROWS:(band + 1) * ROWS]))))
+    if duration and resolution:
+        buckets.append((METADATA_BAND, _bucket(resolution, round(duration))))
+    if hashes:
+        buckets.append((HEAD_BAND, hashes[0]))
+        buckets.append((TAIL_BAND, hashes[-1]))
+    return buckets
+
+def block_jaccard(a, b):
+    blocks_a, blocks_b = set(a['blocks']), set(b['blocks'])
+    return len(blocks_a & blocks_b) / len(blocks_a | blocks_b) if blocks_a and blocks_b else 0
+
+def metadata_score(a, b):
+    parts = []
+    if a['duration_seconds'] and b['duration_seconds']:
+        # Duração igual até ~10 s de diferença (cortes curtos, remux com outro container)
+        parts.append(max(0.0, 1 - abs(a['duration_seconds'] - b['duration_seconds']) / 10))
+    if a['resolution'] and b['resolution']:
+        parts.append(1.0 if a['resolution'] == b['resolution'] else 0.0)
+    if a['bitrate_total_kbps'] and b['bitrate_total_kbps']:
+        parts.append(min(a['bitrate_total_kbps'], b['bitrate_total_kbps']) / max(a['bitrate_total_kbps'], b['bitrate_total_kbps']))
+    return sum(parts) / len(parts) if parts else 0
+
+def similarity(a, b):
+    # Blocos iguais são prova forte; os metadados só reforçam quando há algum bloco em comum
+    jaccard = block_jaccard(a, b)
+    if not jaccard:
+        return METADATA_ONLY_WEIGHT * metadata_score(a, b)
+    return max(jaccard, 0.85 * metadata_score(a, b) + 0.15 * jaccard)
+
+def build_index(db_path, log, root=None, workers=4):
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_neardup_tables(conn)
+        where, params = under_root(root, 'f.dir_id') if root else ('1', ())
+        c = conn.cursor()
+        c.execute(f'''
+            SELECT f.file_id, f.file_path, f.size_bytes, f.mtime_ns,
+                   f.duration_seconds, f.resolution, f.bitrate_total_kbps
+            FROM catalog f LEFT JOIN near_signatures s ON s.file_id = f.file_id
+            WHERE {where} AND (s.file_id IS NULL OR s.size_bytes IS NOT f.size_bytes OR s.mtime_ns IS NOT f.mtime_ns
+                               OR s.version IS NOT ?)
+        ''', tuple(params) + (SIGNATURE_VERSION,))
+        pending = c.fetchall()
+        log(f"Assinaturas a calcular: {len(pending)}\n")
+
+        def work(row):
+            file_id, file_path, size_bytes, mtime_ns, duration, resolution, bitrate = row
+            try:
+                return row, block_signature(file_path, size_bytes or 0)
+            except OSError as e:
+                log(f"Erro ao ler {file_path}: {e}\n")
+                return row, None
+
+        done = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            batch = []
+            for row, hashes in executor.map(work, pending):
+                if hashes is None:
+                    continue
+                batch.append((row, hashes))
+                if len(batch) >= 500:
+                    _store(conn, batch)
+                    done += len(batch)
+                    log(f"Assinaturas gravadas: {done}/{len(pending)}\n")
+                    batch = []
+            _store(conn, batch)
+            done += len(batch)
+        log(f"Índice de quase-duplicados atualizado: {done} assinaturas\n")
+        return done
+    finally:
+        conn.close()
+
+def _store(conn, batch):
+    if not batch:
+        return
+    with conn:
+        file_ids = [(row[0],) for row, _ in batch]
+        conn.executemany('DELETE FROM near_buckets WHERE file_id = ?', file_ids)
+        conn.executemany('''
+            INSERT OR REPLACE INTO near_signatures
+                (file_id, size_bytes, mtime_ns, blocks, duration_seconds, resolution, bitrate_total_kbps, version)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(row[0], row[2], row[3], pack_blocks(hashes), row[4], row[5], row[6], SIGNATURE_VERSION)
+              for row, hashes in batch])
+        conn.executemany('INSERT INTO near_buckets (band, bucket, file_id) VALUES (?, ?, ?)',
+                         [(band, bucket, row[0]) for row, hashes in batch
+                          for band, bucket in lsh_buckets(hashes, row[4], row[5])])
+
+def find_clusters(db_path, log, threshold=0.8):
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_neardup_tables(conn)
+        c = conn.cursor()
+        # Buckets enormes (ex.: mesma resolução e duração redonda) geram pares demais e pouco informativos
+        c.execute('''
+            SELECT DISTINCT a.file_id, b.file_id
+            FROM near_buckets a
+            JOIN near_buckets b ON a.band = b.band AND a.bucket = b.bucket AND a.file_id < b.file_id
+            WHERE (a.band, a.bucket) IN (
+                SELECT band, bucket FROM near_buckets GROUP BY band, bucket HAVING COUNT(*) BETWEEN 2 AND ?)
+        ''', (MAX_BUCKET,))
+        pairs = c.fetchall()
+        log(f"Pares candidatos: {len(pairs)}\n")
+
+        signatures = {}
+        def load(file_id):
+            if file_id not in signatures:
+                row = conn.execute('''
+                    SELECT s.blocks, s.duration_seconds, s.resolution, s.bitrate_total_kbps, f.file_path
+                    FROM near_signatures s JOIN catalog f ON f.file_id = s.file_id WHERE s.file_id = ?
+                ''', (file_id,)).fetchone()
+                signatures[file_id] = row and {
+                    'blocks': unpack_blocks(row[0]), 'duration_seconds': row[1],
+                    'resolution': row[2], 'bitrate_total_kbps': row[3], 'file_path': row[4]}
+            return signatures[file_id]
+
+        parent = {}
+        def find(x):
+            while parent.setdefault(x, x) != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        best = {}
+        metadata_only = []
+        for id_a, id_b in pairs:
+            a, b = load(id_a), load(id_b)
+            if not a or not b:
+                continue
+            if not block_jaccard(a, b):
+                # Possível remux (mesmo conteúdo, bytes diferentes): listado à parte, fora dos grupos
+                metadata = metadata_score(a, b)
+                if metadata >= threshold:
+                    metadata_only.append((a['file_path'], b['file_path'], round(metadata, 4)))
+                continue
+            score = similarity(a, b)
+            if score >= threshold:
+                parent[find(id_a)] = find(id_b)
+                best[id_a] = max(best.get(id_a, 0), score)
+                best[id_b] = max(best.get(id_b, 0), score)
+
+        clusters = {}
+        for file_id in best:
+            clusters.setdefault(find(file_id), []).append(file_id)
+        clusters = sorted(clusters.values(), key=len, reverse=True)
+
+        with conn:
+            conn.execute('DELETE FROM near_clusters')
+            conn.executemany('INSERT INTO near_clusters (cluster_id, file_id, file_path, score) VALUES (?, ?, ?, ?)',
+                             [(cluster_id, file_id, signatures[file_id]['file_path'], round(best[file_id], 4))
+                              for cluster_id, members in enumerate(clusters, 1) for file_id in members])
+        clusters = [[(signatures[file_id]['file_path'], round(best[file_id], 4)) for file_id in members]
+                    for members in clusters]
+        return clusters, sorted(metadata_only, key=lambda pair: -pair[2])
+    finally:
+        conn.close()
+
+def report(db_path, log, threshold=0.8):
+    clusters, metadata_only = find_clusters(db_path, log, threshold)
+    for cluster_id, members in enumerate(clusters, 1):
+        log(f"\nGrupo {cluster_id} ({len(members)} arquivos)\n")
+        for file_path, score in sorted(members, key=lambda m: -m[1]):
+            log(f"  {score:.2f}  {file_path}\n")
+    log(f"\n{len(clusters)} grupos de quase-duplicados (similaridade >= {threshold})\n")
+    if metadata_only:
+        log(f"\n{len(metadata_only)} pares candidatos só por metadados (nenhum bloco em comum; "
+            f"ex.: remux ou episódios de mesma duração):\n")
+        for path_a, path_b, score in metadata_only[:MAX_METADATA_ONLY]:
+            log(f"  {score:.2f}  {path_a}  ~  {path_b}\n")
+        if len(metadata_only) > MAX_METADATA_ONLY:
+            log(f"  ... e mais {len(metadata_only) - MAX_METADATA_ONLY}\n")
+    return len(clusters)
@@ -0,0 +1,245 @@
+import os
+import queue
+import threading
+import time
+
+from io_scheduler import END, device_label
+
+def list_directory(directory, is_video, spawn, device):
+    # Uma listagem: (subdiretórios, pontos de montagem entregues a spawn, vídeos, total de entradas)
+    subdirs = []
+    mounts = []
+    videos = []
+    count = 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            count += 1
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                is_dir = False
+            if is_dir and spawn:
+                try:
+                    mounted = entry.stat(follow_symlinks=False).st_dev != device
+                except OSError:
+                    mounted = False
+                if mounted:
+                    mounts.append(entry.path)
+                    spawn(entry.path)
+                    continue
+            if is_dir:
+                subdirs.append(entry.path)
+            elif is_video(entry.path):
+                videos.append(entry.path)
+    return subdirs, mounts, videos, count
+
+def scan_video_files(root, is_video, log, spawn=None, metrics=None, stack=None, on_listed=None, snapshot=None):
+    # Caminhada iterativa com os.scandir: só um diretório fica aberto por vez.
+    # Subárvores em outro dispositivo (pontos de montagem) são entregues a spawn
+    # para que cada disco tenha seu próprio walker. No Windows o DirEntry não traz
+    # st_dev, então a divisão por dispositivo fica desligada.
+    # Os vídeos de cada diretório são entregues depois da listagem, para que a latência
+    # medida do walk não inclua a espera pelos estágios seguintes.
+    # stack retoma uma caminhada interrompida (diretórios de root ainda não listados); on_listed
+    # recebe cada listagem antes dos vídeos serem entregues, para o checkpoint do job.
+    # Com snapshot, um diretório com o mesmo stat da última listagem não é listado: só os seus
+    # subdiretórios (do snapshot) são visitados, com um stat cada.
+    device = os.stat(root).st_dev
+    if os.name == 'nt':
+        spawn = None
+    stack = list(stack) if stack else [root]
+    while stack:
+        directory = stack.pop()
+        start = time.perf_counter()
+        subdirs, mounts, videos = [], [], []
+        error = False
+        try:
+            stats = os.stat(directory) if snapshot else None
+            if stats and spawn and stats.st_dev != device:
+                # Ponto de montagem vindo do snapshot: tem o seu próprio walker
+                spawn(directory)
+                continue
+            children = snapshot.unchanged(directory, stats) if snapshot else None
+            if children is not None:
+                subdirs = children
+            else:
+                listed_ns = time.time_ns()
+                subdirs, mounts, videos, count = list_directory(directory, is_video, spawn, device)
+                if snapshot:
+                    snapshot.record(directory, stats, count, subdirs + mounts, listed_ns)
+        except OSError as e:
+            error = True
+            log(f"Erro ao listar {directory}: {e}\n")
+        if metrics:
+            metrics.observe('walk', time.perf_counter() - start, items=len(videos), error=error)
+        if on_listed and not error:
+            on_listed(directory, subdirs + mounts, videos)
+        for path in videos:
+            yield path, device
+        stack.extend(reversed(subdirs))
+
+class Stage:
+    def __init__(self, name, func, scheduler):
+        self.name = name
+        self.func = func
+        self.scheduler = scheduler
+        self.next = None
+        self.results = None
+        self.lanes = {}
+        self.processed = 0
+        self.failed = 0
+        self.skipped = 0
+        self._alive = 0
+        self._closing = False
+        self._lock = threading.Lock()
+
+    def start(self, results):
+        self.results = results
+
+    def submit(self, item):
+        key = self.scheduler.lane_key(item[1])
+        lane = self.lanes.get(key)
+        if lane is None:
+            with self._lock:
+                lane = self.lanes.get(key)
+                if lane is None:
+                    lane = self.scheduler.create_lane(key, self._handle, self._worker_exit)
+                    self._alive += lane.threads
+                    self.lanes[key] = lane
+                    lane.start()
+        lane.put(item)
+
+    def close(self):
+        with self._lock:
+            self._closing = True
+            lanes = list(self.lanes.values())
+            finished = self._alive == 0
+        for lane in lanes:
+            lane.close()
+        if finished:
+            self._finish()
+
+    def _worker_exit(self):
+        with self._lock:
+            self._alive -= 1
+            finished = self._closing and self._alive == 0
+        if finished:
+            self._finish()
+
+    def _finish(self):
+        if self.next:
+            self.next.close()
+        else:
+            self.results.put(END)
+
+    def _handle(self, item):
+        file_path = item[0]
+        error = None
+        try:
+            outcome = 'ok' if self.func(file_path) else 'skipped'
+        except Exception as e:
+            outcome = 'failed'
+            error = e
+        self.results.put((self, file_path, outcome, error))
+        if self.next:
+            self.next.submit(item)
+
+def lane_depth(stage):
+    return sum(lane.queue.qsize() for lane in list(stage.lanes.values()))
+
+def run_pipeline(root, stages, is_video, log, maxsize=64, progress=None, metrics=None,
+                 start=None, files=(), on_listed=None, snapshot=None):
+    # As filas limitadas dão contrapressão: os walkers só avançam quando os estágios consomem.
+    # start e files retomam um job: diretórios a listar (em vez de root) e arquivos já descobertos.
+    # files também pode ser um gerador sem fim (modo watch), com start vazio
+    results = queue.Queue(maxsize=maxsize)
+    for stage, next_stage in zip(stages, stages[1:]):
+        stage.next = next_stage
+    for stage in stages:
+        stage.start(results)
+        if metrics:
+            metrics.watch_queue(stage.name, lambda stage=stage: lane_depth(stage))
+    if metrics:
+        metrics.watch_queue('resultados', results.qsize)
+
+    lock = threading.Lock()
+    found = [0]
+    walkers = [0]
+
+    def walk(path, stack=None):
+        try:
+            for item in scan_video_files(path, is_video, log, spawn, metrics, stack, on_listed, snapshot):
+                with lock:
+                    found[0] += 1
+                stages[0].submit(item)
+        except OSError as e:
+            log(f"Erro ao listar {path}: {e}\n")
+        finally:
+            with lock:
+                walkers[0] -= 1
+                last = walkers[0] == 0
+            if last:
+                stages[0].close()
+
+    def feed():
+        # Arquivos pendentes do job; um arquivo que sumiu falha no estágio e fica registrado como falha
+        try:
+            for path in files:
+                try:
+                    device = os.stat(path).st_dev
+                except OSError:
+                    device = None
+                with lock:
+                    found[0] += 1
+                stages[0].submit((path, device))
+        finally:
+            with lock:
+                walkers[0] -= 1
+                last = walkers[0] == 0
+            if last:
+                stages[0].close()
+
+    def spawn(path, stack=None):
+        with lock:
+            walkers[0] += 1
+        threading.Thread(target=walk, args=(path, stack), daemon=True).start()
+
+    if start is None:
+        start = [root]
+    # Um walker por dispositivo, como na caminhada normal; o primeiro diretório de cada grupo dá o dispositivo
+    groups = {}
+    for path in start:
+        try:
+            device = os.stat(path).st_dev
+        except OSError:
+            device = None
+        groups.setdefault(device, []).append(path)
+    with lock:
+        walkers[0] += 1
+    for paths in groups.values():
+        spawn(paths[0], paths)
+    threading.Thread(target=feed, daemon=True).start()
+
+    while True:
+        item = results.get()
+        if item is END:
+            break
+        stage, file_path, outcome, error = item
+        if outcome == 'ok':
+            stage.processed += 1
+        elif outcome == 'skipped':
+            stage.skipped += 1
+        else:
+            stage.failed += 1
+            log(f"Erro ao processar {file_path}: {error}\n")
+        done = stage.processed + stage.failed + stage.skipped
+        if progress:
+            # Contador estruturado: quem consome (a GUI) mostra só o estado mais recente
+            progress(stage.name, done, found[0], stage.processed, stage.failed, stage.skipped)
+        else:
+            log(f"Processando ({stage.name}): {done}/{found[0]} (OK: {stage.processed}, Erros: {stage.failed}, Pulados: {stage.skipped})\n")
+
+    for stage in stages:
+        for key, lane in stage.lanes.items():
+            log(f"{stage.name} - dispositivo {device_label(key)}: {lane.completed} arquivos, concorrência final {lane.limit}\n")
+    return found[0]
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import os
+import threading
+
+DEFAULT_PROBESIZE = 10000000  # 10 MB
+DEFAULT_ANALYZEDURATION = 10000000  # 10 segundos
+
+# Tentativas após timeout: cada uma lê menos do arquivo e tem metade do prazo
+RETRY_SETTINGS = [
+    (DEFAULT_PROBESIZE, DEFAULT_ANALYZEDURATION, 1.0),
+    (2000000, 2000000, 0.5),
+    (500000, 500000, 0.25)
+]
+
+def build_ffprobe_cmd(ffprobe_path, file_path, probesize=DEFAULT_PROBESIZE, analyzeduration=DEFAULT_ANALYZEDURATION):
+    normalized_path = os.path.normpath(file_path)
+    if os.name == 'nt':
+        normalized_path = '\\\\?\\' + normalized_path.replace('/', '\\')
+
+    return [
+        ffprobe_path,
+        "-v", "error",
+        "-print_format", "json",
+        "-show_format",
+        "-show_streams",
+        "-show_error",
+        "-analyzeduration", str(analyzeduration),
+        "-probesize", str(probesize),
+        "-err_detect", "aggressive",
+        "-fflags", "+ignidx",
+        "-max_ts_probe", "50",
+        normalized_path
+    ]
+
+def parse_ffprobe_output(returncode, stdout, stderr):
+    if returncode != 0:
+        return {"error": f"Erro no ffprobe: {stderr}"}
+
+    try:
+        metadata = json.loads(stdout)
+    except json.JSONDecodeError as e:
+        return {"error": f"JSON inválido retornado pelo ffprobe: {e}"}
+
+    extracted = {}
+    video_stream = next((stream for stream in metadata.get('streams', []) if stream['codec_type'] == 'video'), None)
+    if video_stream:
+        if 'width' in video_stream and 'height' in video_stream:
+            extracted['resolution'] = f"{video_stream['width']}x{video_stream['height']}"
+        if 'r_frame_rate' in video_stream:
+            try:
+                num, denom = map(int, video_stream['r_frame_rate'].split('/'))
+                extracted['fps'] = num / denom if denom != 0 else 0
+            except (ValueError, ZeroDivisionError):
+                extracted['fps'] = 0
+        if 'codec_name' in video_stream:
+            extracted['video_codec'] = video_stream['codec_name']
+
+    format_data = metadata.get('format', {})
+    if 'duration' in format_data:
+        try:
+            extracted['duration_seconds'] = float(format_data['duration'])
+        except ValueError:
+            extracted['duration_seconds'] = 0
+    if 'bit_rate' in format_data:
+        try:
+            extracted['bitrate_total_kbps'] = int(format_data['bit_rate']) // 1000
+        except ValueError:
+            extracted['bitrate_total_kbps'] = 0
+
+    if metadata.get('error'):
+        return {"error": f"Arquivo corrompido: {metadata['error']}"}
+
+    return extracted if extracted else {"error": "Nenhum metadado relevante encontrado"}
+
+class ProbeExecutor:
+    def __init__(self, ffprobe_path, concurrency=4, timeout=60):
+        self.ffprobe_path = ffprobe_path
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.killed = 0
+        self.retried = 0
+        self.loop = asyncio.new_event_loop()
+        self.semaphore = None
+        self.thread = threading.Thread(target=self._run_loop, daemon=True)
+        ready = threading.Event()
+        self.loop.call_soon(ready.set)
+        self.thread.start()
+        ready.wait()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.loop.run_forever()
+
+    def probe(self, file_path):
+        # Chamado pelas threads de trabalho; o processo roda no loop assíncrono
+        if not os.path.exists(self.ffprobe_path):
+            return {"error": "ffprobe não encontrado no caminho configurado"}
+        future = asyncio.run_coroutine_threadsafe(self._probe(file_path), self.loop)
+        return future.result()
+
+    async def _probe(self, file_path):
+        async with self.semaphore:
+            for attempt, (probesize, analyzeduration, share) in enumerate(RETRY_SETTINGS):
+                if attempt:
+                    self.retried += 1
+                cmd = build_ffprobe_cmd(self.ffprobe_path, file_path, probesize, analyzeduration)
+                result = await self._run(cmd, self.timeout * share)
+                if result is not None:
+                    return result
+            return {"error": f"Timeout ao processar arquivo após {len(RETRY_SETTINGS)} tentativas"}
+
+    async def _run(self, cmd, timeout):
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        except OSError as e:
+            return {"error": f"Erro ao extrair metadados: {e}"}
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+        except asyncio.TimeoutError:
+            # Prazo real: o ffprobe travado é morto em vez de continuar ocupando um worker
+            proc.kill()
+            await proc.wait()
+            self.killed += 1
+            return None
+        return parse_ffprobe_output(proc.returncode, stdout.decode('utf-8', 'replace'),
+                                    stderr.decode('utf-8', 'replace'))
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
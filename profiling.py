@@ -0,0 +1,106 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+MODES = ['cprofile', 'sample']
+
+class ThreadProfiler:
+    # cProfile em todas as threads criadas durante a execução; sozinho ele só vê a thread que o ativou,
+    # e no scan o trabalho acontece nos walkers, nos workers e no DBWriter
+    def __init__(self):
+        self.profiles = []
+        self.lock = threading.Lock()
+
+    def _start_thread(self, frame, event, arg):
+        # Chamado no primeiro evento de cada thread nova; o cProfile assume o lugar deste gancho
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def start(self):
+        profile = cProfile.Profile()
+        self.profiles.append(profile)
+        threading.setprofile(self._start_thread)
+        profile.enable()
+
+    def stop(self):
+        self.profiles[0].disable()
+        threading.setprofile(None)
+
+    def write(self, path, log, top=25):
+        with self.lock:
+            stats = pstats.Stats(*self.profiles)
+        stats.dump_stats(path)
+        out = io.StringIO()
+        stats.stream = out
+        stats.sort_stats('cumulative').print_stats(top)
+        log(out.getvalue())
+        log(f"Perfil de {len(self.profiles)} threads gravado em {path} (abra com pstats ou snakeviz)\n")
+
+class SamplingProfiler:
+    # Amostra as pilhas de todas as threads a cada interval segundos; custo fixo, independente do número
+    # de chamadas. Grava no formato "pilha;recolhida contagem" aceito pelo flamegraph.pl e pelo speedscope
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self, path, log, top=25):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        # Resumo no log: funções no topo da pilha (onde o tempo é gasto de fato), ignorando threads ociosas
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        for leaf, count in leaves.most_common(top):
+            log(f"{count / total:7.1%}  {leaf}\n")
+        log(f"{self.samples} amostras gravadas em {path}\n")
+
+def build_profiler(mode, interval=0.005):
+    if mode == 'sample':
+        return SamplingProfiler(interval)
+    return ThreadProfiler()
+
+def profiled(profiler, path, log, func, *args, **kwargs):
+    start = time.perf_counter()
+    profiler.start()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.stop()
+        log(f"Execução perfilada em {time.perf_counter() - start:.2f} s\n")
+        profiler.write(path, log)
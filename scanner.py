@@ -0,0 +1,290 @@
+import os
+import sys
+import sqlite3
+import mimetypes
+import subprocess
+import shutil
+
+from db_writer import DBWriter, upsert_records
+from hashing import Hasher, default_hasher, DEFAULT_SAMPLE_BYTES
+from pipeline import Stage, run_pipeline
+from io_scheduler import DeviceScheduler
+from probe import build_ffprobe_cmd, parse_ffprobe_output
+from extractors import build_extractor
+from schema import ensure_schema
+from catalog_index import load_catalog_index, is_unchanged, has_stat
+from metrics import untimed, missing, reported_error
+from jobs import HASHED, PROBED, FAILED
+from snapshot import load_snapshot, scan_profile
+
+# Caminho padrão do banco de dados e do ffprobe
+default_db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'video_data.db')
+ffprobe_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ffprobe.exe')
+if not os.path.exists(ffprobe_path):
+    # Fora do Windows o ffprobe normalmente está no PATH
+    ffprobe_path = shutil.which('ffprobe') or ffprobe_path
+
+# Etapa combinada: hash e metadados na mesma visita ao arquivo
+FUSED = 'fused'
+
+def log_to_stdout(message):
+    sys.stdout.write(message)
+    sys.stdout.flush()
+
+def init_database(db_path=default_db_path, log=log_to_stdout):
+    # Cria o esquema ou migra um catálogo no layout antigo (ver schema.py)
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    try:
+        ensure_schema(conn, log)
+        conn.execute('PRAGMA journal_mode=WAL').fetchone()
+    finally:
+        conn.close()
+
+def calculate_hash(file_path, max_bytes=DEFAULT_SAMPLE_BYTES, hasher=None):
+    if hasher is None:
+        hasher = default_hasher if max_bytes == DEFAULT_SAMPLE_BYTES else Hasher(sample_bytes=max_bytes)
+    try:
+        return hasher.hash_file(file_path)
+    except Exception as e:
+        return None
+
+def get_video_metadata(file_path):
+    try:
+        if not os.path.exists(ffprobe_path):
+            return {"error": "ffprobe.exe não encontrado no diretório do aplicativo"}
+
+        result = subprocess.run(build_ffprobe_cmd(ffprobe_path, file_path), capture_output=True, text=True, timeout=60)
+        return parse_ffprobe_output(result.returncode, result.stdout, result.stderr)
+    except subprocess.TimeoutExpired:
+        return {"error": "Timeout ao processar arquivo (60 segundos)"}
+    except Exception as e:
+        return {"error": f"Erro ao extrair metadados: {str(e)}"}
+
+def is_video_file(file_path):
+    mime_type, _ = mimetypes.guess_type(file_path)
+    return mime_type and mime_type.startswith('video')
+
+def save_to_db(data, db_path=default_db_path):
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    try:
+        with conn:
+            upsert_records(conn, [data])
+    except Exception as e:
+        print(f"Erro ao salvar no DB: {e}")
+    finally:
+        conn.close()
+
+def process_file(file_path, step, log, sink, index, paranoid=False, hasher=default_hasher,
+                 probe=get_video_metadata, metrics=None, errors=None):
+    if not is_video_file(file_path):
+        log(f"Ignorando {file_path} (não é vídeo)\n")
+        return False
+
+    timed = metrics.timed if metrics else untimed
+
+    def failed(message):
+        # errors recebe os motivos das falhas parciais, registrados no job
+        log(f"{message}\n")
+        if errors is not None:
+            errors.append(message.strip())
+
+    stats = os.stat(file_path)
+    read_size = hasher.read_size(stats.st_size)
+
+    # No modo combinado o mesmo acesso ao arquivo coleta hash e metadados
+    want_metadata = step in (1, FUSED)
+    want_hash = step in (2, FUSED)
+    current_hash = None
+    entry = index.get(file_path)
+    if entry:
+        unchanged = is_unchanged(entry, stats)
+        comparable = entry.hash_algo == hasher.algorithm and entry.hash_layout == hasher.layout
+        if want_hash and entry.hash and comparable:
+            if unchanged and not paranoid:
+                log(f"Pulando hash de {file_path} (arquivo inalterado)\n")
+                want_hash = False
+            else:
+                # Modo paranoico ou registro antigo sem stat: relê o arquivo para comparar o hash
+                current_hash = timed('hash', calculate_hash, file_path, hasher=hasher,
+                                     bytes_read=read_size, failed=missing)
+                if current_hash == entry.hash and unchanged:
+                    log(f"Pulando hash de {file_path} (hash inalterado)\n")
+                    want_hash = False
+                elif current_hash and current_hash != entry.hash and unchanged:
+                    log(f"Hash divergente com stat inalterado em {file_path}\n")
+        if want_metadata and entry.metadata_complete and (unchanged or not has_stat(entry)):
+            log(f"Pulando metadados de {file_path} (metadados completos)\n")
+            want_metadata = False
+
+    if not want_metadata and not want_hash:
+        return False
+
+    data = {
+        'extension': os.path.splitext(file_path)[1],
+        'file_path': file_path,
+        'size_bytes': stats.st_size,
+        'mtime_ns': stats.st_mtime_ns,
+        'inode': stats.st_ino,
+        'device': stats.st_dev
+    }
+
+    # O hash é lido primeiro para que o ffprobe encontre o início do arquivo no cache
+    if want_hash:
+        try:
+            file_hash = current_hash or timed('hash', calculate_hash, file_path, hasher=hasher,
+                                              bytes_read=read_size, failed=missing)
+            if file_hash:
+                data['hash'] = file_hash
+                data['hash_algo'] = hasher.algorithm
+                data['hash_layout'] = hasher.layout
+                log(f"Hash calculado para {file_path}\n")
+            else:
+                failed(f"Erro ao calcular hash para {file_path}")
+        except Exception as e:
+            failed(f"Erro ao calcular hash para {file_path}: {e}")
+    if want_metadata:
+        try:
+            metadata = timed('metadata', probe, file_path, failed=reported_error)
+            if metadata.get('error'):
+                failed(f"Erro nos metadados de {file_path}: {metadata['error']}")
+            else:
+                data['metadata'] = metadata
+                log(f"Metadados coletados para {file_path}\n")
+        except Exception as e:
+            failed(f"Erro ao coletar metadados para {file_path}: {e}")
+
+    if 'hash' not in data and 'metadata' not in data:
+        return False
+
+    try:
+        timed('db_enqueue', sink, data)
+        return True
+    except Exception as e:
+        failed(f"Erro ao salvar dados no DB para {file_path}: {e}")
+        return False
+
+def tracked(func, job, state, dirty, failures, sink=None):
+    # Estado do arquivo no job depois de cada estágio; vai pela fila do DBWriter, atrás do registro
+    # que o estágio acabou de enfileirar. O diretório de um arquivo com falha entra em dirty para
+    # não ser podado no próximo scan. Com sink (último estágio), o fim do arquivo também vai pela fila
+    def fail(file_path, reason):
+        dirty.add(os.path.dirname(file_path))
+        failures.add(file_path)
+        if job:
+            job.set_state(file_path, FAILED, reason)
+
+    def run(file_path):
+        try:
+            return step(file_path)
+        finally:
+            if sink:
+                failed = file_path in failures
+                failures.discard(file_path)
+                sink(('processed', file_path, failed))
+
+    def step(file_path):
+        errors = []
+        try:
+            result = func(file_path, errors)
+        except Exception as e:
+            fail(file_path, str(e))
+            raise
+        if errors:
+            fail(file_path, "; ".join(errors))
+        elif job:
+            job.set_state(file_path, state)
+        return result
+    return run
+
+def process_folder(folder_path, log=log_to_stdout, step=FUSED, workers=6, db_path=default_db_path,
+                   batch_size=500, flush_interval=1.0, paranoid=False, hasher=default_hasher, scheduler=None,
+                   probe_workers=4, probe_timeout=60, extractor=None, progress=None, metrics=None, job=None,
+                   prune=False, changes=None, on_processed=None):
+    # prune: diretórios com o mesmo stat do scan anterior não são listados (ver snapshot.py), opcional
+    # porque arquivos alterados no lugar passam despercebidos; on_processed recebe, depois de gravados,
+    # os arquivos que terminaram todas as etapas e se falharam;
+    # changes: caminhos alterados vindos de um watcher, no lugar da caminhada
+    if not os.path.isdir(folder_path):
+        log(f"Caminho inválido: {folder_path}\n")
+        return None
+
+    log(f"Processando pasta: {folder_path} (Etapa {'combinada' if step == FUSED else step})\n")
+    if metrics:
+        metrics.start()
+    timed = metrics.timed if metrics else untimed
+
+    # Uma única consulta carrega o catálogo da pasta; os workers não acessam mais o DB
+    index = timed('catalog_load', load_catalog_index, db_path, folder_path)
+    log(f"Carregados {len(index)} registros existentes do catálogo.\n")
+
+    writer = DBWriter(db_path, log, batch_size=batch_size, flush_interval=flush_interval, metrics=metrics, job=job,
+                      on_commit=on_processed)
+    writer.start()
+    start, files, on_listed = None, (), None
+    snapshot = None
+    if changes is not None:
+        start, files = [], changes
+    elif prune and not paranoid:
+        snapshot = load_snapshot(db_path, folder_path, scan_profile(hasher, step != 2))
+    if job:
+        # Retomada: só os diretórios não listados e os arquivos sem estado final
+        start, files = job.pending(db_path)
+        job.attach(writer.put)
+        job.begin(db_path)
+        on_listed = job.listed
+        log(f"Job {job.job_id}: {len(start)} diretórios a listar, {len(files)} arquivos pendentes.\n")
+    if metrics:
+        metrics.watch_queue('db_writer', writer.queue.qsize)
+    if scheduler is None:
+        scheduler = DeviceScheduler(workers)
+    if extractor is None:
+        extractor = build_extractor('auto', ffprobe_path, probe_workers, probe_timeout, log=log)
+    probe = extractor.extract
+
+    dirty = set()
+    failures = set()
+
+    def stage(name, file_step, state, last=True):
+        func = lambda p, errors: process_file(p, file_step, log, writer.put, index, paranoid, hasher, probe,
+                                              metrics, errors)
+        sink = writer.put if last and on_processed else None
+        return Stage(name, tracked(func, job, state, dirty, failures, sink), scheduler)
+
+    stages = []
+    if step == FUSED:
+        stages.append(stage("Combinada", FUSED, HASHED))
+    if step == 1:
+        stages.append(stage("Etapa 1", 1, PROBED, last=False))
+    if step in (1, 2):
+        stages.append(stage("Etapa 2", 2, HASHED))
+    completed = False
+    try:
+        found = run_pipeline(folder_path, stages, is_video_file, log, progress=progress, metrics=metrics,
+                             start=start, files=files, on_listed=on_listed, snapshot=snapshot)
+        completed = True
+    finally:
+        extractor.close()
+        writer.close()
+        writer.report()
+        if metrics:
+            metrics.stop()
+        if job:
+            job.finish(db_path, completed)
+    # O snapshot só é gravado depois que todos os arquivos dos diretórios listados foram processados
+    if snapshot:
+        snapshot.save(db_path, dirty)
+        snapshot.report(log)
+    extractor.report(log)
+    if metrics:
+        metrics.report(log)
+
+    if not found:
+        if snapshot and snapshot.pruned:
+            log("Nenhum diretório alterado desde o último scan.\n")
+        else:
+            log("Nenhum arquivo de vídeo encontrado.\n")
+        return (0, 0, 0)
+
+    last = stages[-1]
+    log(f"\nProcessados {last.processed} vídeos de {found} encontrados. Dados salvos em {db_path}\n")
+    return last.processed, sum(stage.failed for stage in stages), last.skipped
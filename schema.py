@@ -0,0 +1,192 @@
+from datetime import datetime
+
+from hashing import LEGACY_ALGORITHM, LEGACY_LAYOUT
+
+# Versão do esquema gravada em PRAGMA user_version. 0/1: layout original (file_id = SHA-256 do caminho
+# em hex, hash em hex, modified_at ISO, size_bytes REAL, caminho completo por linha); 2: sem last_verified
+SCHEMA_VERSION = 3
+
+# Diretórios guardados uma vez, com o separador final: o caminho do arquivo é sempre path || name
+DIRECTORIES_SQL = '''
+    CREATE TABLE IF NOT EXISTS directories (
+        id INTEGER PRIMARY KEY,
+        path TEXT NOT NULL UNIQUE
+    )
+'''
+
+FILES_SQL = '''
+    CREATE TABLE IF NOT EXISTS files (
+        file_id INTEGER PRIMARY KEY,
+        dir_id INTEGER NOT NULL REFERENCES directories(id),
+        name TEXT NOT NULL,
+        extension TEXT,
+        size_bytes INTEGER,
+        mtime_ns INTEGER,
+        inode INTEGER,
+        device INTEGER,
+        hash BLOB,
+        hash_algo TEXT,
+        hash_layout TEXT,
+        duration_seconds REAL,
+        resolution TEXT,
+        fps REAL,
+        video_codec TEXT,
+        bitrate_total_kbps INTEGER,
+        last_verified INTEGER,
+        UNIQUE (dir_id, name)
+    )
+'''
+
+# Visão com as colunas que o resto do programa sempre usou (file_path, modified_at); consultas sobre ela
+# são achatadas pelo SQLite e continuam usando os índices de files
+CATALOG_VIEW_SQL = '''
+    CREATE VIEW IF NOT EXISTS catalog AS
+    SELECT f.file_id, f.dir_id, d.path AS dir_path, d.path || f.name AS file_path, f.name, f.extension,
+           f.size_bytes, f.mtime_ns,
+           strftime('%Y-%m-%dT%H:%M:%S', f.mtime_ns / 1000000000, 'unixepoch', 'localtime') AS modified_at,
+           f.inode, f.device, f.hash, f.hash_algo, f.hash_layout, f.duration_seconds, f.resolution, f.fps,
+           f.video_codec, f.bitrate_total_kbps
+    FROM files f JOIN directories d ON d.id = f.dir_id
+'''
+
+# Índices das consultas frequentes: duplicados por hash e por tamanho, filtro e ordenação por codec,
+# e a fila do scrub (verificados há mais tempo primeiro)
+INDEXES = [('idx_hash', 'hash'), ('idx_size_bytes', 'size_bytes'),
+           ('idx_video_codec_nocase', 'video_codec COLLATE NOCASE'), ('idx_last_verified', 'last_verified')]
+
+# Tabelas auxiliares que referenciam files.file_id e precisam ser remapeadas na migração
+DEPENDENT_TABLES = ['duplicate_members', 'near_signatures', 'near_buckets', 'near_clusters']
+
+def split_path(file_path):
+    # Diretório com o separador final e nome; aceita / e \ para bancos gravados em outro sistema
+    cut = max(file_path.rfind('/'), file_path.rfind('\\')) + 1
+    return file_path[:cut], file_path[cut:]
+
+def hash_to_blob(text):
+    if not text:
+        return None
+    try:
+        return bytes.fromhex(text)
+    except ValueError:
+        return None
+
+def iso_to_ns(text):
+    # modified_at antigo: horário local sem fuso, como datetime.fromtimestamp().isoformat()
+    if not text:
+        return None
+    try:
+        return int(datetime.fromisoformat(text[:26]).timestamp() * 1_000_000) * 1000
+    except ValueError:
+        return None
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def create_schema(conn):
+    c = conn.cursor()
+    c.execute(DIRECTORIES_SQL)
+    c.execute(FILES_SQL)
+    for index_name, expr in INDEXES:
+        c.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON files({expr})')
+    c.execute(CATALOG_VIEW_SQL)
+    c.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+def ensure_schema(conn, log=None):
+    # Cria o esquema atual ou migra o layout antigo; chamado na abertura do banco por init_database
+    c = conn.cursor()
+    exists = c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='files'").fetchone()
+    version = schema_version(conn)
+    if exists and version < 2:
+        migrate_v1(conn, log)
+        return
+    if exists and version < SCHEMA_VERSION:
+        migrate_v2(conn)
+        return
+    with conn:
+        create_schema(conn)
+
+def _legacy_columns(conn):
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(files_v1)')}
+    # Bancos de versões ainda mais antigas não têm as colunas de stat nem as de hash
+    column = lambda name, fallback='NULL': name if name in existing else fallback
+    return (column('mtime_ns'), column('inode'), column('device'),
+            column('hash_algo', f"CASE WHEN hash IS NOT NULL THEN '{LEGACY_ALGORITHM}' END"),
+            column('hash_layout', f"CASE WHEN hash IS NOT NULL THEN '{LEGACY_LAYOUT}' END"))
+
+def migrate_v1(conn, log=None):
+    count = conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+    if log:
+        log(f"Migrando o catálogo ({count} registros) para o esquema {SCHEMA_VERSION}...\n")
+    conn.create_function('dir_part', 1, lambda path: split_path(path or '')[0], deterministic=True)
+    conn.create_function('name_part', 1, lambda path: split_path(path or '')[1], deterministic=True)
+    conn.create_function('hash_to_blob', 1, hash_to_blob, deterministic=True)
+    conn.create_function('iso_to_ns', 1, iso_to_ns, deterministic=True)
+    c = conn.cursor()
+    c.execute('BEGIN')
+    try:
+        # Índice de busca, resumo e seus triggers são derivados de files; o viewer os recria no novo esquema
+        for (trigger,) in c.execute("SELECT name FROM sqlite_master WHERE type='trigger' AND tbl_name='files'").fetchall():
+            c.execute(f'DROP TRIGGER {trigger}')
+        c.execute('DROP TABLE IF EXISTS files_fts')
+        c.execute('DROP TABLE IF EXISTS catalog_stats')
+        c.execute('ALTER TABLE files RENAME TO files_v1')
+        for (index,) in c.execute("SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='files_v1' "
+                                  "AND sql IS NOT NULL").fetchall():
+            c.execute(f'DROP INDEX {index}')
+        create_schema(conn)
+
+        mtime_ns, inode, device, hash_algo, hash_layout = _legacy_columns(conn)
+        c.execute('INSERT OR IGNORE INTO directories (path) SELECT DISTINCT dir_part(file_path) FROM files_v1')
+        # O rowid antigo vira o file_id novo, o que dá o mapeamento para as tabelas auxiliares
+        c.execute(f'''
+            INSERT INTO files (file_id, dir_id, name, extension, size_bytes, mtime_ns, inode, device, hash,
+                               hash_algo, hash_layout, duration_seconds, resolution, fps, video_codec,
+                               bitrate_total_kbps)
+            SELECT o.rowid, d.id, name_part(o.file_path), o.extension, CAST(o.size_bytes AS INTEGER),
+                   COALESCE({mtime_ns}, iso_to_ns(o.modified_at)), {inode}, {device}, hash_to_blob(o.hash),
+                   {hash_algo}, {hash_layout}, o.duration_seconds, o.resolution, o.fps, o.video_codec,
+                   o.bitrate_total_kbps
+            FROM files_v1 o JOIN directories d ON d.path = dir_part(o.file_path)
+            ORDER BY o.rowid
+        ''')
+        for table in DEPENDENT_TABLES:
+            _remap_file_ids(c, table)
+        c.execute('DROP TABLE files_v1')
+        c.execute('COMMIT')
+    except BaseException:
+        c.execute('ROLLBACK')
+        raise
+    # Devolve ao sistema o espaço das tabelas e índices antigos
+    c.execute('VACUUM')
+    if log:
+        log("Migração concluída.\n")
+
+def migrate_v2(conn):
+    # 2 -> 3: data da última verificação do scrub; nula = nunca verificado, primeiro da fila
+    with conn:
+        conn.execute('ALTER TABLE files ADD COLUMN last_verified INTEGER')
+        create_schema(conn)
+
+def _remap_file_ids(c, table):
+    # Recria a tabela com file_id INTEGER e troca o SHA-256 do caminho pelo novo file_id;
+    # linhas de arquivos que não estão mais no catálogo são descartadas
+    row = c.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()
+    if not row:
+        return
+    columns = [info[1] for info in c.execute(f'PRAGMA table_info({table})')]
+    # Índices explícitos da tabela, lidos antes do RENAME (que reescreve o SQL deles para {table}_v1)
+    # e recriados sobre a tabela nova
+    indexes = c.execute("SELECT name, sql FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL",
+                        (table,)).fetchall()
+    c.execute(f'ALTER TABLE {table} RENAME TO {table}_v1')
+    for index, _ in indexes:
+        c.execute(f'DROP INDEX {index}')
+    c.execute(row[0].replace('file_id TEXT', 'file_id INTEGER'))
+    selected = ', '.join('o.rowid' if column == 'file_id' else f't.{column}' for column in columns)
+    c.execute(f'''
+        INSERT INTO {table} ({', '.join(columns)})
+        SELECT {selected} FROM {table}_v1 t JOIN files_v1 o ON o.file_id = t.file_id
+    ''')
+    c.execute(f'DROP TABLE {table}_v1')
+    for _, sql in indexes:
+        c.execute(sql.replace('file_id TEXT', 'file_id INTEGER'))
@@ -0,0 +1,219 @@
+import os
+import sqlite3
+import threading
+import time
+
+from catalog_index import under_root
+from hashing import hasher_for
+
+# Tipos de divergência: conteúdo diferente com o mesmo stat (bit rot), arquivo alterado desde o scan,
+# arquivo ausente e erro de leitura
+MISMATCH = 'hash_mismatch'
+MODIFIED = 'modified'
+MISSING = 'missing'
+READ_ERROR = 'read_error'
+
+def ensure_scrub_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scrub_mismatches (
+            id INTEGER PRIMARY KEY,
+            file_id INTEGER NOT NULL,
+            file_path TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            expected_hash BLOB,
+            actual_hash BLOB,
+            detail TEXT,
+            found_at INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_scrub_mismatches_file ON scrub_mismatches(file_id)')
+    conn.commit()
+
+class Stopped(Exception):
+    pass
+
+class RateLimiter:
+    # Orçamento de bytes/s e de leituras/s. Cada leitura reserva o próximo horário livre de cada
+    # orçamento e espera até ele; a espera termina antes se o scrub for parado
+    def __init__(self, bytes_per_sec=None, iops=None, stop=None):
+        self.bytes_per_sec = bytes_per_sec
+        self.iops = iops
+        self.stop = stop or threading.Event()
+        self.next_free = time.monotonic()
+
+    def acquire(self, nbytes):
+        cost = 0.0
+        if self.bytes_per_sec:
+            cost = max(cost, nbytes / self.bytes_per_sec)
+        if self.iops:
+            cost = max(cost, 1.0 / self.iops)
+        if not cost:
+            return
+        now = time.monotonic()
+        # Sem acúmulo de crédito: depois de uma pausa a taxa não passa do orçamento
+        start = max(self.next_free, now)
+        self.next_free = start + cost
+        if start > now and self.stop.wait(start - now):
+            raise Stopped()
+
+class Scrubber:
+    # Relê arquivos do catálogo e compara com o hash gravado, dos verificados há mais tempo (ou nunca)
+    # para os mais recentes. last_verified é gravado a cada lote: parar e rodar de novo continua de onde parou
+    def __init__(self, db_path, log, bytes_per_sec=None, iops=None, root=None, older_than=0, batch_size=100):
+        self.db_path = db_path
+        self.log = log
+        self.root = root
+        self.older_than = older_than
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+        self.limiter = RateLimiter(bytes_per_sec, iops, self._stop)
+        self.hashers = {}
+        self.verified = 0
+        self.problems = {}
+        self.skipped = 0
+        self.bytes_read = 0
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def paused(self):
+        return not self._running.is_set()
+
+    def stop(self):
+        self._stop.set()
+        self._running.set()
+
+    def _throttle(self, nbytes):
+        # Chamado pelo Hasher antes de cada leitura: pausa e parada valem também no meio de um arquivo grande
+        while not self._running.wait(1.0):
+            pass
+        if self._stop.is_set():
+            raise Stopped()
+        self.limiter.acquire(nbytes)
+        self.bytes_read += nbytes
+
+    def _hasher(self, algorithm, layout):
+        key = (algorithm, layout)
+        if key not in self.hashers:
+            self.hashers[key] = hasher_for(algorithm, layout, throttle=self._throttle)
+        return self.hashers[key]
+
+    def check(self, row):
+        # None se o arquivo confere, senão (tipo, hash lido, detalhe)
+        file_id, file_path, size_bytes, mtime_ns, expected, algorithm, layout = row
+        try:
+            self._throttle(0)
+            stats = os.stat(file_path)
+        except FileNotFoundError:
+            return MISSING, None, None
+        except OSError as e:
+            return READ_ERROR, None, str(e)
+        # Arquivo alterado desde o scan não é corrupção: falta rodar o scan de novo
+        if stats.st_size != size_bytes or (mtime_ns is not None and stats.st_mtime_ns != mtime_ns):
+            return MODIFIED, None, f"tamanho {size_bytes} -> {stats.st_size}, mtime {mtime_ns} -> {stats.st_mtime_ns}"
+        try:
+            actual = bytes.fromhex(self._hasher(algorithm, layout).hash_file(file_path))
+            after = os.stat(file_path)
+        except OSError as e:
+            return READ_ERROR, None, str(e)
+        if actual == expected:
+            return None
+        if (after.st_size, after.st_mtime_ns) != (stats.st_size, stats.st_mtime_ns):
+            return MODIFIED, actual, "alterado durante a leitura"
+        return MISMATCH, actual, None
+
+    def _batch(self, conn, cutoff):
+        where, params = under_root(self.root, 'f.dir_id') if self.root else ('1', ())
+        # NULL vem antes no ORDER BY: nunca verificados primeiro (idx_last_verified)
+        return conn.execute(f'''
+            SELECT f.file_id, d.path || f.name, f.size_bytes, f.mtime_ns, f.hash, f.hash_algo, f.hash_layout
+            FROM files f JOIN directories d ON d.id = f.dir_id
+            WHERE f.hash IS NOT NULL AND (f.last_verified IS NULL OR f.last_verified < ?) AND {where}
+            ORDER BY f.last_verified, f.file_id LIMIT ?
+        ''', (cutoff,) + tuple(params) + (self.batch_size,)).fetchall()
+
+    def _save(self, conn, verified, found):
+        with conn:
+            conn.executemany('UPDATE files SET last_verified = ? WHERE file_id = ?', verified)
+            conn.executemany('INSERT INTO scrub_mismatches (file_id, file_path, kind, expected_hash, actual_hash, '
+                             'detail, found_at) VALUES (?, ?, ?, ?, ?, ?, ?)', found)
+
+    def run(self, max_seconds=None):
+        # Uma passada: só entra quem foi verificado antes do início (e há mais de older_than segundos),
+        # então o que for verificado agora não volta para a fila nesta execução
+        started = time.time()
+        deadline = time.monotonic() + max_seconds if max_seconds else None
+        cutoff = int(started - self.older_than)
+        last_report = time.monotonic()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            ensure_scrub_tables(conn)
+            while not self._stop.is_set():
+                rows = self._batch(conn, cutoff)
+                if not rows:
+                    break
+                verified, found = [], []
+                for row in rows:
+                    if deadline and time.monotonic() >= deadline:
+                        self.log("Tempo máximo atingido.\n")
+                        self._stop.set()
+                    if self._stop.is_set():
+                        break
+                    if self._hasher(row[5], row[6]) is None:
+                        # Algoritmo ou layout que este código não reproduz: sai da fila sem ser comparado
+                        self.skipped += 1
+                        verified.append((int(time.time()), row[0]))
+                        continue
+                    try:
+                        problem = self.check(row)
+                    except Stopped:
+                        break
+                    now = int(time.time())
+                    verified.append((now, row[0]))
+                    self.verified += 1
+                    if problem:
+                        kind, actual, detail = problem
+                        self.problems[kind] = self.problems.get(kind, 0) + 1
+                        found.append((row[0], row[1], kind, row[4], actual, detail, now))
+                        self.log(f"{kind}: {row[1]}{f' ({detail})' if detail else ''}\n")
+                    if time.monotonic() - last_report >= 30:
+                        last_report = time.monotonic()
+                        self._progress(started)
+                self._save(conn, verified, found)
+        finally:
+            conn.close()
+        self._progress(started)
+        return self.verified, self.problems
+
+    def _progress(self, started):
+        elapsed = max(time.time() - started, 1e-9)
+        problems = ', '.join(f"{kind} {count}" for kind, count in sorted(self.problems.items())) or 'nenhuma'
+        self.log(f"Scrub: {self.verified} arquivos verificados, {self.bytes_read / 2**20:.1f} MiB lidos "
+                 f"({self.bytes_read / 2**20 / elapsed:.1f} MiB/s), divergências: {problems}, "
+                 f"{self.skipped} sem hash reproduzível\n")
+
+def list_mismatches(db_path, kind=None, limit=None):
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_scrub_tables(conn)
+        where = 'WHERE kind = ?' if kind else ''
+        params = (kind,) if kind else ()
+        return conn.execute(f'SELECT found_at, kind, file_path, lower(hex(expected_hash)), lower(hex(actual_hash)), '
+                            f'detail FROM scrub_mismatches {where} ORDER BY found_at DESC, id DESC LIMIT ?',
+                            params + (limit or -1,)).fetchall()
+    finally:
+        conn.close()
+
+def verification_status(db_path):
+    # (com hash, nunca verificados, verificação mais antiga)
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT COUNT(*), COUNT(*) FILTER (WHERE last_verified IS NULL), MIN(last_verified) '
+                            'FROM files WHERE hash IS NOT NULL').fetchone()
+    finally:
+        conn.close()
@@ -0,0 +1,187 @@
+import os
+import socket
+import sqlite3
+import time
+from urllib.request import pathname2url
+
+from schema import ensure_schema, schema_version
+
+METADATA_COLUMNS = ['duration_seconds', 'resolution', 'fps', 'video_codec', 'bitrate_total_kbps']
+
+def default_node():
+    return socket.gethostname()
+
+def shard_path(directory, node, volume):
+    return os.path.join(directory, f"shard_{node}_{volume}.db")
+
+def ensure_shard_info(conn):
+    # Identifica um banco de shard: uma única linha com o nó e o volume
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS shard_info (
+            node TEXT NOT NULL,
+            volume TEXT NOT NULL,
+            root TEXT,
+            updated_at REAL
+        )
+    ''')
+    conn.commit()
+
+def ensure_merge_tables(conn):
+    # No catálogo central: shards importados e conflitos de hash encontrados no merge
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS shards (
+            shard_id INTEGER PRIMARY KEY,
+            node TEXT NOT NULL,
+            volume TEXT NOT NULL,
+            source TEXT,
+            files INTEGER,
+            merged_at REAL,
+            UNIQUE (node, volume)
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS merge_conflicts (
+            file_id INTEGER NOT NULL,
+            shard_id INTEGER NOT NULL,
+            mtime_ns INTEGER,
+            catalog_hash BLOB,
+            shard_hash BLOB,
+            found_at REAL,
+            PRIMARY KEY (file_id, shard_id)
+        )
+    ''')
+    conn.commit()
+
+def tag_shard(db_path, node, volume, root):
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_shard_info(conn)
+        with conn:
+            row = conn.execute('SELECT node, volume, root FROM shard_info').fetchone()
+            if row and row[:2] != (node, volume):
+                raise ValueError(f"{db_path} já é o shard {row[0]}/{row[1]}")
+            conn.execute('DELETE FROM shard_info')
+            # Ao retomar um job a pasta vem do job; o shard guarda a do primeiro scan
+            conn.execute('INSERT INTO shard_info (node, volume, root, updated_at) VALUES (?, ?, ?, ?)',
+                         (node, volume, root or (row[2] if row else None), time.time()))
+    finally:
+        conn.close()
+
+def shard_identity(db_path):
+    # (nó, volume, versão do esquema). Só leitura: o shard não é migrado nem alterado pelo merge.
+    # Shard sem shard_info (um catálogo comum) entra com o nome do arquivo como volume
+    conn = sqlite3.connect(f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro", uri=True)
+    try:
+        version = schema_version(conn)
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        row = conn.execute('SELECT node, volume FROM shard_info').fetchone() if 'shard_info' in tables else None
+    finally:
+        conn.close()
+    node, volume = row or ('', os.path.splitext(os.path.basename(db_path))[0])
+    return node, volume, version if 'files' in tables else None
+
+# Conflito de mesma chave (diretório + nome): a versão com mtime maior vence por inteiro; com o mesmo
+# mtime e tamanho é o mesmo arquivo, e cada lado completa o que falta no outro (hash, metadados).
+# Versões mais antigas que a do catálogo são ignoradas
+NEWER = 'excluded.mtime_ns > COALESCE(files.mtime_ns, -1)'
+SAME = 'excluded.mtime_ns IS files.mtime_ns AND excluded.size_bytes IS files.size_bytes'
+# Verificação do scrub mais recente para o mesmo conteúdo: vale a do shard se o hash é o mesmo (ou se o
+# hash vem do shard) e ela for mais nova
+VERIFIED = ('(files.hash IS excluded.hash OR files.hash IS NULL) AND excluded.last_verified > '
+            'COALESCE(files.last_verified, -1)')
+
+def _merge_sql(verified=True):
+    # verified: o shard tem last_verified (esquema 3 em diante)
+    replace = ['extension', 'size_bytes', 'mtime_ns', 'inode', 'device']
+    hashed = ['hash', 'hash_algo', 'hash_layout']
+    updates = [f'{col} = CASE WHEN {NEWER} THEN excluded.{col} ELSE files.{col} END' for col in replace]
+    updates += [f'{col} = CASE WHEN {NEWER} OR ({SAME} AND files.hash IS NULL) THEN excluded.{col} ELSE files.{col} END'
+                for col in hashed]
+    updates += [f'{col} = CASE WHEN {NEWER} THEN excluded.{col} WHEN {SAME} THEN COALESCE(files.{col}, excluded.{col}) '
+                f'ELSE files.{col} END' for col in METADATA_COLUMNS]
+    updates.append(f'last_verified = CASE WHEN {NEWER} THEN excluded.last_verified '
+                   f'WHEN {SAME} AND {VERIFIED} THEN excluded.last_verified ELSE files.last_verified END')
+    columns = replace + hashed + METADATA_COLUMNS + ['last_verified']
+    values = [f'f.{col}' for col in columns[:-1]] + ['f.last_verified' if verified else 'NULL']
+    # Com o mesmo mtime só há escrita se o shard trouxer algo que falta ou uma verificação mais nova; um
+    # shard reimportado sem novidades não toca as linhas (nem os triggers do índice de busca e do resumo)
+    gaps = ' OR '.join([f'(files.{col} IS NULL AND excluded.{col} IS NOT NULL)' for col in ['hash'] + METADATA_COLUMNS]
+                       + [f'({VERIFIED})'])
+    # As atualizações são avaliadas com os valores antigos da linha, então mtime_ns pode vir antes do hash
+    return f'''
+        INSERT INTO files (dir_id, name, {", ".join(columns)})
+        SELECT d.id, f.name, {", ".join(values)}
+        FROM shard.files f JOIN shard.directories sd ON sd.id = f.dir_id JOIN directories d ON d.path = sd.path
+        WHERE true
+        ON CONFLICT(dir_id, name) DO UPDATE SET {", ".join(updates)}
+        WHERE {NEWER} OR ({SAME} AND ({gaps}))
+    '''
+
+CONFLICTS_SQL = '''
+    INSERT OR REPLACE INTO merge_conflicts (file_id, shard_id, mtime_ns, catalog_hash, shard_hash, found_at)
+    SELECT m.file_id, ?, m.mtime_ns, m.hash, f.hash, ?
+    FROM shard.files f JOIN shard.directories sd ON sd.id = f.dir_id
+    JOIN directories d ON d.path = sd.path
+    JOIN files m ON m.dir_id = d.id AND m.name = f.name
+    WHERE f.mtime_ns IS m.mtime_ns AND f.size_bytes IS m.size_bytes AND f.hash != m.hash
+          AND f.hash_algo IS m.hash_algo AND f.hash_layout IS m.hash_layout
+'''
+
+def merge_shard(conn, shard_db, log):
+    node, volume, version = shard_identity(shard_db)
+    if version is None or version < 2:
+        # Layout antigo: o merge não migra o shard; um scan (ou o view) com ele como --db faz a migração
+        log(f"Ignorando {shard_db}: {'não é um catálogo' if version is None else 'esquema antigo'}; "
+            f"abra-o com 'scan --db' ou 'view --db' para migrar\n")
+        return 0, 0, 0
+    conn.execute('ATTACH DATABASE ? AS shard', (shard_db,))
+    try:
+        with conn:
+            now = time.time()
+            conn.execute('INSERT INTO shards (node, volume, source, merged_at) VALUES (?, ?, ?, ?) '
+                         'ON CONFLICT(node, volume) DO UPDATE SET source = excluded.source, merged_at = excluded.merged_at',
+                         (node, volume, os.path.abspath(shard_db), now))
+            shard_id = conn.execute('SELECT shard_id FROM shards WHERE node = ? AND volume = ?',
+                                    (node, volume)).fetchone()[0]
+            count = conn.execute('SELECT COUNT(*) FROM shard.files').fetchone()[0]
+            before = conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+            conn.execute('INSERT OR IGNORE INTO directories (path) SELECT path FROM shard.directories')
+            # Mesmo arquivo (mtime e tamanho iguais, mesmo algoritmo) com hash diferente: registrado antes
+            # do merge, que mantém o hash do catálogo
+            conn.execute('DELETE FROM merge_conflicts WHERE shard_id = ?', (shard_id,))
+            conflicts = conn.execute(CONFLICTS_SQL, (shard_id, now)).rowcount
+            changed = conn.execute(_merge_sql(verified=version >= 3)).rowcount
+            added = conn.execute('SELECT COUNT(*) FROM files').fetchone()[0] - before
+            conn.execute('UPDATE shards SET files = ? WHERE shard_id = ?', (count, shard_id))
+    finally:
+        conn.execute('DETACH DATABASE shard')
+    log(f"Shard {node}/{volume} ({shard_db}): {count} registros, {added} novos, {changed - added} atualizados, "
+        f"{conflicts} conflitos de hash\n")
+    return added, changed - added, conflicts
+
+def merge_shards(db_path, shard_dbs, log):
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_schema(conn, log)
+        ensure_merge_tables(conn)
+        conn.execute('PRAGMA journal_mode=WAL').fetchone()
+        totals = [0, 0, 0]
+        for shard_db in shard_dbs:
+            if not os.path.isfile(shard_db):
+                log(f"Shard não encontrado: {shard_db}\n")
+                continue
+            if os.path.abspath(shard_db) == os.path.abspath(db_path):
+                log(f"Ignorando {shard_db}: é o próprio catálogo central\n")
+                continue
+            try:
+                counts = merge_shard(conn, shard_db, log)
+            except sqlite3.DatabaseError as e:
+                log(f"Ignorando {shard_db}: {e}\n")
+                continue
+            for i, value in enumerate(counts):
+                totals[i] += value
+    finally:
+        conn.close()
+    log(f"Merge concluído em {db_path}: {totals[0]} novos, {totals[1]} atualizados, {totals[2]} conflitos de hash\n")
+    return totals
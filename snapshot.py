@@ -0,0 +1,134 @@
+import json
+import os
+import sqlite3
+import threading
+
+from catalog_index import path_range
+
+# Diretório cujo mtime cai nesta janela antes da listagem pode ter mudado durante ela sem alterar o
+# mtime (resolução grosseira em FAT, SMB e NFS); ele é listado de novo no próximo scan
+RACY_NS = 2 * 10 ** 9
+
+def scan_profile(hasher, metadata):
+    # O que um scan grava para os arquivos de um diretório listado: algoritmo e layout do hash e se
+    # coleta metadados (a etapa 2 sozinha só calcula o hash)
+    return hasher.algorithm, hasher.layout, int(bool(metadata))
+
+def ensure_snapshot_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS dir_snapshots (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL,
+            inode INTEGER,
+            device INTEGER,
+            entries INTEGER NOT NULL,
+            listed_ns INTEGER NOT NULL,
+            subdirs TEXT NOT NULL,
+            hash_algo TEXT,
+            hash_layout TEXT,
+            metadata INTEGER
+        ) WITHOUT ROWID
+    ''')
+    # Snapshots gravados antes do perfil do scan: sem perfil, nenhum diretório é podado até ser listado de novo
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(dir_snapshots)')}
+    for column, kind in [('hash_algo', 'TEXT'), ('hash_layout', 'TEXT'), ('metadata', 'INTEGER')]:
+        if column not in columns:
+            conn.execute(f'ALTER TABLE dir_snapshots ADD COLUMN {column} {kind}')
+    conn.commit()
+
+class DirSnapshot:
+    # mtime, inode e número de entradas de cada diretório na última listagem, e os nomes dos subdiretórios.
+    # Criar, apagar ou renomear uma entrada muda o mtime do diretório; um diretório com o mesmo stat não
+    # precisa ser listado e seus subdiretórios saem do snapshot. Arquivos reescritos no lugar não mudam o
+    # mtime do diretório e passam despercebidos: por isso a poda só vale com --prune.
+    # Só entram no snapshot diretórios listados por um scan que gravou o que este scan pede (ver
+    # load_snapshot); os demais são listados e os arquivos sem o hash ou os metadados pedidos, processados
+    def __init__(self, entries=None, profile=None):
+        self.entries = entries or {}
+        self.profile = profile or (None, None, None)
+        self.updates = {}
+        self.pruned = 0
+        self.pruned_entries = 0
+        self.lock = threading.Lock()
+
+    def unchanged(self, path, stats):
+        # Subdiretórios de path se ele não mudou desde a última listagem, senão None
+        old = self.entries.get(path)
+        if old is None:
+            return None
+        mtime_ns, inode, device, entries, listed_ns, subdirs = old
+        if (stats.st_mtime_ns != mtime_ns or stats.st_ino != inode or stats.st_dev != device
+                or mtime_ns >= listed_ns - RACY_NS):
+            return None
+        with self.lock:
+            self.pruned += 1
+            self.pruned_entries += entries
+        return [os.path.join(path, name) for name in subdirs]
+
+    def record(self, path, stats, entries, subdirs, listed_ns):
+        names = [os.path.basename(subdir) for subdir in subdirs]
+        with self.lock:
+            self.updates[path] = (stats.st_mtime_ns, stats.st_ino, stats.st_dev, entries, listed_ns, names)
+
+    def commit(self, exclude=()):
+        # Aplica as listagens novas, menos as dos diretórios em exclude (arquivos com falha ou ainda sendo
+        # gravados, que precisam ser vistos de novo). Devolve as linhas gravadas e os subdiretórios que sumiram
+        exclude = {os.path.normpath(path) for path in exclude}
+        with self.lock:
+            updates, self.updates = self.updates, {}
+        rows = []
+        removed = []
+        for path, snapshot in updates.items():
+            if os.path.normpath(path) in exclude:
+                continue
+            old = self.entries.get(path)
+            if old:
+                removed.extend(os.path.join(path, name) for name in set(old[5]) - set(snapshot[5]))
+            self.entries[path] = snapshot
+            rows.append((path,) + snapshot[:5] + (json.dumps(snapshot[5]),) + self.profile)
+        for path in removed:
+            self._forget(path)
+        return rows, removed
+
+    def _forget(self, path):
+        old = self.entries.pop(path, None)
+        if old:
+            for name in old[5]:
+                self._forget(os.path.join(path, name))
+
+    def save(self, db_path, exclude=()):
+        rows, removed = self.commit(exclude)
+        conn = sqlite3.connect(db_path)
+        try:
+            ensure_snapshot_table(conn)
+            with conn:
+                for path in removed:
+                    low, high = path_range(path)
+                    conn.execute('DELETE FROM dir_snapshots WHERE path = ? OR (path >= ? AND path < ?)',
+                                 (path, low, high))
+                conn.executemany('INSERT OR REPLACE INTO dir_snapshots (path, mtime_ns, inode, device, entries, '
+                                 'listed_ns, subdirs, hash_algo, hash_layout, metadata) '
+                                 'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        finally:
+            conn.close()
+        return len(rows)
+
+    def report(self, log):
+        log(f"Diretórios inalterados: {self.pruned} não listados ({self.pruned_entries} entradas)\n")
+
+def load_snapshot(db_path, root, profile):
+    # Um diretório listado com outro algoritmo ou layout de hash, ou sem metadados quando este scan os
+    # coleta, fica de fora: com o mesmo stat ele ainda precisa ser listado
+    hash_algo, hash_layout, metadata = profile
+    entries = {}
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_snapshot_table(conn)
+        c = conn.execute('SELECT path, mtime_ns, inode, device, entries, listed_ns, subdirs FROM dir_snapshots '
+                         'WHERE (path = ? OR (path >= ? AND path < ?)) AND hash_algo = ? AND hash_layout = ? '
+                         'AND metadata >= ?', (root,) + path_range(root) + (hash_algo, hash_layout, metadata))
+        for path, mtime_ns, inode, device, count, listed_ns, subdirs in c:
+            entries[path] = (mtime_ns, inode, device, count, listed_ns, json.loads(subdirs))
+    finally:
+        conn.close()
+    return DirSnapshot(entries, profile)
@@ -6,6 +6,11 @@ import os
 import subprocess
 import sys
 
+from virtual_table import VirtualTable
+from catalog_query import CatalogQuery, QueryRunner, ensure_search_index, ensure_stats_summary, summary_stats
+from columnar import ColumnarCatalog, ColumnarQuery
+from schema import ensure_schema
+
 # Caminho do banco de dados e main.py
 db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'video_data.db')
 main_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
@@ -25,44 +30,30 @@ def open_file(filepath):
     except Exception as e:
         messagebox.showerror("Erro", f"Não foi possível abrir o arquivo:\n{filepath}\n\nErro: {e}")
 
-def load_data_from_db():
+def open_catalog():
     try:
         conn = sqlite3.connect(db_path, check_same_thread=False)
-        c = conn.cursor()
-        c.execute('SELECT file_id, name, extension, file_path, size_bytes, modified_at, hash, duration_seconds, resolution, fps, video_codec, bitrate_total_kbps FROM files')
-        columns = [desc[0] for desc in c.description]
-        data = [dict(zip(columns, row)) for row in c.fetchall()]
-        conn.close()
-        
-        for item in data:
-            item['size_mb'] = round(item['size_bytes'] / (1024 ** 2), 2) if item['size_bytes'] else 0
-            item['modified_at'] = item['modified_at'][:19] if item['modified_at'] else ''
-            item['duration_seconds'] = round(item['duration_seconds'], 2) if item['duration_seconds'] else 0
-            item['fps'] = round(item['fps'], 2) if item['fps'] else 0
-            item['bitrate_total_kbps'] = item['bitrate_total_kbps'] if item['bitrate_total_kbps'] else 0
-            item['hash'] = item['hash'] or ''  # Evita None
-            item['resolution'] = item['resolution'] or ''
-            item['video_codec'] = item['video_codec'] or ''
-        return data
+        # Catálogos gravados por versões antigas são migrados antes das consultas
+        ensure_schema(conn)
+        fts = ensure_search_index(conn)
+        ensure_stats_summary(conn)
+        return conn, fts
     except Exception as e:
         messagebox.showerror("Erro", f"Falha ao carregar dados do banco:\n{e}")
-        return []
+        return None, False
 
-def get_common_stats(data):
-    size_list = [item['size_bytes'] for item in data if item['size_bytes']]
-    durations = [item['duration_seconds'] for item in data if item['duration_seconds']]
-    
-    total_seconds = sum(durations)
+def get_common_stats(stats):
+    total_seconds = stats['total_duration']
     days = int(total_seconds // (24 * 3600))
     hours = int((total_seconds % (24 * 3600)) // 3600)
     minutes = int((total_seconds % 3600) // 60)
     total_time = f"{days} dias, {hours} horas, {minutes} minutos"
     
     return {
-        'Total de arquivos': len(data),
-        'Tamanho total (MB)': round(sum(size_list) / (1024**2), 2) if size_list else 0,
-        'Tamanho médio (MB)': round(sum(size_list) / len(size_list) / (1024**2), 2) if size_list else 0,
-        'Duração média (s)': round(sum(durations) / len(durations), 2) if durations else 0,
+        'Total de arquivos': stats['count'],
+        'Tamanho total (MB)': round(stats['total_size'] / (1024**2), 2),
+        'Tamanho médio (MB)': round(stats['avg_size'] / (1024**2), 2),
+        'Duração média (s)': round(stats['avg_duration'], 2),
         'Tempo total': total_time
     }
 
@@ -91,43 +82,57 @@ def create_filter_row(frame, display_columns, filters):
         entry.bind("<FocusIn>", on_focus_in)
         entry.bind("<FocusOut>", on_focus_out)
 
-def get_filtered_data(tree, original_data, columns, display_columns, filters):
-    column_map = {dc: c for dc, c in zip(display_columns, columns)}
-    filtered_data = []
-    for item in original_data:
-        match = True
-        for display_col in display_columns:
-            col = column_map[display_col]
-            val = str(item.get(col, '')).lower()
-            search = filters[display_col].get().lower()
-            if search and search != display_col.lower() and search not in val:
-                match = False
-                break
-        if match:
-            filtered_data.append(item)
-    return filtered_data
-
-def apply_filters(tree, original_data, columns, display_columns, filters, filtered_stats_label):
-    tree.delete(*tree.get_children())
-    filtered_data = get_filtered_data(tree, original_data, columns, display_columns, filters)
-    
-    filtered_stats = get_common_stats(filtered_data)
-    filtered_stats_text = "\n".join(f"{k}: {v}" for k, v in filtered_stats.items())
-    filtered_stats_label.config(text=filtered_stats_text)
-    
-    for item in filtered_data:
-        tree.insert("", "end", values=[item.get(col, '') for col in columns])
+def get_filter_values(columns, display_columns, filters):
+    values = {}
+    for col, display_col in zip(columns, display_columns):
+        search = filters[display_col].get()
+        if search and search != display_col:
+            values[col] = search
+    return values
 
-def export_playlist(tree, columns):
-    selected_items = tree.selection()
-    if not selected_items:
+def show_breakdown(tree, breakdown):
+    tree.delete(*tree.get_children())
+    titles = {'video_codec': 'Codec', 'resolution': 'Resolução', 'extension': 'Extensão'}
+    for column, rows in breakdown.items():
+        parent = tree.insert("", "end", text=titles[column], open=False)
+        for value, count, total_size, total_duration in rows:
+            tree.insert(parent, "end", text=value or '(vazio)', values=[
+                count, round(total_size / (1024 ** 2), 2), round(total_duration / 3600, 1)
+            ])
+
+def watch_query(table, conn, runner, generation, filtered_stats_label, breakdown_tree):
+    # A consulta roda na thread do runner; aqui só se acompanham os resultados sem travar o Tk
+    if runner.generation != generation:
+        return
+    results, busy = runner.poll()
+    for step, query, value in results:
+        if isinstance(value, Exception):
+            filtered_stats_label.config(text=f"Filtro inválido: {value}")
+            return
+        if step == 'stats':
+            filtered_stats = get_common_stats(value)
+            filtered_stats_label.config(text="\n".join(f"{k}: {v}" for k, v in filtered_stats.items()))
+            # Só a janela visível vai para o Treeview; as demais páginas são lidas do SQLite ao rolar
+            table.set_source(query.source(conn, value['count']))
+        elif step == 'breakdown':
+            show_breakdown(breakdown_tree, value)
+        elif table.source is not None and table.source.query is query:
+            table.source.ordered_ids = value
+            table.refresh()
+    if busy:
+        table.frame.after(20, lambda: watch_query(table, conn, runner, generation, filtered_stats_label, breakdown_tree))
+
+def apply_filters(table, conn, runner, query, filtered_stats_label, breakdown_tree):
+    watch_query(table, conn, runner, runner.submit(query), filtered_stats_label, breakdown_tree)
+
+def export_playlist(table):
+    selected_rows = table.selected_rows()
+    if not selected_rows:
         messagebox.showwarning("Seleção vazia", "Selecione pelo menos um arquivo na tabela.")
         return
     
     paths = []
-    for item_id in selected_items:
-        values = tree.item(item_id)["values"]
-        row_dict = dict(zip(columns, values))
+    for row_dict in selected_rows:
         path = os.path.normpath(row_dict.get("file_path", ""))
         if os.path.exists(path):
             paths.append(path)
@@ -144,56 +149,132 @@ def export_playlist(tree, columns):
                 f.write(f"{path}\n")
         messagebox.showinfo("Playlist salva", f"Playlist exportada para:\n{filepath}")
 
-def sort_column(tree, col, reverse, columns):
-    data = [(tree.set(k, col), k) for k in tree.get_children('')]
-    col_index = columns.index(col)
-    if col_index in [3, 4, 7, 8, 9]:  # size_mb, duration_seconds, fps, bitrate_total_kbps
-        try:
-            data.sort(key=lambda t: float(t[0] or 0), reverse=reverse)
-        except ValueError:
-            data.sort(key=lambda t: t[0].lower(), reverse=reverse)
+def sort_column(table, display_col, add, sort_keys, columns, display_columns, on_change):
+    # Clique: ordena só por esta coluna (ou inverte, se já é a principal). Shift+clique: acrescenta
+    # ou inverte a coluna como chave secundária
+    col = columns[display_columns.index(display_col)]
+    positions = [key[0] for key in sort_keys]
+    if add:
+        if col in positions:
+            sort_keys[positions.index(col)][1] = not sort_keys[positions.index(col)][1]
+        else:
+            sort_keys.append([col, False])
+    elif positions == [col]:
+        sort_keys[0][1] = not sort_keys[0][1]
     else:
-        data.sort(key=lambda t: t[0].lower(), reverse=reverse)
-    
-    for index, (_, k) in enumerate(data):
-        tree.move(k, '', index)
-    tree.heading(col, command=lambda: sort_column(tree, col, not reverse, columns))
+        sort_keys[:] = [[col, False]]
+    table.set_sort_indicators([(display_columns[columns.index(c)], reverse) for c, reverse in sort_keys])
+
+    on_change()
 
-def adjust_column_widths(tree, columns, data):
+def resort_results(table, conn, runner, filtered_stats_label, breakdown_tree, sort_keys, refresh):
+    if table.source is None or table.source.query is not runner.query:
+        # Ainda há um filtro novo em andamento: refaz tudo já com a nova ordem
+        refresh()
+        return
+    # O filtro não mudou: reaproveita a contagem e só relê a janela visível na nova ordem;
+    # a lista ordenada completa é montada em segundo plano
+    query = table.source.query.sorted([tuple(key) for key in sort_keys])
+    table.set_source(query.source(conn, table.source.count()), keep_offset=True)
+    watch_query(table, conn, runner, runner.submit(query, want_stats=False), filtered_stats_label, breakdown_tree)
+
+def adjust_column_widths(tree, display_columns, rows):
+    # Mede só as linhas visíveis; medir o catálogo inteiro custa mais que desenhar a tabela
     font = tkfont.nametofont("TkDefaultFont")
     max_widths = {}
     min_width = 50
     max_width = 300
     
-    for col in columns:
+    for col in display_columns:
         title_width = font.measure(col) // 8
         max_widths[col] = title_width
     
-    for item in data:
-        for col in columns:
-            val = str(item.get(col, ''))
-            width = font.measure(val) // 8
+    for row in rows:
+        for col, val in zip(display_columns, row):
+            width = font.measure(str(val)) // 8
             max_widths[col] = max(max_widths[col], width)
     
-    for col in columns:
+    for col in display_columns:
         width = max(min_width, min(max_width, max_widths[col] + 10))
         tree.column(col, width=width, stretch=False)
 
-def refresh_db(tree, columns, display_columns, filters, filtered_stats_label, stat_frame):
-    data = load_data_from_db()
-    if not data:
-        return data
-    
-    stats = get_common_stats(data)
+def show_general_stats(conn, stat_frame, catalog=None):
+    # Lido do resumo mantido por triggers (ou dos totais do catálogo em memória): não depende do tamanho do catálogo
+    stats = catalog.totals if catalog else summary_stats(conn)
     for widget in stat_frame.winfo_children():
         widget.destroy()
-    for k, v in stats.items():
+    for k, v in get_common_stats(stats).items():
         label = ttk.Label(stat_frame, text=f"{k}: {v}")
         label.pack(anchor="w")
-    
-    apply_filters(tree, data, columns, display_columns, filters, filtered_stats_label)
-    adjust_column_widths(tree, display_columns, data)
-    return data
+    return stats
+
+def load_duplicate_groups():
+    try:
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        c = conn.cursor()
+        c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='duplicate_groups'")
+        if not c.fetchone():
+            conn.close()
+            return []
+        c.execute('''
+            SELECT g.group_id, g.size_bytes, g.full_hash, g.file_count, g.wasted_bytes, m.file_path
+            FROM duplicate_groups g JOIN duplicate_members m ON m.group_id = g.group_id
+            ORDER BY g.wasted_bytes DESC, g.group_id, m.file_path
+        ''')
+        groups = {}
+        for group_id, size_bytes, full_hash, file_count, wasted_bytes, file_path in c.fetchall():
+            group = groups.setdefault(group_id, {'size_bytes': size_bytes, 'full_hash': full_hash,
+                                                 'file_count': file_count, 'wasted_bytes': wasted_bytes, 'paths': []})
+            group['paths'].append(file_path)
+        conn.close()
+        return list(groups.values())
+    except Exception as e:
+        messagebox.showerror("Erro", f"Falha ao carregar duplicados do banco:\n{e}")
+        return []
+
+def show_duplicates(root):
+    groups = load_duplicate_groups()
+    if not groups:
+        messagebox.showinfo("Duplicados", "Nenhum grupo de duplicados encontrado.\nExecute 'cli.py dedup' para procurar.")
+        return
+
+    window = tk.Toplevel(root)
+    window.title("Duplicados")
+    window.geometry("900x500")
+
+    wasted = sum(group['wasted_bytes'] for group in groups)
+    ttk.Label(window, text=f"{len(groups)} grupos, {round(wasted / (1024 ** 2), 2)} MB redundantes").pack(anchor="w", padx=10, pady=5)
+
+    tree_frame = ttk.Frame(window)
+    tree_frame.pack(fill="both", expand=True, padx=10, pady=5)
+    tree = ttk.Treeview(tree_frame, columns=['Arquivos', 'Tamanho (MB)', 'Redundante (MB)'], show="tree headings")
+    tree.heading("#0", text="Hash / Caminho")
+    tree.column("#0", width=520)
+    for col in ['Arquivos', 'Tamanho (MB)', 'Redundante (MB)']:
+        tree.heading(col, text=col)
+        tree.column(col, width=110, stretch=False)
+    vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview)
+    tree.configure(yscroll=vsb.set)
+    tree.grid(row=0, column=0, sticky="nsew")
+    vsb.grid(row=0, column=1, sticky="ns")
+    tree_frame.grid_rowconfigure(0, weight=1)
+    tree_frame.grid_columnconfigure(0, weight=1)
+
+    for group in groups:
+        parent = tree.insert("", "end", text=group['full_hash'], open=False, values=[
+            group['file_count'],
+            round(group['size_bytes'] / (1024 ** 2), 2),
+            round(group['wasted_bytes'] / (1024 ** 2), 2)
+        ])
+        for path in group['paths']:
+            tree.insert(parent, "end", text=path, values=['', '', ''])
+
+    def on_double_click(event):
+        item_id = tree.focus()
+        if item_id and tree.parent(item_id):
+            open_file(tree.item(item_id)["text"])
+
+    tree.bind("<Double-1>", on_double_click)
 
 def run_hashculator():
     try:
@@ -204,18 +285,18 @@ def run_hashculator():
     except Exception as e:
         messagebox.showerror("Erro", f"Falha ao executar Hashculator:\n{e}")
 
-def run_visualization():
+def run_visualization(memory=False):
     root = tk.Tk()
     root.title("Hashculator Viewer")
     root.geometry("1000x600")
     root.resizable(True, True)
 
-    data = load_data_from_db()
-    if not data:
+    conn, fts = open_catalog()
+    if conn is None:
         root.destroy()
         return
-
-    stats = get_common_stats(data)
+    # Modo em memória: catálogo colunar carregado uma vez; filtros e ordenação não voltam ao SQLite
+    state = {'catalog': ColumnarCatalog.load(db_path) if memory else None}
 
     style = ttk.Style()
     style.configure("Custom.Vertical.TScrollbar", width=16)
@@ -226,17 +307,26 @@ def run_visualization():
 
     stat_frame = ttk.LabelFrame(stats_container, text="Estatísticas Gerais")
     stat_frame.grid(row=0, column=0, sticky="n", padx=5)
-    for k, v in stats.items():
-        label = ttk.Label(stat_frame, text=f"{k}: {v}")
-        label.pack(anchor="w")
+    show_general_stats(conn, stat_frame, state['catalog'])
 
     filtered_stat_frame = ttk.LabelFrame(stats_container, text="Estatísticas de Filtragem")
     filtered_stat_frame.grid(row=0, column=1, sticky="n", padx=5)
     filtered_stats_label = ttk.Label(filtered_stat_frame, text="Nenhum filtro aplicado")
     filtered_stats_label.pack(anchor="w")
 
+    breakdown_frame = ttk.LabelFrame(stats_container, text="Detalhamento")
+    breakdown_frame.grid(row=0, column=2, sticky="nsew", padx=5)
+    breakdown_tree = ttk.Treeview(breakdown_frame, columns=['Arquivos', 'Tamanho (MB)', 'Duração (h)'], show="tree headings", height=5)
+    breakdown_tree.heading("#0", text="Valor")
+    breakdown_tree.column("#0", width=140)
+    for col in ['Arquivos', 'Tamanho (MB)', 'Duração (h)']:
+        breakdown_tree.heading(col, text=col)
+        breakdown_tree.column(col, width=90, stretch=False)
+    breakdown_tree.pack(fill="both", expand=True)
+
     stats_container.grid_columnconfigure(0, weight=1)
     stats_container.grid_columnconfigure(1, weight=1)
+    stats_container.grid_columnconfigure(2, weight=1)
 
     table_frame = ttk.Frame(root)
     table_frame.pack(fill="both", expand=True, padx=10, pady=5)
@@ -255,59 +345,74 @@ def run_visualization():
     filter_frame.pack(fill="x")
     create_filter_row(filter_frame, display_columns, filters)
 
-    tree_frame = ttk.Frame(table_frame)
-    tree_frame.pack(fill="both", expand=True)
+    sort_keys = []
+    runner = QueryRunner(db_path)
+    table = VirtualTable(table_frame, columns, display_columns,
+                         on_sort=lambda c, add: sort_column(table, c, add, sort_keys, columns, display_columns, resort))
+    table.pack(fill="both", expand=True)
+    tree = table.tree
+
+    def refresh_results():
+        filter_values = get_filter_values(columns, display_columns, filters)
+        keys = [tuple(key) for key in sort_keys]
+        if state['catalog']:
+            query = ColumnarQuery(state['catalog'], filter_values, keys)
+        else:
+            query = CatalogQuery(filter_values, keys, fts)
+        apply_filters(table, conn, runner, query, filtered_stats_label, breakdown_tree)
 
-    tree = ttk.Treeview(tree_frame, columns=display_columns, show="headings")
-    for col, display_col in zip(columns, display_columns):
-        tree.heading(display_col, text=display_col, command=lambda c=display_col: sort_column(tree, c, False, display_columns))
-        tree.column(display_col, width=120, stretch=False)
+    def resort():
+        resort_results(table, conn, runner, filtered_stats_label, breakdown_tree, sort_keys, refresh_results)
 
-    vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview, style="Custom.Vertical.TScrollbar")
-    hsb = ttk.Scrollbar(tree_frame, orient="horizontal", command=tree.xview, style="Custom.Horizontal.TScrollbar")
-    tree.configure(yscroll=vsb.set, xscroll=hsb.set)
-
-    tree.grid(row=0, column=0, sticky="nsew")
-    vsb.grid(row=0, column=1, sticky="ns")
-    hsb.grid(row=1, column=0, sticky="ew")
-    tree_frame.grid_rowconfigure(0, weight=1)
-    tree_frame.grid_columnconfigure(0, weight=1)
+    # Debounce: a consulta só sai quando a digitação para por um instante
+    pending = {'after': None}
 
     def on_filter_change(event):
-        apply_filters(tree, data, columns, display_columns, filters, filtered_stats_label)
-        adjust_column_widths(tree, display_columns, get_filtered_data(tree, data, columns, display_columns, filters))
+        if pending['after']:
+            root.after_cancel(pending['after'])
+        pending['after'] = root.after(250, refresh_results)
 
     for entry in filters.values():
         entry.bind("<KeyRelease>", on_filter_change)
 
-    apply_filters(tree, data, columns, display_columns, filters, filtered_stats_label)
-    adjust_column_widths(tree, display_columns, data)
+    refresh_results()
+    root.after(500, lambda: adjust_column_widths(tree, display_columns, table.visible_rows()))
 
     def on_double_click(event):
-        item_id = tree.focus()
-        if not item_id:
+        row_dict = table.focused_row()
+        if not row_dict:
             return
-        values = tree.item(item_id)["values"]
-        row_dict = dict(zip(columns, values))
         path = row_dict.get("file_path")
         if path:
             open_file(path)
 
     tree.bind("<Double-1>", on_double_click)
 
+    def on_refresh():
+        if state['catalog']:
+            # O catálogo em memória é uma cópia do início: relê o DB para ver o que mudou desde então
+            state['catalog'] = ColumnarCatalog.load(db_path)
+        show_general_stats(conn, stat_frame, state['catalog'])
+        refresh_results()
+
     button_frame = ttk.Frame(root)
     button_frame.pack(fill="x", padx=10, pady=5)
 
-    refresh_button = ttk.Button(button_frame, text="Atualizar DB", command=lambda: globals().update({'data': refresh_db(tree, columns, display_columns, filters, filtered_stats_label, stat_frame)}))
+    refresh_button = ttk.Button(button_frame, text="Atualizar DB", command=on_refresh)
     refresh_button.pack(side="left", padx=5)
 
     hashculator_button = ttk.Button(button_frame, text="Hashculator", command=run_hashculator)
     hashculator_button.pack(side="left", padx=5)
 
-    export_button = ttk.Button(button_frame, text="Exportar Playlist (M3U)", command=lambda: export_playlist(tree, columns))
+    export_button = ttk.Button(button_frame, text="Exportar Playlist (M3U)", command=lambda: export_playlist(table))
     export_button.pack(side="left", padx=5)
 
+    duplicates_button = ttk.Button(button_frame, text="Duplicados", command=lambda: show_duplicates(root))
+    duplicates_button.pack(side="left", padx=5)
+
     root.mainloop()
+    runner.close()
+    conn.close()
 
 if __name__ == "__main__":
-    run_visualization()
\ No newline at end of file
+    run_visualization(memory="--memory" in sys.argv[1:])
\ No newline at end of file
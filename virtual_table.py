@@ -0,0 +1,170 @@
+from tkinter import ttk
+import tkinter.font as tkfont
+
+class VirtualTable:
+    # Treeview que só mantém as linhas visíveis (mais uma margem em cache); o resto fica na fonte
+    def __init__(self, parent, columns, display_columns, on_sort=None, overscan=100):
+        self.columns = columns
+        self.display_columns = display_columns
+        self.overscan = overscan
+        self.source = None
+        self.total = 0
+        self.offset = 0
+        self.visible = 20
+        self.cache_start = 0
+        self.cache = []
+        self.selected = set()
+
+        self.frame = ttk.Frame(parent)
+        self.tree = ttk.Treeview(self.frame, columns=display_columns, show="headings", selectmode="extended")
+        self.on_sort = on_sort
+        for display_col in display_columns:
+            command = (lambda c=display_col: on_sort(c, False)) if on_sort else None
+            self.tree.heading(display_col, text=display_col, command=command)
+            self.tree.column(display_col, width=120, stretch=False)
+
+        self.vsb = ttk.Scrollbar(self.frame, orient="vertical", command=self.on_scrollbar, style="Custom.Vertical.TScrollbar")
+        self.hsb = ttk.Scrollbar(self.frame, orient="horizontal", command=self.tree.xview, style="Custom.Horizontal.TScrollbar")
+        self.tree.configure(xscroll=self.hsb.set)
+
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.vsb.grid(row=0, column=1, sticky="ns")
+        self.hsb.grid(row=1, column=0, sticky="ew")
+        self.frame.grid_rowconfigure(0, weight=1)
+        self.frame.grid_columnconfigure(0, weight=1)
+
+        style = ttk.Style()
+        self.row_height = int(style.lookup("Treeview", "rowheight") or 0) or tkfont.nametofont("TkDefaultFont").metrics("linespace") + 4
+
+        self.tree.bind("<Configure>", self.on_configure)
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll(-1 * (e.delta // 120 or (1 if e.delta > 0 else -1)) * 3))
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(3))
+        self.tree.bind("<Prior>", lambda e: self.scroll(-self.visible) or "break")
+        self.tree.bind("<Next>", lambda e: self.scroll(self.visible) or "break")
+        self.tree.bind("<Up>", self.on_key_up)
+        self.tree.bind("<Down>", self.on_key_down)
+        self.tree.bind("<<TreeviewSelect>>", self.on_select)
+        # Shift+clique no cabeçalho acrescenta uma chave secundária de ordenação
+        self.tree.bind("<Shift-Button-1>", self.on_shift_click)
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def set_source(self, source, keep_offset=False):
+        self.source = source
+        self.total = source.count() if source else 0
+        self.cache = []
+        self.selected.clear()
+        if not keep_offset:
+            self.offset = 0
+        self.render()
+
+    def refresh(self):
+        # Mesma fonte, conteúdo ou ordem diferente: descarta o cache e redesenha a janela atual
+        self.cache = []
+        self.render()
+
+    def row(self, index):
+        if self.cache_start <= index < self.cache_start + len(self.cache):
+            return self.cache[index - self.cache_start]
+        rows = self.source.rows(index, index + 1) if self.source else []
+        return rows[0] if rows else None
+
+    def row_dict(self, index):
+        row = self.row(index)
+        return dict(zip(self.columns, row)) if row else None
+
+    def selected_rows(self):
+        return [self.row_dict(index) for index in sorted(self.selected)]
+
+    def focused_row(self):
+        item_id = self.tree.focus()
+        if not item_id:
+            return None
+        return self.row_dict(self.offset + self.tree.index(item_id))
+
+    def visible_rows(self):
+        return self._window()
+
+    def _window(self):
+        stop = min(self.total, self.offset + self.visible)
+        if self.offset < self.cache_start or stop > self.cache_start + len(self.cache):
+            # Busca uma página com margem dos dois lados para que rolagens curtas não consultem a fonte
+            self.cache_start = max(0, self.offset - self.overscan)
+            self.cache = self.source.rows(self.cache_start, stop + self.overscan) if self.source else []
+        return self.cache[self.offset - self.cache_start:stop - self.cache_start]
+
+    def render(self):
+        self.offset = max(0, min(self.offset, self.total - self.visible))
+        rows = self._window()
+        items = list(self.tree.get_children())
+        # Os itens do Treeview são reaproveitados; só os valores mudam ao rolar
+        while len(items) < len(rows):
+            items.append(self.tree.insert("", "end"))
+        if len(items) > len(rows):
+            self.tree.delete(*items[len(rows):])
+            items = items[:len(rows)]
+        for item_id, row in zip(items, rows):
+            self.tree.item(item_id, values=row)
+        self.tree.selection_set([item_id for i, item_id in enumerate(items) if self.offset + i in self.selected])
+        if self.total:
+            self.vsb.set(self.offset / self.total, (self.offset + len(rows)) / self.total)
+        else:
+            self.vsb.set(0, 1)
+
+    def set_sort_indicators(self, sort_keys):
+        # sort_keys: [(display_col, decrescente)]; com mais de uma chave, mostra a posição de cada uma
+        marks = {}
+        for position, (display_col, reverse) in enumerate(sort_keys, 1):
+            arrow = "▼" if reverse else "▲"
+            marks[display_col] = f" {arrow}{position}" if len(sort_keys) > 1 else f" {arrow}"
+        for display_col in self.display_columns:
+            self.tree.heading(display_col, text=display_col + marks.get(display_col, ""))
+
+    def on_shift_click(self, event):
+        if not self.on_sort or self.tree.identify_region(event.x, event.y) != "heading":
+            return
+        column = self.tree.identify_column(event.x)
+        index = int(column.lstrip("#")) - 1
+        if 0 <= index < len(self.display_columns):
+            self.on_sort(self.display_columns[index], True)
+        return "break"
+
+    def scroll(self, delta):
+        self.offset += delta
+        self.render()
+
+    def on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            self.offset = int(float(args[1]) * self.total)
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            self.offset += amount * self.visible if args[2] == "pages" else amount
+        self.render()
+
+    def on_configure(self, event):
+        header = self.row_height + 4
+        visible = max(1, (event.height - header) // self.row_height)
+        if visible != self.visible:
+            self.visible = visible
+            self.render()
+
+    def on_select(self, event):
+        for i, item_id in enumerate(self.tree.get_children()):
+            if item_id in self.tree.selection():
+                self.selected.add(self.offset + i)
+            else:
+                self.selected.discard(self.offset + i)
+
+    def on_key_up(self, event):
+        items = self.tree.get_children()
+        if items and self.tree.focus() == items[0] and self.offset > 0:
+            self.scroll(-1)
+            return "break"
+
+    def on_key_down(self, event):
+        items = self.tree.get_children()
+        if items and self.tree.focus() == items[-1] and self.offset + len(items) < self.total:
+            self.scroll(1)
+            return "break"
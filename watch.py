@@ -0,0 +1,198 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from pipeline import scan_video_files
+from snapshot import load_snapshot
+
+MODES = ['auto', 'inotify', 'poll']
+
+# Constantes de <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct('iIII')
+
+class PollingWatcher:
+    # Repete a caminhada a cada interval segundos e entrega os arquivos com tamanho ou mtime novos. Com
+    # prune, a caminhada é podada pelo snapshot e só diretórios alterados são listados. Um arquivo
+    # modificado há menos de settle segundos ainda pode estar sendo copiado; o diretório dele fica fora
+    # do snapshot e é listado de novo na próxima volta
+    def __init__(self, root, is_video, log, db_path, profile, interval=30.0, settle=None, prune=False):
+        self.root = root
+        self.profile = profile
+        self.prune = prune
+        self.is_video = is_video
+        self.log = log
+        self.db_path = db_path
+        self.interval = interval
+        self.settle = interval if settle is None else settle
+        self.seen = {}
+        # Arquivos entregues na volta atual que o pipeline ainda não gravou, e diretórios com falhas
+        self.pending = set()
+        self.failed_dirs = set()
+        self.cond = threading.Condition()
+        self._stop = threading.Event()
+
+    def start(self):
+        pass
+
+    def close(self):
+        self._stop.set()
+
+    def processed(self, events):
+        # Chamado pelo DBWriter depois do commit. Um arquivo com falha sai de seen para ser tentado de
+        # novo na próxima volta, e o diretório dele não entra no snapshot
+        with self.cond:
+            for _, path, failed in events:
+                self.pending.discard(path)
+                if failed:
+                    self.seen.pop(path, None)
+                    self.failed_dirs.add(os.path.dirname(path))
+            self.cond.notify_all()
+
+    def _wait_pending(self):
+        with self.cond:
+            while self.pending and not self._stop.is_set():
+                self.cond.wait(1.0)
+            failed_dirs, self.failed_dirs = self.failed_dirs, set()
+        return failed_dirs
+
+    def changes(self):
+        snapshot = load_snapshot(self.db_path, self.root, self.profile) if self.prune else None
+        while not self._stop.wait(self.interval):
+            unsettled = set()
+            young = time.time_ns() - int(self.settle * 1e9)
+            for path, device in scan_video_files(self.root, self.is_video, self.log, snapshot=snapshot):
+                try:
+                    stats = os.stat(path)
+                except OSError:
+                    continue
+                if stats.st_mtime_ns > young:
+                    unsettled.add(os.path.dirname(path))
+                    continue
+                key = (stats.st_size, stats.st_mtime_ns)
+                if self.seen.get(path) != key:
+                    with self.cond:
+                        self.seen[path] = key
+                        self.pending.add(path)
+                    yield path
+            # O snapshot só é gravado depois que o pipeline gravou tudo o que esta volta entregou
+            failed_dirs = self._wait_pending()
+            if snapshot and not self._stop.is_set():
+                snapshot.save(self.db_path, unsettled | failed_dirs)
+
+class InotifyWatcher:
+    # Um watch por diretório (limite em /proc/sys/fs/inotify/max_user_watches). Arquivos entram no
+    # pipeline ao serem fechados depois de escritos ou movidos para dentro da árvore, nunca no meio de
+    # uma cópia; um diretório novo ganha watches e os vídeos que já tiver são entregues
+    def __init__(self, root, is_video, log):
+        self.root = root
+        self.is_video = is_video
+        self.log = log
+        self.fd = None
+        self.paths = {}
+        self._stop = threading.Event()
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+    def start(self):
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self._add_tree(self.root)
+        self.log(f"Observando {len(self.paths)} diretórios via inotify\n")
+
+    def close(self):
+        self._stop.set()
+
+    def processed(self, events):
+        # Sem snapshot nem volta: uma falha só é tentada de novo no próximo evento do arquivo
+        pass
+
+    def _add(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch: {os.strerror(errno)}", path)
+        self.paths[wd] = path
+
+    def _add_tree(self, root):
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            self._add(directory)
+            try:
+                with os.scandir(directory) as entries:
+                    stack.extend(entry.path for entry in entries if entry.is_dir(follow_symlinks=False))
+            except OSError as e:
+                self.log(f"Erro ao listar {directory}: {e}\n")
+
+    def _events(self, data):
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].split(b'\0', 1)[0])
+            offset += length
+            yield wd, mask, name
+
+    def changes(self):
+        try:
+            while not self._stop.is_set():
+                ready, _, _ = select.select([self.fd], [], [], 1.0)
+                if not ready:
+                    continue
+                try:
+                    data = os.read(self.fd, 65536)
+                except BlockingIOError:
+                    continue
+                for wd, mask, name in self._events(data):
+                    if mask & IN_Q_OVERFLOW:
+                        self.log("Fila do inotify transbordou: eventos perdidos; rode um scan para conferir a pasta\n")
+                        continue
+                    if mask & IN_IGNORED:
+                        self.paths.pop(wd, None)
+                        continue
+                    directory = self.paths.get(wd)
+                    if directory is None or not name:
+                        continue
+                    path = os.path.join(directory, name)
+                    if mask & IN_ISDIR:
+                        if mask & (IN_CREATE | IN_MOVED_TO):
+                            yield from self._new_tree(path)
+                    elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and self.is_video(path):
+                        yield path
+        finally:
+            os.close(self.fd)
+
+    def _new_tree(self, path):
+        try:
+            self._add_tree(path)
+        except OSError as e:
+            self.log(f"Não foi possível observar {path}: {e}\n")
+        for video, device in scan_video_files(path, self.is_video, self.log):
+            yield video
+
+def build_watcher(mode, root, is_video, log, db_path, profile, interval=30.0, prune=False):
+    # auto: inotify no Linux; sem inotify (outro sistema, limite de watches esgotado) cai no polling
+    if mode in ('auto', 'inotify') and sys.platform.startswith('linux'):
+        watcher = InotifyWatcher(root, is_video, log)
+        try:
+            watcher.start()
+            return watcher
+        except (OSError, AttributeError) as e:
+            if watcher.fd is not None and watcher.fd >= 0:
+                os.close(watcher.fd)
+            log(f"inotify indisponível ({e}); usando polling a cada {interval} s\n")
+    elif mode == 'inotify':
+        log(f"inotify só existe no Linux; usando polling a cada {interval} s\n")
+    return PollingWatcher(root, is_video, log, db_path, profile, interval, prune=prune)